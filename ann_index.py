@@ -0,0 +1,214 @@
+"""교체 가능한 근사 최근접 이웃(ANN) 인덱스
+
+같은 인터페이스(build / search / save / load) 뒤에 세 가지 인덱스를 제공합니다.
+- flat: 정확한 전수 검색 (numpy 행렬곱, 추가 의존성 없음)
+- hnsw: 그래프 기반 근사 검색 (faiss IndexHNSWFlat)
+- ivfpq: 역색인 + 곱 양자화 (faiss IndexIVFPQ, 메모리 최소)
+
+벡터는 정규화되어 있다고 가정하며 점수는 내적(=코사인 유사도)입니다.
+각 인덱스의 빌드/검색 파라미터는 DEFAULT_PARAMS에서 확인하고 생성 시 덮어쓸 수 있습니다.
+"""
+import json
+import os
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # faiss 미설치 시 flat만 사용 가능
+    faiss = None
+
+# 인덱스별 기본 파라미터 (build_*: 빌드 시, 나머지: 검색 시 사용)
+DEFAULT_PARAMS = {
+    "flat": {"block_rows": 65536},
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    "ivfpq": {"nlist": 1024, "m": 48, "nbits": 8, "nprobe": 16, "train_size": 100000},
+}
+
+
+def _require_faiss(name):
+    if faiss is None:
+        raise ImportError(f"'{name}' 인덱스에는 faiss가 필요합니다: pip install faiss-cpu")
+
+
+class VectorIndex:
+    """ANN 인덱스 공통 인터페이스"""
+
+    name = None
+
+    def __init__(self, **params):
+        unknown = set(params) - set(DEFAULT_PARAMS[self.name])
+        if unknown:
+            raise ValueError(f"{self.name}: 알 수 없는 파라미터 {sorted(unknown)}")
+        self.params = dict(DEFAULT_PARAMS[self.name], **params)
+        self.count = 0
+
+    def build(self, vectors):
+        """정규화된 float32 벡터 (n, dim)으로 인덱스를 만듭니다."""
+        raise NotImplementedError
+
+    def search(self, queries, k):
+        """질의 (q, dim)에 대해 (점수 (q, k), 위치 (q, k))를 반환합니다. 빈 자리는 위치 -1."""
+        raise NotImplementedError
+
+    def memory_bytes(self):
+        """인덱스가 차지하는 메모리(바이트) 추정치"""
+        raise NotImplementedError
+
+    def save(self, path):
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls, path, **params):
+        raise NotImplementedError
+
+
+class FlatIndex(VectorIndex):
+    """정확한 전수 검색 (기준선 / 소규모 데이터셋용)"""
+
+    name = "flat"
+
+    def build(self, vectors):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.count = len(self.vectors)
+        return self
+
+    def search(self, queries, k):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k_eff = min(k, self.count)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        if k_eff == 0:
+            return scores, positions
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_positions = np.empty((len(queries), 0), dtype=np.int64)
+        block_rows = self.params["block_rows"]
+        for start in range(0, self.count, block_rows):
+            block = self.vectors[start:start + block_rows] @ queries.T  # (block, q)
+            block_scores = np.concatenate([best_scores, block.T], axis=1)
+            block_positions = np.concatenate(
+                [best_positions, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))],
+                axis=1,
+            )
+            top = np.argpartition(-block_scores, min(k_eff, block_scores.shape[1]) - 1, axis=1)[:, :k_eff]
+            best_scores = np.take_along_axis(block_scores, top, axis=1)
+            best_positions = np.take_along_axis(block_positions, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        scores[:, :k_eff] = np.take_along_axis(best_scores, order, axis=1)
+        positions[:, :k_eff] = np.take_along_axis(best_positions, order, axis=1)
+        return scores, positions
+
+    def memory_bytes(self):
+        return int(self.vectors.nbytes)
+
+    def save(self, path):
+        np.save(path, self.vectors)
+
+    @classmethod
+    def load(cls, path, **params):
+        index = cls(**params)
+        return index.build(np.load(path if path.endswith(".npy") else path + ".npy", mmap_mode="r"))
+
+
+class _FaissIndex(VectorIndex):
+    """faiss 기반 인덱스 공통 처리"""
+
+    def _apply_search_params(self):
+        pass
+
+    def search(self, queries, k):
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        self._apply_search_params()
+        scores, positions = self.index.search(queries, k)
+        return scores, positions.astype(np.int64)
+
+    def memory_bytes(self):
+        return int(faiss.serialize_index(self.index).nbytes)
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path, **params):
+        _require_faiss(cls.name)
+        index = cls(**params)
+        index.index = faiss.read_index(path)
+        index.count = index.index.ntotal
+        return index
+
+
+class HnswIndex(_FaissIndex):
+    """HNSW 그래프 인덱스 (M: 이웃 수, ef_construction: 빌드 탐색 폭, ef_search: 검색 탐색 폭)"""
+
+    name = "hnsw"
+
+    def build(self, vectors):
+        _require_faiss(self.name)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.index = faiss.IndexHNSWFlat(vectors.shape[1], self.params["M"], faiss.METRIC_INNER_PRODUCT)
+        self.index.hnsw.efConstruction = self.params["ef_construction"]
+        self.index.add(vectors)
+        self.count = self.index.ntotal
+        return self
+
+    def _apply_search_params(self):
+        self.index.hnsw.efSearch = self.params["ef_search"]
+
+
+class IvfPqIndex(_FaissIndex):
+    """IVF-PQ 인덱스 (nlist: 클러스터 수, m: 서브벡터 수, nbits: 코드 비트, nprobe: 검색 클러스터 수)"""
+
+    name = "ivfpq"
+
+    def build(self, vectors):
+        _require_faiss(self.name)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        if dim % self.params["m"]:
+            raise ValueError(f"ivfpq: 차원 {dim}은 m={self.params['m']}으로 나누어떨어져야 합니다.")
+        # 데이터가 적으면 클러스터 수를 줄임 (클러스터당 최소 39개 학습 벡터 권장)
+        nlist = max(1, min(self.params["nlist"], len(vectors) // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        self.index = faiss.IndexIVFPQ(quantizer, dim, nlist, self.params["m"], self.params["nbits"],
+                                      faiss.METRIC_INNER_PRODUCT)
+        train_size = min(len(vectors), self.params["train_size"])
+        rng = np.random.default_rng(0)
+        sample = vectors[np.sort(rng.choice(len(vectors), train_size, replace=False))]
+        self.index.train(sample)
+        self.index.add(vectors)
+        self.count = self.index.ntotal
+        return self
+
+    def _apply_search_params(self):
+        self.index.nprobe = self.params["nprobe"]
+
+
+ANN_BACKENDS = {cls.name: cls for cls in (FlatIndex, HnswIndex, IvfPqIndex)}
+
+
+def create_index(name, **params):
+    """이름으로 인덱스를 만듭니다 (파라미터는 DEFAULT_PARAMS 기준으로 덮어씀)."""
+    if name not in ANN_BACKENDS:
+        raise ValueError(f"알 수 없는 ANN 인덱스: {name} (가능: {', '.join(ANN_BACKENDS)})")
+    return ANN_BACKENDS[name](**params)
+
+
+def save_index(index, directory):
+    """인덱스와 파라미터를 directory에 저장합니다."""
+    os.makedirs(directory, exist_ok=True)
+    suffix = ".npy" if index.name == "flat" else ".faiss"
+    index.save(os.path.join(directory, f"ann-{index.name}{suffix}"))
+    with open(os.path.join(directory, f"ann-{index.name}.json"), "w", encoding="utf-8") as f:
+        json.dump({"name": index.name, "params": index.params, "count": index.count}, f)
+
+
+def load_index(directory, name):
+    """save_index로 저장한 인덱스를 엽니다. 없으면 (None, None)."""
+    info_path = os.path.join(directory, f"ann-{name}.json")
+    if not os.path.exists(info_path):
+        return None, None
+    with open(info_path, "r", encoding="utf-8") as f:
+        info = json.load(f)
+    suffix = ".npy" if name == "flat" else ".faiss"
+    index = ANN_BACKENDS[name].load(os.path.join(directory, f"ann-{name}{suffix}"), **info["params"])
+    return index, info
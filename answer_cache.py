@@ -0,0 +1,207 @@
+"""두 챗봇 앱이 공유하는 의미 기반 답변 캐시
+
+키는 (분석 유형, 데이터 버전, 정규화 질문)이며, 같은 분석 유형 · 데이터 버전 안에서
+질문 임베딩의 코사인 유사도가 임계값 이상이면 표현이 조금 다른 질문도 적중으로 봅니다.
+단, 유사도만으로는 "재방문율이 높은 매장"과 "낮은 매장"처럼 뜻이 반대인 질문을 구분하지
+못하므로 지역 · 업종 · 숫자 · 방향(높은/낮은 등) 표현이 모두 같은 질문끼리만 유사 적중으로 봅니다.
+항목은 TTL이 지나면 버리고, 상한을 넘으면 가장 오래 쓰지 않은 항목부터 지웁니다(LRU).
+캐시는 프로세스 공용이라 모든 세션이 공유하며, 데이터셋 버전이 바뀌면(데이터 재로드)
+해당 데이터셋의 이전 답변을 모두 무효화합니다.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_service import normalize_text
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(6 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# 유사 질문 적중 임계값 (0이면 유사도 적중을 사용하지 않음)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+
+# 유사 적중 전에 같아야 하는 질문 표현 (지역, 업종, 숫자, 방향)
+_REGION_WORD = re.compile(r"(?<![가-힣])([가-힣]{1,4}(?:구|군))(?=$|[^가-힣]|[의에은는이가을를와과도])")
+_NOT_REGIONS = {"연구", "요구", "가구", "입구", "출구", "도구", "친구", "추구", "부구"}
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+BUSINESS_WORDS = (
+    "카페", "커피", "디저트", "베이커리", "제과", "한식", "중식", "일식", "양식", "분식",
+    "치킨", "피자", "패스트푸드", "주점", "호프", "요식업", "음식점", "식당",
+)
+_POLARITY_WORDS = (
+    (re.compile(r"(?<![가-힣])(?:높|많|늘)(?:은|게|고|아|어|을|다|음|이)|증가|상승|상위|최고|최대|우수"), "up"),
+    (re.compile(r"(?<![가-힣])(?:낮|적|줄)(?:은|게|고|아|어|을|다|음|이)|감소|하락|하위|최저|최소|저조"), "down"),
+    (re.compile(r"않|없|아닌"), "not"),
+)
+
+
+def question_guard(question):
+    """유사 적중 허용 조건: 지역 · 업종 · 숫자 · 방향 표현 집합 (두 질문의 값이 같아야 적중)"""
+    text = normalize_text(question).lower()
+    regions = {word for word in _REGION_WORD.findall(text) if word not in _NOT_REGIONS}
+    businesses = {word for word in BUSINESS_WORDS if word in text}
+    polarity = {label for pattern, label in _POLARITY_WORDS if pattern.search(text)}
+    return (
+        frozenset(regions),
+        frozenset(businesses),
+        tuple(sorted(_NUMBER.findall(text))),
+        frozenset(polarity),
+    )
+
+
+def dataset_version(dataset, digest, variant=None):
+    """데이터셋 이름 + 내용 해시(+ 샘플 여부 등)로 버전 문자열을 만듭니다 (예: "Q2@1a2b3c4d5e6f7a8b:full")."""
+    version = f"{dataset}@{digest[:16]}"
+    return f"{version}:{variant}" if variant else version
+
+
+def _dataset_of(version):
+    return version.split("@", 1)[0]
+
+
+class AnswerCache:
+    """TTL + LRU + 임베딩 유사도 적중을 지원하는 메모리 답변 캐시"""
+
+    def __init__(self, ttl_seconds=ANSWER_CACHE_TTL_SECONDS, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _expired(self, entry, now):
+        return now - entry["created"] > self.ttl_seconds
+
+    def sync_version(self, version):
+        """데이터셋의 현재 버전을 알립니다. 버전이 바뀌었으면 이전 버전 답변을 지웁니다."""
+        dataset = _dataset_of(version)
+        with self._lock:
+            if self._versions.get(dataset) == version:
+                return
+            self._versions[dataset] = version
+            stale = [key for key in self._entries if _dataset_of(key[1]) == dataset and key[1] != version]
+            for key in stale:
+                del self._entries[key]
+
+    def invalidate(self, dataset=None):
+        """데이터셋(없으면 전체)의 답변을 모두 지웁니다."""
+        with self._lock:
+            if dataset is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if _dataset_of(key[1]) == dataset]:
+                del self._entries[key]
+
+    def get(self, analysis_type, version, question, embed_fn=None):
+        """캐시된 답변 항목(dict)을 반환합니다. 없으면 None.
+
+        정확히 같은 (정규화) 질문이 없고 embed_fn이 주어지면 question_guard가 같은 유사 질문을 찾습니다.
+        반환 항목의 "similarity"는 정확 적중이면 1.0입니다.
+        """
+        key = (analysis_type, version, normalize_text(question))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry, similarity=1.0)
+            guard = question_guard(question)
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if k[0] == analysis_type and k[1] == version and e["vector"] is not None
+                and e["guard"] == guard and not self._expired(e, now)
+            ]
+        if embed_fn is None or not candidates or self.similarity_threshold <= 0:
+            self._miss()
+            return None
+
+        query = self._embed(embed_fn, question)
+        if query is None:
+            self._miss()
+            return None
+        matrix = np.stack([e["vector"] for _, e in candidates])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            self._miss()
+            return None
+        best_key, best_entry = candidates[best]
+        with self._lock:
+            if best_key in self._entries:
+                self._entries.move_to_end(best_key)
+            self.similar_hits += 1
+        return dict(best_entry, similarity=float(scores[best]))
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, analysis_type, version, question, answer, context=None, embed_fn=None):
+        """답변을 저장합니다. context는 함께 보여 줄 참고 데이터(선택)입니다."""
+        if _dataset_of(version) in self._versions and self._versions[_dataset_of(version)] != version:
+            # 그 사이 데이터가 다시 로드되었으면 이전 버전 답변은 저장하지 않음
+            return
+        vector = None
+        if embed_fn is not None and self.similarity_threshold > 0:
+            vector = self._embed(embed_fn, question)
+        key = (analysis_type, version, normalize_text(question))
+        with self._lock:
+            self._entries[key] = {
+                "question": question,
+                "answer": answer,
+                "context": context,
+                "vector": vector,
+                "guard": question_guard(question),
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _embed(embed_fn, question):
+        """질문 단위 벡터 (임베딩 모델을 쓸 수 없으면 None → 정확 일치만 사용)"""
+        try:
+            vector = np.asarray(embed_fn(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning("answer cache: 질문 임베딩 실패, 정확 일치만 사용합니다: %s", e)
+            return None
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def stats(self):
+        """항목 수와 정확/유사 적중, 미스 횟수"""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """프로세스 공용 답변 캐시를 반환합니다."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
@@ -0,0 +1,225 @@
+"""백그라운드 데이터셋 인덱싱과 데이터셋별 진행 상황
+
+Q1/Q2/Q3 인덱싱을 Streamlit 스크립트 실행과 분리된 스레드에서 동시에 진행합니다.
+세 데이터셋이 임베딩 워커 프로세스(EmbeddingPool) 하나를 공유하므로 모델을 데이터셋 수만큼
+로드하지 않으며, 작은 데이터셋은 큰 데이터셋을 기다리지 않고 먼저 준비됩니다.
+
+작업 상태는 프로세스 공용 관리자에 보관되어 화면이 다시 실행되거나 다른 세션이 같은
+설정으로 요청해도 진행 중인 작업을 그대로 이어 봅니다. 작업은 인덱스 폴더별로 하나만 두어
+두 작업이 같은 폴더를 동시에 쓰지 않게 하고, 완료된 작업은 원본 파일이나 매니페스트가
+바뀌었으면(월별 추가 등) 재사용하지 않고 다시 인덱싱합니다. 스레드에서는 Streamlit을 호출하지
+않고 상태만 갱신하며, 화면은 주기적으로 상태를 읽어 표시합니다.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dataset_indexer
+import embedding_pipeline
+import index_store
+
+logger = logging.getLogger(__name__)
+
+# 작업 상태: 대기 / 진행 중 / 완료 / 실패
+STATES = ("queued", "running", "ready", "failed")
+# 작업마다 보관하는 최근 안내 메시지 수
+MAX_JOB_MESSAGES = 20
+
+
+def _source_state(file_path):
+    """원본의 (수정시각, 크기). 파일이 없으면 None."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class IndexJob:
+    """데이터셋 하나의 인덱싱 작업 상태 (스레드 안전)"""
+
+    def __init__(self, dataset, file_path, file_name, index_dir=None, search_options=None):
+        self.dataset = dataset
+        self.file_path = file_path
+        self.file_name = file_name
+        self.index_dir = index_dir
+        self.search_options = search_options
+        # 작업 시작 전 원본 상태 (인덱싱 도중 추가된 행은 다음 요청에서 다시 반영)
+        self.source_state = _source_state(file_path)
+        self.state = "queued"
+        self.progress = 0.0
+        self.status_text = "대기 중"
+        self.messages = []
+        self.vectorstore = None
+        self.doc_count = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def report(self, kind, message, fraction=None):
+        """dataset_indexer.index_dataset의 진행 콜백"""
+        with self._lock:
+            self.status_text = message
+            if fraction is not None:
+                self.progress = min(max(fraction, 0.0), 1.0)
+            if kind == "info":
+                self.messages = (self.messages + [message])[-MAX_JOB_MESSAGES:]
+
+    def _start(self):
+        with self._lock:
+            self.state = "running"
+            self.status_text = "인덱싱 시작"
+            self.started_at = time.time()
+
+    def _finish(self, vectorstore=None, doc_count=0, error=None):
+        with self._lock:
+            self.vectorstore = vectorstore
+            self.doc_count = doc_count
+            self.error = error
+            self.state = "failed" if error is not None else "ready"
+            self.progress = 1.0 if error is None else self.progress
+            self.status_text = f"오류: {error}" if error is not None else f"완료 ({doc_count:,}개 문서)"
+            self.finished_at = time.time()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def snapshot(self):
+        """화면 표시용 상태 사본"""
+        with self._lock:
+            return {
+                "dataset": self.dataset,
+                "file_name": self.file_name,
+                "state": self.state,
+                "progress": self.progress,
+                "status_text": self.status_text,
+                "messages": list(self.messages),
+                "doc_count": self.doc_count,
+                "error": self.error,
+                "elapsed": self.elapsed,
+            }
+
+
+# 인덱스 내용에 영향이 없어 완료된 작업을 그대로 쓸 수 있는 설정 (ANN 설정이 다르면 다시 붙임)
+SEARCH_OPTION_KEYS = ("ann_backend", "ann_params")
+
+
+class IndexingManager:
+    """인덱스 폴더별 작업을 보관하고 백그라운드에서 실행하는 관리자"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _index_dir(file_path, options):
+        if not options.get("persist", True):
+            return None
+        return index_store.index_dir_for(
+            file_path, options.get("use_sample", False), options.get("sample_ratio", 0.1),
+            options.get("store_backend", "chroma"),
+        )
+
+    @staticmethod
+    def _key(file_path, options, index_dir):
+        """작업 키: 저장하는 인덱스는 폴더, 메모리 인덱스는 원본과 샘플링 · 스토어 설정"""
+        if index_dir is not None:
+            return index_dir
+        return ("memory", file_path, options.get("use_sample", False), options.get("sample_ratio", 0.1),
+                options.get("store_backend", "chroma"))
+
+    @staticmethod
+    def _reusable(job, search_options):
+        """진행 중인 작업은 그대로 따라가고, 완료된 작업은 원본 · 매니페스트 · 검색 설정이 그대로일 때만 재사용"""
+        if job.state in ("queued", "running"):
+            return True
+        if job.state != "ready" or job.search_options != search_options:
+            return False
+        if _source_state(job.file_path) != job.source_state:
+            return False
+        if job.index_dir is None:
+            return True
+        manifest = index_store.load_manifest(job.index_dir)
+        return (
+            manifest is not None
+            and manifest.get("source_hash") is not None
+            and (manifest.get("source_mtime"), manifest.get("source_size")) == job.source_state
+        )
+
+    def start(self, specs, options):
+        """데이터셋들의 인덱싱을 시작하고 {데이터셋: IndexJob}을 바로 반환합니다.
+
+        specs는 (데이터셋, 파일 경로, 표시 이름) 목록, options는 index_dataset에 넘길 설정
+        (use_sample, sample_ratio, persist, embed_batch_size, embed_workers, store_backend,
+        ann_backend, ann_params)입니다. 같은 인덱스 폴더의 작업이 진행 중이면 그 작업을 따라가고,
+        완료된 작업은 원본이 바뀌지 않았을 때만 재사용합니다. 실패했거나 원본이 바뀐 경우 다시
+        시작하며, 저장된 인덱스가 있으면 dataset_indexer가 바뀐 행만 증분 갱신합니다.
+        """
+        search_options = {key: options.get(key) for key in SEARCH_OPTION_KEYS}
+        jobs = {}
+        to_run = []
+        with self._lock:
+            for dataset, file_path, file_name in specs:
+                index_dir = self._index_dir(file_path, options)
+                key = self._key(file_path, options, index_dir)
+                job = self._jobs.get(key)
+                if job is None or not self._reusable(job, search_options):
+                    job = IndexJob(dataset, file_path, file_name, index_dir, search_options)
+                    self._jobs[key] = job
+                    to_run.append(job)
+                jobs[dataset] = job
+        if to_run:
+            threading.Thread(
+                target=self._run, args=(to_run, dict(options)), name="dataset-indexing", daemon=True
+            ).start()
+        return jobs
+
+    def _run(self, jobs, options):
+        """임베딩 풀 하나를 열어 두고 작업들을 동시에 실행합니다."""
+        try:
+            with embedding_pipeline.EmbeddingPool(
+                dataset_indexer.EMBEDDING_MODEL_NAME,
+                options.get("embed_batch_size", embedding_pipeline.DEFAULT_BATCH_SIZE),
+                options.get("embed_workers", embedding_pipeline.DEFAULT_WORKERS),
+            ) as pool:
+                with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="index") as executor:
+                    for job in jobs:
+                        executor.submit(self._run_job, job, options, pool)
+        except Exception as e:
+            # 임베딩 풀을 열지 못한 경우 (모델 로드 실패 등)
+            logger.exception("indexing pool failed")
+            for job in jobs:
+                if job.state in ("queued", "running"):
+                    job._finish(error=e)
+
+    @staticmethod
+    def _run_job(job, options, pool):
+        job._start()
+        try:
+            vectorstore, doc_count = dataset_indexer.index_dataset(
+                job.file_path, job.file_name, report=job.report, pool=pool, **options
+            )
+        except Exception as e:
+            logger.exception("indexing %s failed", job.file_name)
+            job._finish(error=e)
+            return
+        job._finish(vectorstore, doc_count)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_indexing_manager():
+    """프로세스 공용 인덱싱 관리자를 반환합니다."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = IndexingManager()
+        return _manager
@@ -0,0 +1,159 @@
+"""ANN 검색 인덱스 벤치마크
+
+저장된 양자화 벡터 스토어(index/ 아래 float16/int8 인덱스)의 벡터로 flat / hnsw / ivfpq
+인덱스를 만들어 빌드 시간, 메모리, 질의 지연(p50/p99), 정확 검색 대비 recall@k를 비교합니다.
+
+사용 예:
+    python benchmark_ann.py
+    python benchmark_ann.py --backends hnsw,ivfpq --params '{"hnsw": {"ef_search": 128}}'
+    python benchmark_ann.py --questions questions.txt --limit 500000 --json result.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:  # psutil 미설치 시 RSS 측정 생략
+    psutil = None
+
+import ann_index
+import embedding_service
+import index_store
+import vector_store
+
+DATASETS = {
+    "Q1": "file/Q1_data.csv",
+    "Q2": "file/Q2_data.csv",
+    "Q3": "file/Q3_data.csv",
+}
+STORE_BACKENDS = ("float16", "int8")
+# 질의를 저장된 벡터에서 뽑을 때 더하는 잡음 크기 (자기 자신과의 완전 일치 방지)
+QUERY_NOISE = 0.05
+# 인덱스를 만든 임베딩 모델 (gemini_rag.EMBEDDING_MODEL_NAME과 같아야 함)
+DEFAULT_MODEL_NAME = embedding_service.DEFAULT_MODEL_NAME
+
+
+def find_store_dir(file_path):
+    """데이터셋의 저장된 양자화 스토어 폴더를 찾습니다 (전체 → 샘플 순)."""
+    for use_sample in (False, True):
+        for backend in STORE_BACKENDS:
+            index_dir = index_store.index_dir_for(file_path, use_sample, 0.1, backend)
+            if os.path.exists(os.path.join(index_dir, vector_store.META_FILE)):
+                return index_dir
+    return None
+
+
+def load_vectors(store, limit=None):
+    """스토어의 정규화 벡터를 float32 배열로 읽습니다 (limit이 있으면 앞에서부터 limit개)."""
+    blocks = []
+    total = 0
+    for _, block in store.iter_vectors():
+        blocks.append(block)
+        total += len(block)
+        if limit and total >= limit:
+            break
+    vectors = np.concatenate(blocks)
+    return vectors[:limit] if limit else vectors
+
+
+def make_queries(vectors, count, questions=None, model_name=DEFAULT_MODEL_NAME, seed=0):
+    """질문 파일이 있으면 임베딩하고, 없으면 저장된 벡터에 잡음을 더해 질의를 만듭니다."""
+    if questions:
+        with open(questions, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        service = embedding_service.get_embedding_service(model_name)
+        queries = np.asarray([service.embed_query(text) for text in texts[:count]], dtype=np.float32)
+    else:
+        rng = np.random.default_rng(seed)
+        picks = rng.choice(len(vectors), min(count, len(vectors)), replace=False)
+        queries = vectors[picks] + rng.normal(0, QUERY_NOISE, (len(picks), vectors.shape[1])).astype(np.float32)
+    return queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+
+def rss_bytes():
+    return psutil.Process().memory_info().rss if psutil else None
+
+
+def benchmark(name, params, vectors, queries, k, exact):
+    """인덱스 1개를 빌드하고 질의 1건씩 검색해 지표를 계산합니다."""
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    index = ann_index.create_index(name, **params).build(vectors)
+    build_seconds = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    latencies = []
+    hits = 0
+    for query, truth in zip(queries, exact):
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found[0].tolist()) & set(truth.tolist()))
+    return {
+        "backend": name,
+        "params": index.params,
+        "build_seconds": round(build_seconds, 3),
+        "index_mb": round(index.memory_bytes() / 1024 ** 2, 1),
+        "rss_delta_mb": round((rss_after - rss_before) / 1024 ** 2, 1) if rss_before is not None else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN 검색 인덱스 벤치마크")
+    parser.add_argument("--datasets", default=",".join(DATASETS), help="Q1,Q2,Q3 중 쉼표 구분")
+    parser.add_argument("--backends", default=",".join(ann_index.ANN_BACKENDS), help="flat,hnsw,ivfpq 중 쉼표 구분")
+    parser.add_argument("--params", default="{}", help='인덱스별 파라미터 JSON (예: {"hnsw": {"M": 16}})')
+    parser.add_argument("--queries", type=int, default=200, help="질의 수")
+    parser.add_argument("--questions", help="질의로 쓸 질문 텍스트 파일 (줄당 1개)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME, help="--questions 임베딩에 쓸 모델")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--limit", type=int, help="데이터셋당 사용할 최대 벡터 수")
+    parser.add_argument("--json", help="결과를 저장할 JSON 파일 경로")
+    args = parser.parse_args()
+
+    params = json.loads(args.params)
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    results = []
+    for dataset in [d.strip() for d in args.datasets.split(",") if d.strip()]:
+        store_dir = find_store_dir(DATASETS[dataset])
+        if store_dir is None:
+            print(f"❌ {dataset}: 저장된 양자화 인덱스가 없습니다. "
+                  f"gemini_rag.py에서 벡터 저장 방식을 float16/int8로 선택해 먼저 인덱싱하세요.")
+            continue
+        store = vector_store.QuantizedVectorStore(store_dir, None)
+        vectors = load_vectors(store, args.limit)
+        queries = make_queries(vectors, args.queries, args.questions, args.model)
+        print(f"\n📊 {dataset}: {len(vectors):,}개 벡터 (dim {vectors.shape[1]}), 질의 {len(queries)}개 - {store_dir}")
+
+        # 정확 검색 결과를 recall 기준으로 사용
+        _, exact = ann_index.create_index("flat").build(vectors).search(queries, args.k)
+        for name in backends:
+            try:
+                result = benchmark(name, params.get(name, {}), vectors, queries, args.k, exact)
+            except (ImportError, ValueError) as e:
+                print(f"  ⚠️ {name}: {e}")
+                continue
+            result["dataset"] = dataset
+            result["vectors"] = len(vectors)
+            results.append(result)
+            print(
+                f"  {name:<6} 빌드 {result['build_seconds']:>8.2f}s | 인덱스 {result['index_mb']:>8.1f}MB | "
+                f"p50 {result['p50_ms']:>7.3f}ms | p99 {result['p99_ms']:>7.3f}ms | "
+                f"recall@{args.k} {result[f'recall@{args.k}']:.3f}"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 결과 저장: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+"""오프라인 전체 파이프라인 벤치마크 (합성 데이터 + 가짜 LLM)
+
+실제 CSV, Supabase 프로젝트, Gemini 키 없이 두 챗봇 파이프라인의 성능을 측정합니다.
+- upload_fast.get_column_mapping의 컬럼 구성으로 Q1/Q2/Q3 합성 CSV를 운영 규모
+  (7천 / 196만 / 8.7만 행)로 만들고 (--scale로 축소 가능, 같은 설정이면 재사용)
+- ChatGoogleGenerativeAI 대신 지연을 설정할 수 있는 결정적 가짜 채팅 모델을 쓰며
+- dataset_indexer.index_dataset으로 인덱싱한 뒤 질문 목록을 gemini_rag(벡터 검색 RAG)와
+  supabase_chatbot(테이블 조회 + 프롬프트) 파이프라인으로 재생해
+인덱싱 처리량, 최대 RSS, 단계별 p50/p95/p99를 보고합니다. 배포 전 회귀 확인용입니다.
+
+Supabase 조회는 합성 CSV를 업로드 단계와 같은 방식(clean_and_map_dataframe)으로 바꾼 로컬
+테이블로 대신합니다. LLM 게이트웨이 설정(LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE 등)은
+앱과 같이 환경변수로 적용됩니다.
+
+사용 예:
+    python benchmark_e2e.py                                  # 운영 규모 (Q2 인덱싱에 오래 걸림)
+    python benchmark_e2e.py --scale 0.01 --turns 30
+    python benchmark_e2e.py --pipelines supabase --llm-first-token-ms 800 --json result.json
+    python benchmark_e2e.py --sample-ratio 0.1 --sessions 4 --cold
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: psutil의 최대 작업 집합으로 대체
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # psutil 미설치 시 RSS 측정 생략 (resource가 없는 환경)
+    psutil = None
+
+# 합성 데이터의 Parquet 변환본 · 임베딩 캐시가 실제 데이터 캐시와 섞이지 않도록 별도 폴더 사용
+# (각 모듈이 import 시점에 환경변수를 읽으므로 import 전에 설정)
+BENCH_DIR = os.getenv("BENCH_DIR", "bench")
+os.environ.setdefault("COLUMNAR_CACHE_DIR", os.path.join(BENCH_DIR, ".cache", "columnar"))
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(BENCH_DIR, ".cache", "embeddings.sqlite"))
+
+from langchain_core.callbacks import CallbackManagerForLLMRun  # noqa: E402
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult  # noqa: E402
+
+import answer_cache  # noqa: E402
+import context_budget  # noqa: E402
+import conversation_memory  # noqa: E402
+import data_access  # noqa: E402
+import dataset_indexer  # noqa: E402
+import embedding_pipeline  # noqa: E402
+import embedding_service  # noqa: E402
+import fanout_retrieval  # noqa: E402
+import llm_gateway  # noqa: E402
+import llm_resilience  # noqa: E402
+import rag_chain  # noqa: E402
+import shard_filter  # noqa: E402
+import turn_tracing  # noqa: E402
+import upload_fast  # noqa: E402
+
+# 데이터셋 → (파일 이름, Supabase 테이블, 운영 행 수, 분석 유형)
+DATASETS = {
+    "Q1": ("Q1_data.csv", "cafe_data", 7_000, "카페업종"),
+    "Q2": ("Q2_data.csv", "revisit_data", 1_960_000, "재방문율"),
+    "Q3": ("Q3_data.csv", "restaurant_data", 87_000, "요식업"),
+}
+GENERATOR_VERSION = 1
+GENERATE_CHUNK_ROWS = 200_000
+
+REGIONS = [
+    "서울 성동구", "서울 강남구", "서울 마포구", "서울 종로구", "서울 송파구", "서울 영등포구",
+    "부산 해운대구", "부산 부산진구", "대구 중구", "인천 연수구", "대전 유성구", "광주 서구",
+    "수원 영통구", "성남 분당구", "고양 일산동구", "용인 수지구",
+]
+BUSINESS_TYPES = ["한식", "중식", "일식", "양식", "카페", "치킨", "분식", "베이커리", "주점", "패스트푸드"]
+COMMERCIAL_AREAS = ["성수", "강남역", "홍대", "건대입구", "잠실", "여의도", "신촌", "이태원", "종로", "서면"]
+CATEGORY_VALUES = {
+    "주요고객층": ["20대", "30대", "40대", "50대", "60대 이상"],
+    "상권유형": ["거주상권", "직장상권", "유동인구상권"],
+    "고객유형": ["충성형", "신규형"],
+    "재방문률_등급": ["High", "Mid", "Low"],
+    "재방문률등급": ["High", "Mid", "Low"],
+    "MCT_OPE_MS_CN": ["1_10%이하", "2_10-25%", "3_25-50%", "4_50-75%", "5_75-90%", "6_90%초과"],
+}
+
+# 기본 질문 목록 (지역/업종 범위 추출 · 후속 질문 재작성 · 통합 검색이 모두 섞이도록 구성)
+QUESTIONS = [
+    "성수동 카페들의 고객 특성은?",
+    "서울 강남구 카페의 주요 고객층과 마케팅 전략을 알려줘",
+    "충성도가 높은 카페의 공통점은?",
+    "재방문율이 낮은 가맹점의 개선 방안은?",
+    "서울 마포구 한식 매장의 재방문율을 높이려면?",
+    "그 중에서 20대 고객이 많은 곳은?",
+    "배달 매출 비율이 높은 요식업 매장의 특징은?",
+    "부산 해운대구 일식 음식점의 매출 증대 전략은?",
+    "객단가가 높은 식당의 공통점은?",
+    "상권 유형별로 어떤 마케팅이 효과적일까?",
+    "유동인구가 많은 상권의 전략은?",
+    "직장인 고객이 많은 지역의 점심 프로모션 아이디어는?",
+]
+
+# 가짜 모델 답변에 쓰는 단어 (같은 프롬프트면 같은 순서로 뽑힘)
+FAKE_VOCABULARY = [
+    "고객", "매출", "재방문율", "상권", "전략", "데이터", "분석", "비율", "증가", "감소",
+    "프로모션", "충성도", "신규", "유동인구", "직장인", "배달", "객단가", "업종", "평균", "개선",
+]
+
+
+class FakeChatModel(BaseChatModel):
+    """ChatGoogleGenerativeAI 대신 쓰는 결정적 가짜 채팅 모델 (같은 프롬프트 → 같은 답변)
+
+    첫 토큰까지 first_token_seconds, 이후 초당 tokens_per_second개 속도로 답변을 내보냅니다.
+    생성자는 llm_gateway.get_chat_model이 넘기는 인자를 그대로 받습니다.
+    """
+
+    model: str = "fake-gemini"
+    temperature: float = 0.7
+    max_output_tokens: int = 8192
+    timeout: Optional[float] = None
+    max_retries: int = 0
+    api_key: Optional[str] = None
+    first_token_seconds: float = 0.4
+    tokens_per_second: float = 80.0
+    response_tokens: int = 300
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _tokens(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        count = max(1, min(self.response_tokens, self.max_output_tokens))
+        return [f"{rng.choice(FAKE_VOCABULARY)} " for _ in range(count - 1)] + ["입니다."]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_seconds + (len(tokens) - 1) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_seconds)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def install_fake_llm(first_token_seconds, tokens_per_second, response_tokens):
+    """llm_gateway가 만드는 모든 클라이언트를 가짜 모델로 바꿉니다 (게이트웨이 · 복원력 계층은 그대로)."""
+    llm_gateway.ChatGoogleGenerativeAI = functools.partial(
+        FakeChatModel,
+        first_token_seconds=first_token_seconds,
+        tokens_per_second=tokens_per_second,
+        response_tokens=response_tokens,
+    )
+    # stream_ai_response의 API 키 확인 통과용 (가짜 모델은 키를 쓰지 않음)
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+
+# ---------------------------------------------------------------- 합성 데이터
+
+def dataset_columns(dataset):
+    """업로드 컬럼 매핑 + 인덱싱 문서 본문 컬럼 (순서 유지, 중복 제외)"""
+    file_name, table_name, _, _ = DATASETS[dataset]
+    columns = list(upload_fast.get_column_mapping(table_name))
+    for column in dataset_indexer.ROW_DOCUMENT_COLUMNS.get(file_name) or []:
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def _column_values(column, dataset, rng, start, n):
+    """컬럼 이름에 맞는 그럴듯한 값 n개 (지역은 일부 지역에 몰리도록 치우침)"""
+    ids = np.arange(start, start + n)
+    if column == "가맹점지역":
+        weights = 1 / np.arange(1, len(REGIONS) + 1)
+        return rng.choice(REGIONS, n, p=weights / weights.sum())
+    if column == "업종":
+        return np.full(n, "카페") if dataset == "Q1" else rng.choice(BUSINESS_TYPES, n)
+    if column == "상권":
+        return rng.choice(COMMERCIAL_AREAS, n)
+    if column in CATEGORY_VALUES:
+        return rng.choice(CATEGORY_VALUES[column], n)
+    if column == "가맹점명":
+        # Q2/Q3는 가맹점 하나에 기준년월별 행이 여러 개
+        return np.char.add("가맹점", (ids // (24 if dataset != "Q1" else 1)).astype(str))
+    if column == "가맹점구분번호":
+        return np.char.add("MCT", (ids // 24).astype(str))
+    if column == "가맹점주소":
+        return np.char.add(rng.choice(REGIONS, n), np.char.add(" 테스트로 ", (ids % 500).astype(str)))
+    if column == "브랜드구분코드":
+        return np.char.add("B", rng.integers(0, 300, n).astype(str))
+    if column == "기준년월":
+        months = ids % 24
+        return 202301 + (months // 12) * 100 + months % 12
+    if column in ("개설일", "폐업일"):
+        days = rng.integers(0, 3650, n)
+        values = (pd.Timestamp("2010-01-01") + pd.to_timedelta(days, unit="D")).strftime("%Y%m%d").to_numpy()
+        if column == "폐업일":
+            values = np.where(rng.random(n) < 0.95, None, values)
+        return values
+    if column in ("월간매출액", "업종평균매출"):
+        return rng.lognormal(16, 0.8, n).round(-3)
+    if column in ("월간이용건수", "월간이용고객수"):
+        return rng.integers(10, 5000, n)
+    if column == "월평균객단가":
+        return rng.integers(3000, 60000, n)
+    # 그 밖의 비율 · 지수 · 차이 컬럼
+    values = rng.uniform(0, 100, n).round(1)
+    if "차이" in column or "변화" in column:
+        values = (values - 50).round(1)
+    return values
+
+
+def generate_dataset(path, dataset, rows, seed=0, chunk_rows=GENERATE_CHUNK_ROWS):
+    """합성 CSV를 청크 단위로 씁니다 (196만 행도 메모리에 한 번에 올리지 않음)."""
+    columns = dataset_columns(dataset)
+    rng = np.random.default_rng([seed, int(dataset[1:])])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        frame = pd.DataFrame({column: _column_values(column, dataset, rng, start, n) for column in columns})
+        frame.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False,
+                     encoding="utf-8-sig" if start == 0 else "utf-8")
+    os.replace(tmp_path, path)
+
+
+def ensure_datasets(data_dir, datasets, scale=1.0, seed=0, regenerate=False):
+    """합성 데이터 파일 경로 {데이터셋: 경로}. 같은 설정으로 만든 파일이 있으면 재사용합니다."""
+    os.makedirs(data_dir, exist_ok=True)
+    spec_path = os.path.join(data_dir, "synthetic.json")
+    try:
+        with open(spec_path, "r", encoding="utf-8") as f:
+            specs = json.load(f)
+    except (OSError, ValueError):
+        specs = {}
+
+    paths = {}
+    for dataset in datasets:
+        file_name, _, production_rows, _ = DATASETS[dataset]
+        path = os.path.join(data_dir, file_name)
+        rows = max(1, int(production_rows * scale))
+        spec = {"rows": rows, "seed": seed, "version": GENERATOR_VERSION, "columns": dataset_columns(dataset)}
+        if regenerate or specs.get(dataset) != spec or not os.path.exists(path):
+            started = time.perf_counter()
+            print(f"🧪 {dataset}: 합성 데이터 {rows:,}행 생성 중... ({path})")
+            generate_dataset(path, dataset, rows, seed)
+            print(f"   완료 {time.perf_counter() - started:.1f}s · {os.path.getsize(path) / 1024 ** 2:,.1f}MB")
+            specs[dataset] = spec
+            with open(spec_path, "w", encoding="utf-8") as f:
+                json.dump(specs, f, ensure_ascii=False, indent=2)
+        paths[dataset] = path
+    return paths
+
+
+# ---------------------------------------------------------------- 측정 도구
+
+def peak_rss_mb():
+    """{"self": 이 프로세스, "children": 종료된 임베딩 워커 중 최대} 최대 RSS (MB, 측정 불가 시 None)"""
+    if resource is not None:
+        # Linux는 KB, macOS는 바이트 단위
+        unit = 1 if sys.platform == "darwin" else 1024
+        return {
+            "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1024 ** 2, 1),
+            "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1024 ** 2, 1),
+        }
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, "peak_wset", info.rss)
+        return {"self": round(peak / 1024 ** 2, 1), "children": None}
+    return {"self": None, "children": None}
+
+
+def percentiles(values):
+    return {
+        "count": len(values),
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+    }
+
+
+def stage_report(records):
+    """턴 기록 목록 → 단계별 {count, p50, p95, p99} (초) + 전체 턴 시간"""
+    durations = {}
+    for record in records:
+        for span in record["spans"]:
+            durations.setdefault(span["name"], []).append(span["duration"])
+        if record["duration"] is not None:
+            durations.setdefault("turn", []).append(record["duration"])
+    return {name: percentiles(values) for name, values in sorted(durations.items())}
+
+
+# ---------------------------------------------------------------- 인덱싱
+
+def index_all(paths, args):
+    """데이터셋별로 index_dataset을 실행해 (벡터 스토어 dict, 결과 목록)을 반환합니다."""
+    vectorstores = {}
+    results = []
+    for dataset, path in paths.items():
+        file_name = os.path.basename(path)
+        use_sample = args.sample_ratio < 1
+        total_rows = data_access.num_rows(path)
+        started = time.perf_counter()
+        vectorstore, doc_count = dataset_indexer.index_dataset(
+            path, file_name,
+            use_sample=use_sample,
+            sample_ratio=args.sample_ratio,
+            persist=False,  # 실제 index/ 폴더와 섞이지 않도록 항상 새로 빌드
+            embed_batch_size=args.embed_batch_size,
+            embed_workers=args.embed_workers,
+            store_backend=args.store_backend,
+            ann_backend=args.ann_backend,
+            report=lambda kind, message, fraction=None: kind == "info" and print(f"   {message}"),
+        )
+        seconds = time.perf_counter() - started
+        vectorstores[dataset] = vectorstore
+        result = {
+            "dataset": dataset,
+            "rows": total_rows,
+            "documents": doc_count,
+            "seconds": round(seconds, 2),
+            "rows_per_second": round(doc_count / max(seconds, 1e-9), 1),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        results.append(result)
+        print(
+            f"📥 {dataset}: {doc_count:,}개 문서 {seconds:,.1f}s ({result['rows_per_second']:,.0f} rows/s) · "
+            f"최대 RSS {result['peak_rss_mb']['self']}MB (워커 {result['peak_rss_mb']['children']}MB)"
+        )
+    return vectorstores, results
+
+
+# ---------------------------------------------------------------- 파이프라인 재생
+
+def build_gemini_chains(vectorstores):
+    """앱과 같은 방식으로 데이터셋별 체인 + 통합분석 체인을 만듭니다."""
+    extractor = shard_filter.QueryScopeExtractor(regions=REGIONS, business_types=BUSINESS_TYPES)
+    chains = {}
+    retrievers = {}
+    for dataset, vectorstore in vectorstores.items():
+        chains[dataset] = rag_chain.create_specialized_rag_chain(vectorstore, DATASETS[dataset][3], extractor)
+        retrievers[dataset] = shard_filter.ShardedRetriever(vectorstore=vectorstore, extractor=extractor, k=5)
+    if retrievers:
+        chains["통합"] = rag_chain.create_specialized_rag_chain(
+            None, "통합분석", retriever=fanout_retrieval.FanOutRetriever(retrievers=retrievers)
+        )
+    return chains
+
+
+def gemini_turn(chains, question, memory, session_id, traces):
+    """gemini_rag.py의 답변 처리와 같은 순서로 턴 하나를 실행합니다."""
+    with turn_tracing.trace_turn("gemini_rag", session_id) as trace:
+        traces.append(trace)
+        with turn_tracing.span("classify"):
+            dataset_type, analysis_type = rag_chain.classify_question(question)
+        chain = chains.get(dataset_type) or chains.get("통합")
+        turn_tracing.annotate(dataset=dataset_type, analysis_type=analysis_type)
+
+        answer = ""
+        started = time.perf_counter()
+        first_token_at = None
+        context_at = None
+        with llm_gateway.session_scope(session_id), llm_resilience.turn_scope():
+            for chunk in chain.stream({"input": question, "chat_history": memory.prompt_history()}):
+                if "context" in chunk:
+                    context_at = time.perf_counter()
+                if chunk.get("answer"):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        turn_tracing.record_span("ttft", first_token_at - started)
+                    answer += chunk["answer"]
+        if context_at is not None:
+            turn_tracing.record_span("generation", time.perf_counter() - context_at)
+        turn_tracing.annotate(response_tokens=context_budget.count_tokens(answer))
+    memory.add_exchange(question, answer)
+
+
+class LocalTables:
+    """Supabase 테이블 대신 합성 CSV를 업로드 단계와 같은 컬럼명으로 바꿔 돌려주는 조회기"""
+
+    def __init__(self, paths):
+        self.paths = {DATASETS[dataset][1]: path for dataset, path in paths.items()}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _frame(self, table_name):
+        with self._lock:
+            frame = self._frames.get(table_name)
+            if frame is None:
+                # 앱의 query_supabase_data처럼 첫 조회 이후에는 캐시된 결과를 사용
+                path = self.paths[table_name]
+                raw = data_access.read_table(path, columns=list(upload_fast.get_column_mapping(table_name)))
+                frame = upload_fast.clean_and_map_dataframe(raw, table_name)
+                self._frames[table_name] = frame
+            return frame
+
+    def row_count(self, table_name):
+        return len(self._frame(table_name))
+
+    def query(self, table_name, filters=None, limit=None, columns=None):
+        frame = self._frame(table_name)
+        if isinstance(filters, dict):
+            filters = [(column, "eq", value) for column, value in filters.items()]
+        # PostgREST 조건과 같은 의미로 거름 (ilike는 % 와일드카드만 지원)
+        for column, op, value in filters or ():
+            series = frame[column]
+            if op == "eq":
+                mask = series == value
+            elif op == "in":
+                mask = series.isin(list(value))
+            elif op == "gte":
+                mask = series >= value
+            elif op == "lte":
+                mask = series <= value
+            else:
+                pattern = "^" + ".*".join(re.escape(part) for part in value.split("%")) + "$"
+                mask = series.astype(str).str.contains(pattern, case=False, regex=True)
+            frame = frame[mask.fillna(False)]
+        if columns:
+            frame = frame[[column for column in columns if column in frame.columns]]
+        return frame.head(limit) if limit else frame
+
+
+def supabase_turn(app, question, session_id, traces):
+    """supabase_chatbot.py의 답변 처리와 같은 순서로 턴 하나를 실행합니다."""
+    with turn_tracing.trace_turn("supabase_chatbot", session_id) as trace:
+        traces.append(trace)
+        with turn_tracing.span("get_relevant_data"):
+            data_df, data_type, table_name, summary, filters = app.get_relevant_data(question)
+        turn_tracing.annotate(dataset=table_name, analysis_type=data_type, rows_fetched=len(data_df))
+
+        response = ""
+        started = time.perf_counter()
+        first_token_at = None
+        with llm_gateway.session_scope(session_id), llm_resilience.turn_scope():
+            for chunk in app.stream_ai_response(question, data_df, data_type, table_name, summary, filters):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    turn_tracing.record_span("ttft", first_token_at - started)
+                response += chunk
+        turn_tracing.annotate(response_tokens=context_budget.count_tokens(response))
+
+
+def replay(run_turn, questions, turns, sessions, use_answer_cache):
+    """turns개 턴을 sessions개 세션에 나눠 동시에 재생하고 턴 기록 목록을 반환합니다."""
+    traces = []
+    errors = []
+
+    def run_session(index):
+        session_id = f"bench-{index}"
+        memory = conversation_memory.ConversationMemory(session_id)
+        for turn in range(index, turns, sessions):
+            if not use_answer_cache:
+                # 같은 질문을 반복 재생하므로 매 턴 파이프라인 전체를 타도록 답변 캐시를 비움
+                answer_cache.get_answer_cache().invalidate()
+            question = questions[turn % len(questions)]
+            try:
+                run_turn(question, memory, session_id, traces)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="bench-session") as executor:
+        list(executor.map(run_session, range(sessions)))
+    elapsed = time.perf_counter() - started
+    records = [trace.to_dict() for trace in traces]
+    return records, errors, elapsed
+
+
+def print_stage_report(title, report):
+    print(f"\n⏱️ {title} 단계별 지연 (초)")
+    print(f"   {'단계':<20} {'횟수':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, stats in report.items():
+        print(f"   {name:<20} {stats['count']:>6} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['p99']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="오프라인 전체 파이프라인 벤치마크 (합성 데이터 + 가짜 LLM)")
+    parser.add_argument("--data-dir", default=BENCH_DIR, help="합성 데이터 폴더")
+    parser.add_argument("--datasets", default=",".join(DATASETS), help="Q1,Q2,Q3 중 쉼표 구분")
+    parser.add_argument("--scale", type=float, default=1.0, help="운영 행 수 대비 생성 비율")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--regenerate", action="store_true", help="합성 데이터를 다시 생성")
+    parser.add_argument("--pipelines", default="gemini,supabase", help="gemini,supabase 중 쉼표 구분")
+    parser.add_argument("--sample-ratio", type=float, default=1.0, help="인덱싱 층화 샘플링 비율 (1이면 전체)")
+    parser.add_argument("--store-backend", default="chroma", choices=list(dataset_indexer.VECTOR_STORE_BACKENDS))
+    parser.add_argument("--ann-backend", default="flat", help="양자화 스토어의 검색 인덱스 (flat/hnsw/ivfpq)")
+    parser.add_argument("--embed-batch-size", type=int, default=embedding_pipeline.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--embed-workers", type=int, default=embedding_pipeline.DEFAULT_WORKERS)
+    parser.add_argument("--cold", action="store_true", help="벤치마크용 임베딩 캐시를 지우고 시작")
+    parser.add_argument("--questions", help="재생할 질문 텍스트 파일 (줄당 1개, 없으면 기본 목록)")
+    parser.add_argument("--turns", type=int, default=60, help="파이프라인별 재생 턴 수")
+    parser.add_argument("--sessions", type=int, default=1, help="동시에 질문하는 세션 수")
+    parser.add_argument("--answer-cache", action="store_true", help="답변 캐시를 켠 채로 재생")
+    parser.add_argument("--llm-first-token-ms", type=float, default=400, help="가짜 LLM 첫 토큰 지연")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80, help="가짜 LLM 토큰 생성 속도")
+    parser.add_argument("--llm-response-tokens", type=int, default=300, help="가짜 LLM 답변 토큰 수")
+    parser.add_argument("--json", help="결과를 저장할 JSON 파일 경로")
+    args = parser.parse_args()
+
+    datasets = [d.strip() for d in args.datasets.split(",") if d.strip()]
+    pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    install_fake_llm(args.llm_first_token_ms / 1000, args.llm_tokens_per_second, args.llm_response_tokens)
+    if args.cold and os.path.exists(embedding_service.EMBEDDING_CACHE_PATH):
+        os.remove(embedding_service.EMBEDDING_CACHE_PATH)
+
+    paths = ensure_datasets(args.data_dir, datasets, args.scale, args.seed, args.regenerate)
+    result = {
+        "settings": vars(args),
+        "generated_rows": {dataset: data_access.num_rows(path) for dataset, path in paths.items()},
+    }
+
+    if "gemini" in pipelines:
+        print("\n📚 인덱싱")
+        vectorstores, result["indexing"] = index_all(paths, args)
+        chains = build_gemini_chains(vectorstores)
+        print(f"\n🤖 gemini_rag 재생: {args.turns}턴 · 세션 {args.sessions}개")
+        records, errors, elapsed = replay(
+            lambda question, memory, session_id, traces: gemini_turn(chains, question, memory, session_id, traces),
+            questions, args.turns, args.sessions, args.answer_cache,
+        )
+        result["gemini_rag"] = {"turns": len(records), "errors": errors, "seconds": round(elapsed, 2),
+                                "stages": stage_report(records)}
+        print_stage_report("gemini_rag", result["gemini_rag"]["stages"])
+
+    if "supabase" in pipelines:
+        # import 시 Streamlit 페이지 설정만 실행되고 화면(main)은 실행되지 않음
+        import supabase_chatbot
+        tables = LocalTables(paths)
+        supabase_chatbot.query_supabase_data = tables.query
+        # 답변 캐시 버전용 행 수도 로컬 데이터에서 계산 (업로드 메타데이터가 없으므로)
+        supabase_chatbot.get_table_row_count = tables.row_count
+        # 로컬 CSV에는 analysis_summary 함수가 없으므로 내려받은 행으로 요약을 계산하는 경로를 측정
+        supabase_chatbot.query_analysis_summary = lambda data_type, filters=None: None
+        print(f"\n🗄️ supabase_chatbot 재생: {args.turns}턴 · 세션 {args.sessions}개")
+        records, errors, elapsed = replay(
+            lambda question, memory, session_id, traces: supabase_turn(supabase_chatbot, question, session_id, traces),
+            questions, args.turns, args.sessions, args.answer_cache,
+        )
+        result["supabase_chatbot"] = {"turns": len(records), "errors": errors, "seconds": round(elapsed, 2),
+                                      "stages": stage_report(records)}
+        print_stage_report("supabase_chatbot", result["supabase_chatbot"]["stages"])
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(f"\n💾 최대 RSS: {result['peak_rss_mb']['self']}MB (임베딩 워커 {result['peak_rss_mb']['children']}MB)")
+    for name in ("gemini_rag", "supabase_chatbot"):
+        if result.get(name, {}).get("errors"):
+            print(f"⚠️ {name} 실패 {len(result[name]['errors'])}턴: {result[name]['errors'][0]}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 결과 저장: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""토큰 예산 안에서 RAG 프롬프트 구성 (참고 문서 + 대화 기록)
+
+검색 문서와 대화 기록을 그대로 붙이면 프롬프트 길이(지연 · 비용)가 통제되지 않으므로
+- 분석 유형과 질문에 무관한 컬럼 줄을 문서에서 빼고
+- 내용이 겹치는(같거나 한쪽이 다른 쪽에 포함되는) 문서를 하나만 남기며
+- 대화 기록은 최근 것부터 HISTORY_TOKEN_BUDGET 안에서만, 긴 답변은 앞부분만 남기고
+- 남은 예산 안에 들어가는 문서만(관련도 순) 넣습니다.
+토큰 수는 tiktoken이 있으면 cl100k_base로, 없으면 문자 수로 어림합니다 (Gemini 토크나이저와
+정확히 같지는 않으므로 예산에는 여유를 둡니다).
+"""
+import logging
+import os
+import re
+
+from langchain_core.documents import Document
+
+import turn_tracing
+from query_rewrite import prior_history
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken 미설치 또는 인코딩 파일을 받을 수 없는 환경
+    _encoding = None
+
+logger = logging.getLogger(__name__)
+
+# 시스템 프롬프트 + 참고 문서 + 대화 기록 + 질문 전체 예산
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))
+# 대화 기록의 메시지 하나에 남기는 최대 토큰 수 (긴 답변은 앞부분만)
+HISTORY_MESSAGE_TOKENS = 300
+# 이 비율 이상 줄이 겹치면 같은 문서로 봄
+OVERLAP_RATIO = 0.8
+
+# 질문에 관련 단어가 있거나 분석 유형의 핵심일 때만 남기는 컬럼 묶음
+COLUMN_GROUPS = {
+    "demographics": {
+        "columns": {
+            '남성비중', '여성비중', '성비차이', '연령집중도', '주요고객층',
+            '남성20대이하비율', '남성30대비율', '남성40대비율', '남성50대비율', '남성60대이상비율',
+            '여성20대이하비율', '여성30대비율', '여성40대비율', '여성50대비율', '여성60대이상비율',
+        },
+        "keywords": ('연령', '나이', '성별', '남성', '여성', '남자', '여자', '20대', '30대', '40대',
+                     '50대', '60대', '고객층', '타겟', '세대', 'MZ', '청년', '시니어'),
+    },
+    "visit_channel": {
+        "columns": {'거주이용고객비율', '직장이용고객비율', '유동인구이용고객비율'},
+        "keywords": ('거주', '직장', '유동', '입지', '오피스', '주거', '상권'),
+    },
+    "delivery": {
+        "columns": {'배달매출비율'},
+        "keywords": ('배달',),
+    },
+    "benchmark": {
+        "columns": {'업종평균재방문률', '상권평균재방문률', '업종대비차이', '업종평균매출',
+                    '매출_업종차이', '재방문률_업종차이'},
+        "keywords": ('평균', '비교', '대비', '경쟁', '차이', '순위'),
+    },
+}
+ANALYSIS_CORE_GROUPS = {
+    "카페업종": {"demographics"},
+    "재방문율": {"benchmark", "visit_channel"},
+    "요식업": {"delivery", "benchmark"},
+    "통합분석": set(COLUMN_GROUPS),
+}
+
+# 통합분석 문서 앞의 출처 표시 ("[Q1 카페] ")와 "컬럼: 값" 줄
+_SOURCE_PREFIX = re.compile(r"^(\[[^\]]+\] )")
+_COLUMN_LINE = re.compile(r"^([^:\n]+): ")
+
+
+def count_tokens(text):
+    """텍스트 토큰 수 (tiktoken이 없으면 ASCII 4자, 그 외 문자 1.5자를 1토큰으로 어림)"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5) + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """앞에서부터 max_tokens 안에 들어가는 부분만 남깁니다."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]) + " …(생략)"
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + " …(생략)"
+
+
+def dropped_columns(analysis_type, question):
+    """분석 유형의 핵심도 아니고 질문에도 언급되지 않은 컬럼 묶음의 컬럼들"""
+    keep = ANALYSIS_CORE_GROUPS.get(analysis_type, set(COLUMN_GROUPS))
+    dropped = set()
+    for name, group in COLUMN_GROUPS.items():
+        if name in keep or any(keyword in question for keyword in group["keywords"]):
+            continue
+        dropped |= group["columns"]
+    return dropped
+
+
+def strip_columns(text, columns):
+    """"컬럼: 값" 줄 중 columns에 해당하는 줄을 뺍니다 (출처 표시는 유지)."""
+    if not columns:
+        return text
+    prefix = ""
+    match = _SOURCE_PREFIX.match(text)
+    if match:
+        prefix = match.group(1)
+        text = text[len(prefix):]
+    kept = []
+    for line in text.split("\n"):
+        column = _COLUMN_LINE.match(line)
+        if column and column.group(1).strip() in columns:
+            continue
+        kept.append(line)
+    return prefix + "\n".join(kept)
+
+
+def _line_set(text):
+    return set(_SOURCE_PREFIX.sub("", text).split("\n"))
+
+
+def dedupe_documents(docs, overlap_ratio=OVERLAP_RATIO):
+    """같거나 많이 겹치는 문서는 앞(관련도 높은) 문서만 남깁니다."""
+    kept = []
+    kept_lines = []
+    for doc in docs:
+        lines = _line_set(doc.page_content)
+        duplicate = False
+        for other in kept_lines:
+            smaller = min(len(lines), len(other)) or 1
+            if len(lines & other) / smaller >= overlap_ratio:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(doc)
+            kept_lines.append(lines)
+    return kept
+
+
+def _message_text(message):
+    if isinstance(message, dict):
+        return message.get("content", "")
+    return getattr(message, "content", "")
+
+
+def fit_history(question, chat_history, budget=HISTORY_TOKEN_BUDGET,
+                message_tokens=HISTORY_MESSAGE_TOKENS):
+    """현재 질문을 뺀 이전 대화를 최근 것부터 budget 안에서 남깁니다. (메시지 목록, 토큰 수)
+
+    "pinned" 표시가 있는 dict 메시지(대화 요약)는 메시지별 길이 제한 없이 넣습니다.
+    """
+    fitted = []
+    used = 0
+    for message in reversed(prior_history(question, chat_history)):
+        pinned = isinstance(message, dict) and message.get("pinned")
+        content = _message_text(message)
+        if not pinned:
+            content = truncate_to_tokens(content, message_tokens)
+        tokens = count_tokens(content)
+        if used + tokens > budget:
+            break
+        if isinstance(message, dict):
+            message = {key: value for key, value in message.items() if key != "pinned"}
+            message["content"] = content
+        else:
+            message = message.model_copy(update={"content": content})
+        fitted.append(message)
+        used += tokens
+    fitted.reverse()
+    return fitted, used
+
+
+def fit_documents(docs, budget):
+    """관련도 순 문서를 budget 안에서 채웁니다. 첫 문서는 잘라서라도 넣습니다. (문서 목록, 토큰 수)"""
+    fitted = []
+    used = 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content)
+        if used + tokens > budget:
+            if not fitted and budget > 0:
+                content = truncate_to_tokens(doc.page_content, budget)
+                fitted.append(Document(page_content=content, metadata=doc.metadata))
+                used += count_tokens(content)
+            break
+        fitted.append(doc)
+        used += tokens
+    return fitted, used
+
+
+class ContextAssembler:
+    """분석 유형별 시스템 프롬프트를 기준으로 참고 문서와 대화 기록을 토큰 예산에 맞추는 조립기"""
+
+    def __init__(self, system_prompt, analysis_type, budget=PROMPT_TOKEN_BUDGET,
+                 history_budget=HISTORY_TOKEN_BUDGET):
+        self.analysis_type = analysis_type
+        self.budget = budget
+        self.history_budget = history_budget
+        self.system_tokens = count_tokens(system_prompt.replace("{context}", ""))
+
+    def assemble(self, inputs):
+        """{"input", "chat_history", "context"}를 예산에 맞춰 줄이고 "prompt_tokens" 내역을 덧붙입니다."""
+        question = inputs["input"]
+        history, history_tokens = fit_history(question, inputs.get("chat_history"), self.history_budget)
+        question_tokens = count_tokens(question)
+
+        columns = dropped_columns(self.analysis_type, question)
+        docs = [
+            Document(page_content=strip_columns(doc.page_content, columns), metadata=doc.metadata)
+            for doc in inputs.get("context", [])
+        ]
+        docs = dedupe_documents(docs)
+        context_budget = self.budget - self.system_tokens - question_tokens - history_tokens
+        docs, context_tokens = fit_documents(docs, context_budget)
+
+        prompt_tokens = {
+            "total": self.system_tokens + question_tokens + history_tokens + context_tokens,
+            "system": self.system_tokens,
+            "question": question_tokens,
+            "history": history_tokens,
+            "context": context_tokens,
+            "documents": len(docs),
+            "retrieved": len(inputs.get("context", [])),
+        }
+        logger.info("prompt tokens (%s): %s", self.analysis_type, prompt_tokens)
+        turn_tracing.annotate(prompt_tokens=prompt_tokens["total"], documents=len(docs))
+        return dict(inputs, chat_history=history, context=docs, prompt_tokens=prompt_tokens)
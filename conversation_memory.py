@@ -0,0 +1,113 @@
+"""대화 기록 요약 메모리 (최근 교환은 그대로, 이전 대화는 누적 요약으로)
+
+답변 하나가 수천 토큰짜리 보고서라 대화 기록을 그대로 넘기면 질문이 쌓일수록 프롬프트가
+커집니다. 여기서는 마지막 질문 · 답변 한 쌍만 원문으로 두고, 그 이전 대화는 LLM으로 만든
+누적 요약 하나로 대신합니다. 요약은 답변이 끝난 뒤 백그라운드 스레드에서 갱신하므로 다음
+질문의 응답 시간에 들어가지 않으며, 갱신이 끝나기 전에는 아직 요약되지 않은 메시지를
+원문으로 함께 넘깁니다.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+import context_budget
+import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+# 원문으로 남기는 최근 메시지 수 (질문 1 + 답변 1)
+VERBATIM_MESSAGES = 2
+# 요약에 넣는 메시지 하나의 최대 토큰 수
+SUMMARY_INPUT_MESSAGE_TOKENS = 800
+SUMMARY_MAX_OUTPUT_TOKENS = 1024
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """당신은 상권 분석 상담 대화를 요약하는 도우미입니다.
+기존 요약과 새로 이어진 대화를 합쳐 하나의 요약으로 다시 쓰세요.
+- 사용자가 관심을 보인 지역, 업종, 가맹점, 지표와 질문 의도를 빠짐없이 남기세요.
+- 답변에서 제시한 핵심 수치와 결론, 전략 이름만 간단히 남기고 서식은 쓰지 마세요.
+- 500자 이내의 한국어 문단으로 작성하세요."""),
+    ("human", "[기존 요약]\n{summary}\n\n[새 대화]\n{transcript}"),
+])
+
+# 모든 세션이 공유하는 요약 스레드 (요약은 답변보다 우선순위가 낮으므로 적게 둠)
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+def _format_transcript(messages):
+    lines = []
+    for message in messages:
+        speaker = "사용자" if message["role"] == "user" else "상담사"
+        content = context_budget.truncate_to_tokens(message["content"], SUMMARY_INPUT_MESSAGE_TOKENS)
+        lines.append(f"{speaker}: {content}")
+    return "\n\n".join(lines)
+
+
+class ConversationMemory:
+    """세션 하나의 대화 기록과 누적 요약 (요약 갱신은 백그라운드에서 진행)"""
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.messages = []
+        self.summary = ""
+        # messages 중 앞에서부터 요약에 반영된 개수 (갱신이 끝나면 해당 메시지는 버림)
+        self.summarized = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def add_exchange(self, question, answer):
+        """완료된 질문 · 답변 한 쌍을 기록하고 요약 갱신을 예약합니다."""
+        with self._lock:
+            self.messages.append({"role": "user", "content": question})
+            self.messages.append({"role": "assistant", "content": answer})
+        self.refresh_async()
+
+    def prompt_history(self):
+        """프롬프트에 넣을 대화 기록: [요약] + 아직 요약 안 된 이전 메시지 + 마지막 교환 원문"""
+        with self._lock:
+            history = []
+            if self.summary:
+                # pinned: 토큰 예산 조립 시 메시지별 길이 제한을 적용하지 않음 (context_budget.fit_history)
+                history.append({"role": "user", "content": f"[이전 대화 요약]\n{self.summary}", "pinned": True})
+            history.extend(self.messages[self.summarized:])
+            return history
+
+    def refresh_async(self):
+        """원문으로 둘 최근 교환보다 오래된 메시지가 있으면 요약 갱신을 백그라운드로 시작합니다."""
+        with self._lock:
+            end = len(self.messages) - VERBATIM_MESSAGES
+            if self._refreshing or end <= self.summarized:
+                return
+            self._refreshing = True
+            start, summary = self.summarized, self.summary
+            pending = list(self.messages[start:end])
+        _executor.submit(self._refresh, summary, pending, end)
+
+    def _refresh(self, summary, pending, end):
+        try:
+            chain = SUMMARY_PROMPT | llm_gateway.get_chat_model(
+                temperature=0.2, max_output_tokens=SUMMARY_MAX_OUTPUT_TOKENS
+            ) | StrOutputParser()
+            with llm_gateway.session_scope(f"{self.session_id}:memory"):
+                new_summary = chain.invoke({
+                    "summary": summary or "(없음)",
+                    "transcript": _format_transcript(pending),
+                }).strip()
+        except Exception as e:
+            # 실패하면 기존 요약을 유지하고 다음 답변 뒤에 다시 시도 (그동안은 원문을 넘김)
+            logger.warning("conversation summary refresh failed: %s", e)
+            with self._lock:
+                self._refreshing = False
+            return
+        with self._lock:
+            if new_summary:
+                # 요약에 반영된 원문은 더 이상 보관하지 않음
+                self.summary = new_summary
+                self.messages = self.messages[end:]
+                self.summarized = 0
+            self._refreshing = False
+        # 갱신하는 동안 새 교환이 쌓였으면 이어서 요약
+        self.refresh_async()
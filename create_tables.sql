@@ -170,3 +170,116 @@ CREATE TABLE IF NOT EXISTS public.restaurant_data (
 ALTER TABLE public.restaurant_data ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "Enable read access for all users" ON public.restaurant_data FOR SELECT USING (true);
 CREATE POLICY "Enable insert for authenticated users only" ON public.restaurant_data FOR INSERT WITH CHECK (true);
+
+-- 분석 유형별 집계 요약 함수 (supabase_chatbot이 RPC로 호출)
+-- 행을 내려받지 않고 서버에서 지표별 통계 · 지역/업종별 평균 · 범주 분포 · 상위/하위 가맹점을
+-- 계산해 작은 JSON 하나로 돌려줍니다. 함수가 없으면 앱은 행을 받아 같은 요약을 직접 계산합니다.
+-- p_filters: {"컬럼": "값"}은 같음 조건, {"컬럼": {"연산자": 값}}은 eq / in / gte / lte / ilike 조건
+--   (예: {"franchise_region": {"in": ["서울 성동구", "서울 강남구"]}, "base_year_month": {"gte": 202301, "lte": 202306}})
+CREATE OR REPLACE FUNCTION public.analysis_summary(
+    p_table TEXT,
+    p_metrics TEXT[],
+    p_categories TEXT[] DEFAULT '{}',
+    p_rank_metric TEXT DEFAULT NULL,
+    p_filters JSONB DEFAULT '{}'::jsonb,
+    p_top_n INTEGER DEFAULT 5,
+    p_group_limit INTEGER DEFAULT 10
+) RETURNS JSONB
+LANGUAGE plpgsql STABLE
+SET search_path = public
+AS $$
+DECLARE
+    v_where TEXT := 'TRUE';
+    v_stats TEXT;
+    v_avgs TEXT;
+    v_column TEXT;
+    v_direction TEXT;
+    v_part JSONB;
+    v_result JSONB;
+    v_distributions JSONB := '{}'::jsonb;
+BEGIN
+    IF p_table NOT IN ('cafe_data', 'revisit_data', 'restaurant_data') THEN
+        RAISE EXCEPTION 'unsupported table: %', p_table;
+    END IF;
+
+    -- 컬럼 이름은 %I, 값은 %L로 넣어 SQL 주입을 막음
+    SELECT coalesce(string_agg(condition, ' AND '), 'TRUE') INTO v_where FROM (
+        SELECT CASE
+            WHEN jsonb_typeof(f.value) <> 'object' THEN format('%I = %L', f.key, f.value #>> '{}')
+            ELSE (
+                SELECT string_agg(CASE op.key
+                    WHEN 'eq' THEN format('%I = %L', f.key, op.value #>> '{}')
+                    WHEN 'gte' THEN format('%I >= %L', f.key, op.value #>> '{}')
+                    WHEN 'lte' THEN format('%I <= %L', f.key, op.value #>> '{}')
+                    WHEN 'ilike' THEN format('%I ILIKE %L', f.key, op.value #>> '{}')
+                    WHEN 'in' THEN format('%I::text = ANY(%L::text[])', f.key,
+                                          ARRAY(SELECT jsonb_array_elements_text(op.value)))
+                END, ' AND ')
+                FROM jsonb_each(f.value) AS op
+            )
+        END AS condition
+        FROM jsonb_each(p_filters) AS f
+    ) conditions;
+
+    -- 전체 행 수 + 지표별 평균/최소/사분위수/최대
+    SELECT string_agg(format(
+        '%1$L, jsonb_build_object('
+        '''avg'', round(avg(%1$I)::numeric, 2), ''min'', min(%1$I), ''max'', max(%1$I), '
+        '''p25'', round((percentile_cont(0.25) WITHIN GROUP (ORDER BY %1$I))::numeric, 2), '
+        '''p50'', round((percentile_cont(0.5) WITHIN GROUP (ORDER BY %1$I))::numeric, 2), '
+        '''p75'', round((percentile_cont(0.75) WITHIN GROUP (ORDER BY %1$I))::numeric, 2))', metric), ', ')
+    INTO v_stats FROM unnest(p_metrics) AS metric;
+    EXECUTE format(
+        'SELECT jsonb_build_object(''row_count'', count(*), ''metrics'', jsonb_build_object(%s)) FROM %I WHERE %s',
+        coalesce(v_stats, ''), p_table, v_where
+    ) INTO v_result;
+
+    -- 지역별 · 업종별 가맹점 수와 지표 평균 (가맹점 수 상위 p_group_limit개 그룹)
+    SELECT string_agg(format('%1$L, round(avg(%1$I)::numeric, 2)', metric), ', ')
+    INTO v_avgs FROM unnest(p_metrics) AS metric;
+    FOREACH v_column IN ARRAY ARRAY['franchise_region', 'business_type'] LOOP
+        EXECUTE format(
+            'SELECT coalesce(jsonb_agg(g ORDER BY n DESC), ''[]''::jsonb) FROM ('
+            '  SELECT count(*) AS n, jsonb_build_object(''group'', %1$I, ''count'', count(*)) || jsonb_build_object(%2$s) AS g'
+            '  FROM %3$I WHERE %4$s AND %1$I IS NOT NULL GROUP BY %1$I ORDER BY count(*) DESC LIMIT %5$s'
+            ') s',
+            v_column, coalesce(v_avgs, ''), p_table, v_where, p_group_limit
+        ) INTO v_part;
+        v_result := v_result || jsonb_build_object('by_' || v_column, v_part);
+    END LOOP;
+
+    -- 범주형 컬럼 분포 (상위 p_group_limit개 값)
+    FOREACH v_column IN ARRAY p_categories LOOP
+        EXECUTE format(
+            'SELECT coalesce(jsonb_agg(jsonb_build_object(''value'', v, ''count'', n) ORDER BY n DESC), ''[]''::jsonb) FROM ('
+            '  SELECT %1$I AS v, count(*) AS n FROM %2$I WHERE %3$s AND %1$I IS NOT NULL'
+            '  GROUP BY %1$I ORDER BY count(*) DESC LIMIT %4$s'
+            ') s',
+            v_column, p_table, v_where, p_group_limit
+        ) INTO v_part;
+        v_distributions := v_distributions || jsonb_build_object(v_column, v_part);
+    END LOOP;
+    v_result := v_result || jsonb_build_object('distributions', v_distributions);
+
+    -- 기준 지표 상위/하위 가맹점
+    IF p_rank_metric IS NOT NULL THEN
+        FOREACH v_direction IN ARRAY ARRAY['DESC', 'ASC'] LOOP
+            EXECUTE format(
+                'SELECT coalesce(jsonb_agg(jsonb_build_object('
+                '  ''franchise_name'', franchise_name, ''franchise_region'', franchise_region,'
+                '  ''business_type'', business_type, %1$L, %1$I) ORDER BY %1$I %4$s), ''[]''::jsonb) FROM ('
+                '  SELECT franchise_name, franchise_region, business_type, %1$I FROM %2$I'
+                '  WHERE %3$s AND %1$I IS NOT NULL ORDER BY %1$I %4$s LIMIT %5$s'
+                ') s',
+                p_rank_metric, p_table, v_where, v_direction, p_top_n
+            ) INTO v_part;
+            v_result := v_result || jsonb_build_object(CASE v_direction WHEN 'DESC' THEN 'top' ELSE 'bottom' END, v_part);
+        END LOOP;
+        v_result := v_result || jsonb_build_object('rank_metric', p_rank_metric);
+    END IF;
+
+    RETURN v_result;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.analysis_summary(TEXT, TEXT[], TEXT[], TEXT, JSONB, INTEGER, INTEGER) TO anon, authenticated;
@@ -0,0 +1,238 @@
+"""CSV 입력 공통 데이터 접근 계층
+
+CSV 인코딩을 파일 앞부분 바이트 샘플로 한 번만 판별하고, 원본을 타입이 지정된
+Parquet 파일로 한 번 변환해 둡니다. 변환은 청크 단위로 스트리밍하므로 메모리 사용량이
+파일 크기와 무관합니다. 변환본은 원본 경로와 수정시각/크기/해시로 식별되며,
+이후 읽기는 메모리 매핑 + 필요한 컬럼만 읽는(column projection) 방식으로 처리합니다.
+pyarrow가 없으면 판별된 인코딩으로 CSV를 직접 읽습니다.
+"""
+import codecs
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 미설치 시 CSV 직접 읽기로 대체
+    pa = None
+    pq = None
+
+COLUMNAR_CACHE_DIR = os.getenv("COLUMNAR_CACHE_DIR", os.path.join(".cache", "columnar"))
+ENCODING_CANDIDATES = ['utf-8-sig', 'cp949', 'euc-kr', 'latin-1']
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+DEFAULT_BATCH_ROWS = 20000
+# Parquet 변환 시 한 번에 읽는 행 수 (= row group 크기)
+CONVERT_CHUNK_ROWS = DEFAULT_BATCH_ROWS * 5
+
+_convert_lock = threading.Lock()
+
+
+def detect_encoding(file_path, sample_bytes=ENCODING_SAMPLE_BYTES):
+    """파일 앞부분 바이트 샘플을 디코딩해 보고 인코딩을 판별합니다.
+
+    샘플 끝에서 잘린 멀티바이트 문자는 오류로 보지 않도록 증분 디코더를 사용합니다.
+    latin-1은 모든 바이트를 받아들이므로 마지막 후보로만 사용됩니다.
+    """
+    with open(file_path, "rb") as f:
+        sample = f.read(sample_bytes)
+    for encoding in ENCODING_CANDIDATES:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            decoder.decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def _sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_name(file_path):
+    """캐시 파일 이름 (다른 폴더의 같은 이름 파일과 겹치지 않도록 절대 경로 해시를 붙임)"""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    path_hash = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:12]
+    return f"{name}_{path_hash}"
+
+
+def _sidecar_path(file_path):
+    return os.path.join(COLUMNAR_CACHE_DIR, f"{_cache_name(file_path)}.source.json")
+
+
+def _load_sidecar(file_path):
+    try:
+        with open(_sidecar_path(file_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def source_info(file_path):
+    """원본의 수정시각/크기/해시/인코딩 정보를 반환합니다.
+
+    수정시각과 크기가 이전 기록과 같으면 해시와 인코딩을 다시 계산하지 않습니다.
+    """
+    stat = os.stat(file_path)
+    sidecar = _load_sidecar(file_path)
+    if sidecar and sidecar.get("mtime") == stat.st_mtime and sidecar.get("size") == stat.st_size:
+        return sidecar
+    info = {
+        "source": os.path.abspath(file_path),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha256": _sha256(file_path),
+        "encoding": detect_encoding(file_path),
+    }
+    os.makedirs(COLUMNAR_CACHE_DIR, exist_ok=True)
+    sidecar_tmp = _sidecar_path(file_path) + f".{os.getpid()}.tmp"
+    with open(sidecar_tmp, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    os.replace(sidecar_tmp, _sidecar_path(file_path))
+    return info
+
+
+def _columnar_path(file_path, info):
+    return os.path.join(COLUMNAR_CACHE_DIR, f"{_cache_name(file_path)}-{info['sha256'][:16]}.parquet")
+
+
+def _merge_kind(previous, dtype):
+    """청크별로 추론한 dtype을 파일 전체 기준 종류(bool/int64/float64/string)로 합칩니다."""
+    if pd.api.types.is_bool_dtype(dtype):
+        kind = "bool"
+    elif pd.api.types.is_integer_dtype(dtype):
+        kind = "int64"
+    elif pd.api.types.is_float_dtype(dtype):
+        kind = "float64"
+    else:
+        kind = "string"
+    if previous is None or previous == kind:
+        return kind
+    if {previous, kind} == {"int64", "float64"}:
+        return "float64"
+    # 문자열이 섞였거나 bool과 숫자가 섞이면 문자열로 통일
+    return "string"
+
+
+_ARROW_TYPES = {"bool": "bool_", "int64": "int64", "float64": "float64", "string": "string"}
+
+
+def _infer_schema(file_path, encoding):
+    """CSV를 청크로 한 번 훑어 컬럼별 타입을 정합니다 (전체를 한 번에 읽었을 때의 추론과 같은 규칙).
+
+    (컬럼 → pandas dtype, pyarrow 스키마)를 반환합니다.
+    """
+    kinds = {}
+    for chunk in pd.read_csv(file_path, encoding=encoding, chunksize=CONVERT_CHUNK_ROWS, low_memory=False):
+        for column, dtype in chunk.dtypes.items():
+            kinds[column] = _merge_kind(kinds.get(column), dtype)
+    if not kinds:
+        # 헤더만 있는 파일
+        columns = pd.read_csv(file_path, encoding=encoding, nrows=0).columns
+        kinds = {column: "string" for column in columns}
+    dtypes = {column: str if kind == "string" else kind for column, kind in kinds.items()}
+    schema = pa.schema([(column, getattr(pa, _ARROW_TYPES[kind])()) for column, kind in kinds.items()])
+    return dtypes, schema
+
+
+def ensure_columnar(file_path):
+    """원본 CSV에 대응하는 Parquet 변환본 경로를 반환합니다 (없거나 원본이 바뀌었으면 변환).
+
+    pyarrow가 없으면 None을 반환합니다.
+    """
+    if pq is None:
+        return None
+    with _convert_lock:
+        info = source_info(file_path)
+        parquet_path = _columnar_path(file_path, info)
+        if os.path.exists(parquet_path):
+            return parquet_path
+
+        if info["encoding"] is None:
+            raise ValueError(f"{file_path}: 지원되는 인코딩으로 CSV 파일을 읽을 수 없습니다.")
+
+        # 첫 번째 순회로 컬럼 타입을 파일 전체 기준으로 정하고, 두 번째 순회에서 청크씩 기록
+        # (파일 전체를 메모리에 올리지 않음, 1회성 변환 비용)
+        dtypes, schema = _infer_schema(file_path, info["encoding"])
+        os.makedirs(COLUMNAR_CACHE_DIR, exist_ok=True)
+        tmp_path = parquet_path + f".{os.getpid()}.tmp"
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            chunks = pd.read_csv(file_path, encoding=info["encoding"], dtype=dtypes,
+                                 chunksize=CONVERT_CHUNK_ROWS, low_memory=False)
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        os.replace(tmp_path, parquet_path)
+
+        # 이전 버전 변환본 정리
+        name = _cache_name(file_path)
+        for entry in os.listdir(COLUMNAR_CACHE_DIR):
+            if entry.startswith(f"{name}-") and entry.endswith(".parquet") and \
+                    os.path.join(COLUMNAR_CACHE_DIR, entry) != parquet_path:
+                os.remove(os.path.join(COLUMNAR_CACHE_DIR, entry))
+        return parquet_path
+
+
+def _existing_columns(parquet_path, columns):
+    if columns is None:
+        return None
+    available = set(pq.read_schema(parquet_path).names)
+    return [c for c in columns if c in available]
+
+
+def read_table(file_path, columns=None):
+    """CSV 데이터를 DataFrame으로 읽습니다. columns를 주면 해당 컬럼만 읽습니다."""
+    parquet_path = ensure_columnar(file_path)
+    if parquet_path is None:
+        encoding = source_info(file_path)["encoding"]
+        usecols = None if columns is None else (lambda c: c in set(columns))
+        return pd.read_csv(file_path, encoding=encoding, usecols=usecols, low_memory=False)
+    table = pq.read_table(parquet_path, columns=_existing_columns(parquet_path, columns), memory_map=True)
+    return table.to_pandas()
+
+
+def iter_frames(file_path, columns=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """CSV 데이터를 batch_rows 행 단위 DataFrame으로 순회합니다.
+
+    각 DataFrame의 인덱스는 파일 전체 기준 행 번호(0부터)입니다.
+    """
+    parquet_path = ensure_columnar(file_path)
+    if parquet_path is None:
+        encoding = source_info(file_path)["encoding"]
+        usecols = None if columns is None else (lambda c: c in set(columns))
+        # read_csv 청크는 이미 전체 기준 행 번호 인덱스를 가짐
+        yield from pd.read_csv(file_path, encoding=encoding, usecols=usecols,
+                               chunksize=batch_rows, low_memory=False)
+        return
+    parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+    offset = 0
+    for batch in parquet_file.iter_batches(batch_size=batch_rows,
+                                           columns=_existing_columns(parquet_path, columns)):
+        frame = batch.to_pandas()
+        frame.index = pd.RangeIndex(offset, offset + len(frame))
+        offset += len(frame)
+        yield frame
+
+
+def num_rows(file_path):
+    """행 수를 반환합니다 (Parquet 메타데이터에서 읽으므로 데이터를 스캔하지 않음)."""
+    parquet_path = ensure_columnar(file_path)
+    if parquet_path is None:
+        return sum(len(frame) for frame in iter_frames(file_path))
+    return pq.ParquetFile(parquet_path, memory_map=True).metadata.num_rows
+
+
+def column_names(file_path):
+    """컬럼 이름 목록을 반환합니다."""
+    parquet_path = ensure_columnar(file_path)
+    if parquet_path is None:
+        encoding = source_info(file_path)["encoding"]
+        return list(pd.read_csv(file_path, encoding=encoding, nrows=0).columns)
+    return pq.read_schema(parquet_path).names
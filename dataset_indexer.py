@@ -0,0 +1,339 @@
+"""CSV 데이터셋 인덱싱 (Streamlit 비의존)
+
+gemini_rag.py의 인덱싱 로직을 화면 코드와 분리한 모듈입니다. 진행 상황은 콜백으로만
+알리므로 백그라운드 스레드나 오프라인 스크립트에서도 그대로 사용할 수 있습니다.
+"""
+import atexit
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from langchain_community.vectorstores import Chroma
+
+import data_access
+import embedding_pipeline
+import embedding_service
+import index_store
+import row_documents
+import sampling
+import shard_filter
+import vector_store
+
+# 임베딩 모델 설정 (인덱스 매니페스트에 기록되어 재사용 여부 판단에 사용)
+EMBEDDING_MODEL_NAME = embedding_service.DEFAULT_MODEL_NAME
+
+
+# 데이터셋별 문서 본문 컬럼 (나머지 컬럼은 메타데이터로 저장, None이면 전체 컬럼을 본문에 사용)
+ROW_DOCUMENT_COLUMNS = {
+    "Q1_data.csv": [
+        '가맹점명', '업종', '가맹점지역', '상권', '남성비중', '여성비중', '성비차이',
+        '연령집중도', '주요고객층', '충성도지수', '상권유형', '고객유형',
+    ],
+    "Q2_data.csv": [
+        '가맹점명', '업종', '가맹점지역', '상권', '기준년월', '월간매출액', '월간이용건수',
+        '월간이용고객수', '월평균객단가', '배달매출비율', '재방문고객비율', '신규고객비율',
+        '거주이용고객비율', '직장이용고객비율', '유동인구이용고객비율', '업종평균재방문률',
+        '상권평균재방문률', '재방문률변화', '재방문률_3개월평균', '업종대비차이', '재방문률_등급',
+    ],
+    "Q3_data.csv": [
+        '가맹점명', '업종', '가맹점지역', '상권', '기준년월', '월간매출액', '월간이용건수',
+        '월간이용고객수', '월평균객단가', '배달매출비율',
+        '남성20대이하비율', '남성30대비율', '남성40대비율', '남성50대비율', '남성60대이상비율',
+        '여성20대이하비율', '여성30대비율', '여성40대비율', '여성50대비율', '여성60대이상비율',
+        '재방문고객비율', '신규고객비율', '거주이용고객비율', '직장이용고객비율', '유동인구이용고객비율',
+        '업종평균매출', '매출_업종차이', '재방문률_업종차이', '매출효율', '재방문률등급',
+    ],
+}
+
+
+# 벡터 스토어 삭제 배치 크기 (Chroma 최대 배치 크기 이하)
+INDEX_BATCH_SIZE = 1000
+# 한 번에 지문 계산 · 임베딩하는 행 수 (이 구간 단위로만 문서를 메모리에 유지)
+INDEX_WINDOW_ROWS = 100000
+
+
+def document_settings_for(file_path, use_sample=False):
+    """문서 생성 방식 설정 (바뀌면 매니페스트가 달라져 인덱스를 다시 빌드)"""
+    return {
+        "builder": "row_document",
+        "content_columns": ROW_DOCUMENT_COLUMNS.get(os.path.basename(file_path)),
+        "sampler": f"{sampling.SAMPLER_VERSION}:seed{sampling.DEFAULT_SEED}" if use_sample else None,
+        "shard_columns": list(shard_filter.SHARD_COLUMNS),
+    }
+
+
+# 벡터 스토어 종류: Chroma 또는 메모리 매핑 양자화 스토어(float16 / int8)
+VECTOR_STORE_BACKENDS = {
+    "chroma": "Chroma (기본)",
+    "float16": "양자화 float16 (memmap)",
+    "int8": "양자화 int8 (memmap)",
+}
+
+
+# 메모리 전용 양자화 스토어가 쓰는 임시 폴더 (컬렉션 이름별 최신 폴더, 프로세스 종료 시 삭제)
+_temp_store_dirs = {}
+_temp_store_lock = threading.Lock()
+
+
+def _remove_temp_store_dirs():
+    with _temp_store_lock:
+        for store_dir in _temp_store_dirs.values():
+            shutil.rmtree(store_dir, ignore_errors=True)
+        _temp_store_dirs.clear()
+
+
+atexit.register(_remove_temp_store_dirs)
+
+
+def _temp_store_dir(collection_name):
+    """컬렉션의 새 임시 폴더를 만들고 같은 컬렉션의 이전 폴더는 지웁니다."""
+    store_dir = tempfile.mkdtemp(prefix=f"{collection_name}_")
+    with _temp_store_lock:
+        previous = _temp_store_dirs.get(collection_name)
+        _temp_store_dirs[collection_name] = store_dir
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+    return store_dir
+
+
+def memory_collection_name(file_path, use_sample=False, sample_ratio=0.1, backend="chroma"):
+    """메모리 전용 빌드의 컬렉션 이름 (인덱스 폴더 이름과 같은 규칙: 파일 · 샘플링 · 스토어 종류별)"""
+    return os.path.basename(index_store.index_dir_for(file_path, use_sample, sample_ratio, backend))
+
+
+def open_vectorstore(store_dir, embeddings, backend="chroma", collection_name="langchain"):
+    """벡터 스토어를 엽니다.
+
+    store_dir가 None이면 메모리/임시 폴더에 빈 스토어를 새로 만듭니다 (같은 이름의 이전 내용은 버림).
+    """
+    if backend == "chroma":
+        if store_dir is None:
+            # 메모리 클라이언트는 프로세스 공용이라 이전 빌드의 행이 남지 않도록 컬렉션을 비움
+            vectorstore = Chroma(collection_name=collection_name, embedding_function=embeddings)
+            vectorstore.delete_collection()
+            return Chroma(collection_name=collection_name, embedding_function=embeddings)
+        return Chroma(persist_directory=store_dir, embedding_function=embeddings)
+    if store_dir is None:
+        store_dir = _temp_store_dir(collection_name)
+    return vector_store.QuantizedVectorStore(store_dir, embeddings, dtype=backend,
+                                             shard_columns=shard_filter.SHARD_COLUMNS)
+
+
+def attach_ann(vectorstore, ann_backend="flat", ann_params=None):
+    """양자화 스토어에 ANN 인덱스를 붙입니다 (Chroma는 자체 HNSW를 사용하므로 그대로 둠)."""
+    if isinstance(vectorstore, vector_store.QuantizedVectorStore):
+        vectorstore.ensure_ann(ann_backend, **json.loads(ann_params or "{}"))
+    return vectorstore
+
+
+def write_vectors(vectorstore, ids, vectors, texts, metadatas):
+    """미리 계산한 벡터를 벡터 스토어에 그대로 기록합니다 (스토어가 다시 임베딩하지 않음)."""
+    if isinstance(vectorstore, vector_store.QuantizedVectorStore):
+        vectorstore.upsert_embeddings(ids, vectors, texts, metadatas)
+    else:
+        vectorstore._collection.upsert(
+            ids=ids,
+            embeddings=[list(map(float, v)) for v in vectors],
+            documents=texts,
+            metadatas=metadatas,
+        )
+
+
+def embed_into_vectorstore(vectorstore, pool, service, docs, doc_ids, on_progress=None):
+    """문서를 임베딩해 벡터 스토어에 기록합니다.
+
+    벡터 캐시에 있는 텍스트는 바로 기록하고, 나머지는 (같은 텍스트는 한 번만) 임베딩 풀에서
+    배치 계산해 캐시에 저장한 뒤 배치가 끝나는 대로 기록합니다.
+    """
+    texts = [doc.page_content for doc in docs]
+    keys = service.keys_for(texts)
+    found = service.cache.get_many(keys)
+
+    def upsert(positions, vectors):
+        write_vectors(
+            vectorstore,
+            [doc_ids[i] for i in positions],
+            vectors,
+            [texts[i] for i in positions],
+            [docs[i].metadata for i in positions],
+        )
+
+    pending = {}
+    hit_positions = []
+    for i, key in enumerate(keys):
+        if key in found:
+            hit_positions.append(i)
+        else:
+            pending.setdefault(key, []).append(i)
+    for batch in index_store.batched(hit_positions, INDEX_BATCH_SIZE):
+        upsert(batch, [found[keys[i]] for i in batch])
+
+    unique_keys = list(pending)
+    unique_texts = [texts[pending[key][0]] for key in unique_keys]
+    for indices, vectors in pool.embed(unique_texts, on_progress):
+        service.cache.put_many([(unique_keys[j], vector) for j, vector in zip(indices, vectors)])
+        positions = []
+        position_vectors = []
+        for j, vector in zip(indices, vectors):
+            for i in pending[unique_keys[j]]:
+                positions.append(i)
+                position_vectors.append(vector)
+        upsert(positions, position_vectors)
+
+
+def _no_report(kind, message, fraction=None):
+    pass
+
+
+def index_dataset(file_path, file_name, use_sample=False, sample_ratio=0.1, persist=True,
+                  embed_batch_size=embedding_pipeline.DEFAULT_BATCH_SIZE,
+                  embed_workers=embedding_pipeline.DEFAULT_WORKERS,
+                  store_backend="chroma", ann_backend="flat", ann_params=None,
+                  report=None, pool=None):
+    """개별 CSV 파일을 로드하고 벡터 스토어를 생성해 (벡터 스토어, 문서 수)를 반환합니다.
+
+    CSV를 청크 단위로 스트리밍하며 행마다 문서 1개를 만들어 INDEX_WINDOW_ROWS 구간씩
+    임베딩합니다. persist=True이면 인덱스를 디스크(index/)에 저장하고, 원본 해시와 설정이
+    같으면 저장된 인덱스를 그대로 엽니다. 원본만 바뀐 경우에는 행 지문을 비교해
+    추가/변경된 행만 임베딩하고 삭제된 행의 벡터를 지웁니다.
+    임베딩은 embed_batch_size 단위 배치를 embed_workers개 프로세스에 나눠 계산합니다.
+    store_backend가 "float16"/"int8"이면 Chroma 대신 메모리 매핑 양자화 스토어에 저장하고,
+    ann_backend("flat"/"hnsw"/"ivfpq")와 ann_params(JSON 문자열)로 검색 인덱스를 고릅니다.
+
+    Streamlit을 호출하지 않으므로 백그라운드 스레드에서 실행할 수 있습니다. 진행 상황은
+    report(kind, message, fraction)으로 알리며 kind는 "info"(단계 안내) 또는 "progress"(임베딩 진행,
+    fraction은 읽은 행 비율)입니다.
+    pool(EmbeddingPool)을 넘기면 여러 데이터셋이 워커 프로세스를 공유합니다.
+    오류는 예외로 전달합니다.
+    """
+    csv_file_path = file_path
+    report = report or _no_report
+
+    # 모든 데이터셋과 질의가 모델 1개 + 디스크 벡터 캐시를 공유
+    embeddings = embedding_service.get_embedding_service(EMBEDDING_MODEL_NAME)
+    document_settings = document_settings_for(csv_file_path, use_sample)
+
+    index_dir = None
+    manifest = None
+    if persist:
+        index_dir = index_store.index_dir_for(csv_file_path, use_sample, sample_ratio, store_backend)
+        previous = index_store.load_manifest(index_dir)
+        manifest = index_store.build_manifest(
+            csv_file_path,
+            data_access.source_info(csv_file_path)["sha256"],
+            EMBEDDING_MODEL_NAME,
+            document_settings,
+            use_sample,
+            sample_ratio,
+            {"backend": store_backend},
+        )
+        if index_store.is_index_reusable(index_dir, manifest):
+            vectorstore = open_vectorstore(index_dir, embeddings, store_backend)
+            attach_ann(vectorstore, ann_backend, ann_params)
+            report("info", f"💾 {file_name}: 저장된 인덱스 재사용 ({previous['created_at']} 생성)")
+            return vectorstore, previous["doc_count"]
+
+    used_encoding = data_access.source_info(csv_file_path)["encoding"]
+    if used_encoding is None:
+        raise ValueError(f"{file_name}: 지원되는 인코딩으로 CSV 파일을 읽을 수 없습니다.")
+
+    total_rows = data_access.num_rows(csv_file_path)
+    report("info", f"✅ {file_name} 인코딩: {used_encoding} ({total_rows:,}행)")
+
+    frames = data_access.iter_frames(csv_file_path)
+    if use_sample:
+        # 읽는 도중 지역 × 업종 구간별로 선택된 행만 문서로 만듦
+        sampler = sampling.StratifiedSampler.for_file(csv_file_path, sample_ratio)
+        frames = sampler.filter_frames(frames)
+        report(
+            "info",
+            f"📊 {file_name} 층화 샘플링: {sampler.sample_size:,}개 / {total_rows:,}개 레코드 사용 "
+            f"({sampler.strata:,}개 구간)"
+        )
+
+    documents = row_documents.iter_row_documents(
+        frames,
+        document_settings["content_columns"],
+        source=csv_file_path,
+        metadata_columns=shard_filter.SHARD_COLUMNS,
+    )
+
+    # 저장 위치 준비: 증분 갱신 / 전체 재빌드 / 메모리 전용
+    stored_rows = {}
+    incremental = persist and index_store.is_index_updatable(index_dir, manifest)
+    if incremental:
+        stored_rows = index_store.load_row_index(index_dir)
+        vectorstore = open_vectorstore(index_dir, embeddings, store_backend)
+        # 갱신 도중 중단되면 재사용되지 않도록 해시를 먼저 무효화 (다음 실행에서 다시 증분 갱신)
+        index_store.save_manifest(index_dir, dict(manifest, source_hash=None))
+    elif persist:
+        # 전체 빌드 (매니페스트는 빌드가 끝난 뒤에만 기록 → 중단된 빌드는 재사용되지 않음)
+        index_store.reset_index_dir(index_dir)
+        vectorstore = open_vectorstore(index_dir, embeddings, store_backend)
+    else:
+        # 메모리 클라이언트는 프로세스 내에서 공유되므로 데이터셋 · 샘플링 · 스토어 설정별 컬렉션으로 분리
+        collection_name = memory_collection_name(csv_file_path, use_sample, sample_ratio, store_backend)
+        vectorstore = open_vectorstore(None, embeddings, store_backend, collection_name)
+
+    start_time = time.time()
+    fingerprint = index_store.RowFingerprinter()
+    current_rows = {}
+    doc_count = 0
+    embedded_count = 0
+
+    with contextlib.ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(
+                embedding_pipeline.EmbeddingPool(EMBEDDING_MODEL_NAME, embed_batch_size, embed_workers)
+            )
+        for window in row_documents.windows(documents, INDEX_WINDOW_ROWS):
+            row_ids = [fingerprint(doc.page_content) for doc in window]
+            current_rows.update((row_id, 1) for row_id in row_ids)
+            new_docs = [doc for row_id, doc in zip(row_ids, window) if row_id not in stored_rows]
+            new_ids = [
+                index_store.chunk_ids_for(row_id, 1)[0]
+                for row_id in row_ids if row_id not in stored_rows
+            ]
+
+            def on_progress(done, total, elapsed, base=embedded_count, read=doc_count + len(window)):
+                rate = (base + done) / max(time.time() - start_time, 1e-6)
+                report(
+                    "progress",
+                    f"🧠 {file_name}: {read:,}/{total_rows:,}행 읽음 · {base + done:,}행 임베딩 "
+                    f"({rate:,.0f} rows/s, 워커 {pool.workers}개)",
+                    read / max(total_rows, 1),
+                )
+
+            embed_into_vectorstore(vectorstore, pool, embeddings, new_docs, new_ids, on_progress)
+            doc_count += len(window)
+            embedded_count += len(new_docs)
+    if isinstance(vectorstore, vector_store.QuantizedVectorStore):
+        vectorstore.flush()
+
+    if not persist:
+        return attach_ann(vectorstore, ann_backend, ann_params), doc_count
+
+    removed = index_store.removed_rows(stored_rows, current_rows)
+    removed_ids = [
+        chunk_id
+        for row_id in removed
+        for chunk_id in index_store.chunk_ids_for(row_id, stored_rows[row_id])
+    ]
+    for batch in index_store.batched(removed_ids, INDEX_BATCH_SIZE):
+        vectorstore.delete(ids=batch)
+
+    attach_ann(vectorstore, ann_backend, ann_params)
+    index_store.save_row_index(index_dir, current_rows)
+    index_store.finalize_manifest(index_dir, manifest, doc_count, len(current_rows))
+    if incremental:
+        report(
+            "info",
+            f"🔁 {file_name} 증분 갱신: 추가 {embedded_count:,}행 / 삭제 {len(removed):,}행 "
+            f"(전체 {doc_count:,}행)"
+        )
+
+    return vectorstore, doc_count
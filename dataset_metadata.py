@@ -0,0 +1,148 @@
+"""데이터 파일 옆에 두는 메타데이터 파일 (<이름>.meta.json)
+
+병합 · 업로드 단계에서 데이터를 이미 메모리에 올린 김에 지역/업종 목록, 행 수,
+컬럼별 결측률과 최솟값/최댓값, 원본 해시를 작은 JSON으로 남겨 둡니다.
+앱은 시작할 때 원본을 훑는 대신 이 파일을 읽고, 파일이 없거나 원본이 바뀌었으면
+(수정시각/크기가 기록과 다르면) 기존처럼 원본을 읽습니다.
+"""
+import json
+import os
+import time
+
+import pandas as pd
+
+import data_access
+from sampling import BUSINESS_COLUMNS, REGION_COLUMNS
+
+METADATA_VERSION = 1
+
+# Supabase 테이블 → 업로드 원본 (supabase_chatbot이 테이블 행 수를 찾을 때 사용)
+TABLE_SOURCES = {
+    "cafe_data": os.path.join("file", "Q1_data.csv"),
+    "revisit_data": os.path.join("file", "Q2_data.csv"),
+    "restaurant_data": os.path.join("file", "Q3_data.csv"),
+}
+
+
+def metadata_path(data_path):
+    """file/Q1_data.csv → file/Q1_data.meta.json"""
+    return os.path.splitext(data_path)[0] + ".meta.json"
+
+
+def _first_column(columns, candidates):
+    for column in candidates:
+        if column in columns:
+            return column
+    return None
+
+
+def _json_value(value):
+    if value is None or pd.isna(value):
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    return value
+
+
+def _distinct_strings(series):
+    return sorted(v for v in series.dropna().unique().tolist() if isinstance(v, str) and v.strip())
+
+
+def build_metadata(df, data_path, region_column=None, business_column=None):
+    """메모리에 있는 데이터프레임과 저장된 원본 파일로 메타데이터 dict를 만듭니다."""
+    region_column = region_column or _first_column(df.columns, REGION_COLUMNS)
+    business_column = business_column or _first_column(df.columns, BUSINESS_COLUMNS)
+    info = data_access.source_info(data_path)
+
+    total = len(df)
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        stats = {"null_rate": round(float(series.isnull().sum()) / total, 4) if total else 0.0}
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            stats["min"] = _json_value(series.min())
+            stats["max"] = _json_value(series.max())
+        columns[column] = stats
+
+    return {
+        "version": METADATA_VERSION,
+        "source": os.path.basename(data_path),
+        "mtime": info["mtime"],
+        "size": info["size"],
+        "sha256": info["sha256"],
+        "row_count": total,
+        "columns": columns,
+        "region_column": region_column,
+        "regions": _distinct_strings(df[region_column]) if region_column else [],
+        "business_column": business_column,
+        "business_types": _distinct_strings(df[business_column]) if business_column else [],
+        "created_at": time.time(),
+    }
+
+
+def write_metadata(data_path, metadata):
+    """메타데이터를 데이터 파일 옆에 원자적으로 기록하고 경로를 반환합니다."""
+    path = metadata_path(data_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def update_metadata(data_path, **fields):
+    """기존 메타데이터에 값(업로드 테이블, 업로드 행 수 등)을 덧붙입니다. 파일이 없으면 None."""
+    metadata = _read(metadata_path(data_path))
+    if metadata is None:
+        return None
+    metadata.update(fields)
+    return write_metadata(data_path, metadata)
+
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_metadata(data_path):
+    """원본과 맞는 메타데이터를 반환합니다. 없거나 원본이 바뀌었으면 None.
+
+    원본 파일이 없는 배포 환경(Supabase 앱 등)에서는 메타데이터를 그대로 믿습니다.
+    해시를 다시 계산하지 않고 수정시각/크기만 비교하므로 원본 크기와 무관하게 빠릅니다.
+    """
+    metadata = _read(metadata_path(data_path))
+    if metadata is None or metadata.get("version") != METADATA_VERSION:
+        return None
+    try:
+        stat = os.stat(data_path)
+    except OSError:
+        return metadata
+    if metadata.get("mtime") != stat.st_mtime or metadata.get("size") != stat.st_size:
+        return None
+    return metadata
+
+
+def _table_metadata(table_name):
+    """table_name으로 업로드된 원본의 메타데이터 (업로드 기록이 없으면 None)"""
+    source = TABLE_SOURCES.get(table_name)
+    metadata = load_metadata(source) if source else None
+    if not metadata or metadata.get("table") != table_name:
+        return None
+    return metadata
+
+
+def table_row_count(table_name):
+    """업로드 단계가 기록한 Supabase 테이블 행 수 (기록이 없으면 None)"""
+    metadata = _table_metadata(table_name)
+    return metadata.get("uploaded_rows") if metadata else None
+
+
+def table_fingerprint(table_name):
+    """업로드한 원본 해시와 행 수로 만든 테이블 내용 식별 문자열 (기록이 없으면 None)"""
+    metadata = _table_metadata(table_name)
+    if not metadata or not metadata.get("sha256"):
+        return None
+    return f"{metadata['sha256']}:{metadata.get('uploaded_rows')}"
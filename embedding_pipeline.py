@@ -0,0 +1,115 @@
+"""CSV 인덱싱용 배치 · 멀티프로세스 임베딩 파이프라인
+
+텍스트를 길이순으로 정렬해 비슷한 길이끼리 배치로 묶고(패딩 낭비 감소), 배치를
+프로세스 풀에 나눠 임베딩합니다. 워커마다 모델을 하나씩 올리며, 결과는 끝나는
+대로 (인덱스 목록, 벡터 목록) 형태로 내보내 호출 측에서 바로 저장할 수 있습니다.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+DEFAULT_WORKERS = int(os.getenv("EMBED_WORKERS", "0")) or max(1, (os.cpu_count() or 1) - 1)
+
+# 워커 프로세스별 모델 (프로세스 초기화 시 1회 로드)
+_worker_model = None
+
+
+def _init_worker(model_name, torch_threads):
+    """워커 프로세스 초기화: 모델 복제본을 1개 로드합니다."""
+    global _worker_model
+    try:
+        import torch
+        # 워커 수 × 스레드 수가 코어 수를 넘지 않도록 제한
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _embed_batch(indices, texts):
+    """배치 하나를 임베딩합니다 (워커 프로세스에서 실행)."""
+    vectors = _worker_model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+    return indices, vectors.tolist()
+
+
+def length_sorted_batches(texts, batch_size=DEFAULT_BATCH_SIZE):
+    """텍스트 길이순으로 정렬한 인덱스를 batch_size 단위로 나눕니다."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+class EmbeddingPool:
+    """워커 프로세스(모델 복제본)를 유지하며 여러 번 임베딩 요청을 처리하는 풀
+
+    여러 구간(window)을 차례로 임베딩할 때 구간마다 모델을 다시 로드하지 않도록
+    with 블록 동안 워커를 살려 둡니다.
+    """
+
+    def __init__(self, model_name, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers == 1:
+            # 단일 워커면 프로세스 풀 없이 현재 프로세스에서 처리
+            _init_worker(self.model_name, os.cpu_count() or 1)
+        else:
+            torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+            # fork는 스레드를 쓰는 부모(Streamlit, torch)에서 교착될 수 있어 spawn 사용
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                             initializer=_init_worker,
+                                             initargs=(self.model_name, torch_threads))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=exc_type is not None)
+            self._pool = None
+        return False
+
+    def embed(self, texts, on_progress=None):
+        """텍스트를 배치 단위로 임베딩하며 (인덱스 목록, 벡터 목록)을 끝나는 순서대로 반환합니다.
+
+        on_progress(done, total, elapsed_seconds)가 주어지면 배치가 끝날 때마다 호출됩니다.
+        """
+        total = len(texts)
+        if total == 0:
+            return
+        batches = length_sorted_batches(texts, self.batch_size)
+        start_time = time.time()
+        done = 0
+
+        if self._pool is None:
+            for indices in batches:
+                result = _embed_batch(indices, [texts[i] for i in indices])
+                done += len(indices)
+                if on_progress:
+                    on_progress(done, total, time.time() - start_time)
+                yield result
+            return
+
+        pending = set()
+        batch_iter = iter(batches)
+        # 동시에 대기하는 배치를 워커 수의 2배로 제한 (결과 벡터가 메모리에 쌓이지 않도록)
+        max_in_flight = self.workers * 2
+        while True:
+            while len(pending) < max_in_flight:
+                indices = next(batch_iter, None)
+                if indices is None:
+                    break
+                pending.add(self._pool.submit(_embed_batch, indices, [texts[i] for i in indices]))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                indices, vectors = future.result()
+                done += len(indices)
+                if on_progress:
+                    on_progress(done, total, time.time() - start_time)
+                yield indices, vectors
@@ -0,0 +1,178 @@
+"""프로세스 공용 임베딩 서비스 + 디스크 벡터 캐시
+
+임베딩 모델을 프로세스당 한 번만 로드해 모든 데이터셋과 질의가 공유하고,
+계산한 벡터를 정규화 텍스트 해시 기준으로 디스크(SQLite)에 저장해 재실행 시에도
+재사용합니다. 캐시는 항목 수 상한을 넘으면 가장 오래 쓰지 않은 항목부터 지웁니다(LRU).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# 인덱싱 · 질의 · 답변 캐시가 함께 쓰는 기본 임베딩 모델
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+# 질의 벡터용 메모리 LRU 크기 (사이드바 예시 질문 등 반복 질의)
+QUERY_MEMORY_CACHE_SIZE = 1024
+# SQLite 변수 개수 제한을 넘지 않도록 조회 단위 제한
+_LOOKUP_BATCH = 500
+
+
+def normalize_text(text):
+    """캐시 키용 정규화: 유니코드 NFC, 앞뒤 공백 제거, 연속 공백 축약"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model_name, text):
+    """모델 이름 + 정규화 텍스트의 해시"""
+    return hashlib.sha1(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class VectorCache:
+    """정규화 텍스트 해시 → 벡터를 저장하는 크기 제한 디스크 캐시 (LRU 삭제)"""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_last_used ON vectors(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def get_many(self, keys):
+        """키 목록 중 캐시에 있는 항목을 {키: 벡터(float32 배열)}로 반환하고 사용 시각을 갱신합니다."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique_keys), _LOOKUP_BATCH):
+                batch = unique_keys[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                self._conn.executemany(
+                    "UPDATE vectors SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """(키, 벡터) 목록을 저장하고 상한을 넘으면 오래된 항목을 지웁니다."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO vectors (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                # 상한의 90%까지 한 번에 줄여 삭제가 매번 일어나지 않도록 함
+                excess = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM vectors WHERE key IN ("
+                    " SELECT key FROM vectors ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self._count -= excess
+            self._conn.commit()
+
+    def stats(self):
+        """캐시 항목 수와 적중/미스 횟수"""
+        return {"entries": self._count, "hits": self.hits, "misses": self.misses}
+
+
+class EmbeddingService(Embeddings):
+    """모델 1개 + 디스크 캐시를 공유하는 LangChain 호환 임베딩 서비스"""
+
+    def __init__(self, model_name, cache=None):
+        self.model_name = model_name
+        self.cache = cache if cache is not None else VectorCache()
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._query_memory = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """HuggingFace 임베딩 모델 (처음 필요할 때 한 번만 로드)"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+        return self._model
+
+    def keys_for(self, texts):
+        """텍스트 목록의 캐시 키 목록"""
+        return [cache_key(self.model_name, text) for text in texts]
+
+    def embed_documents(self, texts):
+        """캐시에 없는 (정규화 기준) 고유 텍스트만 모델로 임베딩합니다."""
+        texts = list(texts)
+        keys = self.keys_for(texts)
+        found = self.cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.model.embed_documents(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in computed)
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        """질의 임베딩: 메모리 LRU → 디스크 캐시 → 모델 순으로 조회합니다."""
+        key = cache_key(self.model_name, text)
+        with self._query_lock:
+            if key in self._query_memory:
+                self._query_memory.move_to_end(key)
+                return self._query_memory[key]
+        cached = self.cache.get_many([key])
+        if key in cached:
+            vector = cached[key].tolist()
+        else:
+            vector = self.model.embed_query(text)
+            self.cache.put_many([(key, vector)])
+        with self._query_lock:
+            self._query_memory[key] = vector
+            if len(self._query_memory) > QUERY_MEMORY_CACHE_SIZE:
+                self._query_memory.popitem(last=False)
+        return vector
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name):
+    """모델 이름별 프로세스 공용 임베딩 서비스를 반환합니다."""
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingService(model_name)
+        return _services[model_name]
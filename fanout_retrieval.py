@@ -0,0 +1,117 @@
+"""통합분석용 다중 데이터셋 동시 검색
+
+Q1/Q2/Q3 리트리버를 스레드 풀에서 동시에 실행하고, 결과를 관련도 순으로 합쳐
+공용 k개 안에서 중복 없이 고릅니다. 검색 지연은 세 검색의 합이 아니라 가장 느린
+검색 하나에 맞춰지며, 답변은 합친 문서로 LLM을 한 번만 호출해 만듭니다.
+검색 단계 예산(llm_resilience)을 넘긴 데이터셋은 기다리지 않고 제외합니다.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+import llm_resilience
+
+logger = logging.getLogger(__name__)
+
+# 데이터셋 이름 → 문서 앞에 붙이는 출처 표시
+DATASET_LABELS = {"Q1": "Q1 카페", "Q2": "Q2 재방문율", "Q3": "Q3 요식업"}
+# 모든 세션이 공유하는 검색 스레드 수 (동시 통합 질문 수 × 데이터셋 수 정도)
+FANOUT_WORKERS = 12
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+        return _executor
+
+
+def merge_hits(hits_by_source, k, min_per_source=1):
+    """데이터셋별 (문서, 관련도) 목록을 합쳐 최대 k개를 고릅니다.
+
+    각 데이터셋의 상위 min_per_source개를 먼저 넣고(관련도 척도가 데이터셋마다 조금씩
+    달라 한 데이터셋이 독차지하지 않도록), 남은 자리는 전체 관련도 순으로 채웁니다.
+    본문이 같은 문서는 한 번만 넣습니다.
+    """
+    ranked = {
+        source: sorted(hits, key=lambda hit: hit[1], reverse=True)
+        for source, hits in hits_by_source.items()
+    }
+    selected = []
+    seen = set()
+
+    def take(source, doc, score):
+        if len(selected) >= k or doc.page_content in seen:
+            return
+        seen.add(doc.page_content)
+        selected.append((source, doc, score))
+
+    def by_score(items):
+        return sorted(items, key=lambda item: item[2], reverse=True)
+
+    reserved = by_score(
+        (source, doc, score) for source, hits in ranked.items() for doc, score in hits[:min_per_source]
+    )
+    rest = by_score(
+        (source, doc, score) for source, hits in ranked.items() for doc, score in hits[min_per_source:]
+    )
+    for source, doc, score in reserved + rest:
+        take(source, doc, score)
+    selected.sort(key=lambda item: item[2], reverse=True)
+    return selected
+
+
+class FanOutRetriever(BaseRetriever):
+    """여러 데이터셋 리트리버를 동시에 검색해 관련도 순으로 합치는 리트리버
+
+    retrievers는 {데이터셋 이름: search_with_scores(query)를 가진 리트리버}입니다
+    (shard_filter.ShardedRetriever). 한 데이터셋 검색이 실패해도 나머지 결과로 답합니다.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    retrievers: dict[str, Any]
+    k: int = 8
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        executor = _get_executor()
+        futures = {
+            source: executor.submit(retriever.search_with_scores, query)
+            for source, retriever in self.retrievers.items()
+        }
+        wait(futures.values(), timeout=llm_resilience.remaining_budget())
+        hits_by_source = {}
+        for source, future in futures.items():
+            if not future.done():
+                future.cancel()
+                logger.warning("fan-out retrieval: %s 검색이 예산 안에 끝나지 않아 제외합니다", source)
+                continue
+            try:
+                hits_by_source[source] = future.result()
+            except Exception as e:
+                logger.warning("fan-out retrieval: %s 검색 실패, 제외합니다: %s", source, e)
+        if not hits_by_source and futures:
+            if not all(future.done() for future in futures.values()):
+                raise llm_resilience.DeadlineExceeded("검색 시간 예산을 초과했습니다.")
+            raise RuntimeError("모든 데이터셋 검색에 실패했습니다.")
+
+        docs = []
+        for source, doc, score in merge_hits(hits_by_source, self.k):
+            label = DATASET_LABELS.get(source, source)
+            docs.append(Document(
+                page_content=f"[{label}] {doc.page_content}",
+                metadata=dict(doc.metadata, dataset=source, relevance=score),
+            ))
+        return docs
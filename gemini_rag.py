@@ -1,30 +1,41 @@
 import time
 import os
+import json
+import hashlib
 import uuid
 import warnings
 from typing import Dict, List, Any, Optional
-from langchain_huggingface import HuggingFaceEmbeddings
-import pandas as pd
-import requests
 from datetime import datetime
 
 # Deprecation 경고 무시
 warnings.filterwarnings('ignore', category=DeprecationWarning)
-from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import CSVLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from langchain.chains import create_history_aware_retriever
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
 from dotenv import load_dotenv
 import streamlit as st
 
+import ann_index
+import answer_cache
+import context_budget
+import conversation_memory
+import background_indexing
+import data_access
+import dataset_indexer
+import dataset_metadata
+import embedding_pipeline
+import embedding_service
+import fanout_retrieval
+import latency_metrics
+import llm_gateway
+import llm_resilience
+import perf_panel
+import query_rewrite
+import shard_filter
+import turn_tracing
+import weather_cache
+from rag_chain import classify_question, create_specialized_rag_chain
+
 # 환경변수 로드 (인코딩 문제 처리)
 try:
     load_dotenv(encoding='utf-8')
@@ -37,6 +48,9 @@ except:
         except:
             pass  # .env 없이도 계속 진행
 
+# Prometheus 지표 · 턴 기록 HTTP 내보내기 (TRACE_METRICS_PORT를 지정한 경우)
+turn_tracing.start_metrics_server()
+
 # 페이지 설정
 st.set_page_config(page_title="상업 시설 데이터 분석", page_icon="🏪", layout="wide")
 
@@ -49,28 +63,31 @@ if "id" not in st.session_state:
     st.session_state.rag_chain_q1 = None
     st.session_state.rag_chain_q2 = None
     st.session_state.rag_chain_q3 = None
+    st.session_state.rag_chain_all = None
     st.session_state.weather_mode = False
     st.session_state.weather_data = None
     st.session_state.weather_info = None
     st.session_state.selected_region = None
     st.session_state.messages = []
+    # LLM에 넘기는 대화 기록 (마지막 교환 원문 + 이전 대화 요약, 화면 메시지와 별도로 보관)
+    st.session_state.memory = conversation_memory.ConversationMemory(st.session_state.id)
     st.session_state.current_mode = "통합분석"
+    st.session_state.dataset_versions = {}
+    st.session_state.index_jobs = {}
+    st.session_state.index_options = None
 
 # CSV에서 지역 목록 읽기
 @st.cache_data
 def load_regions():
     """CSV에서 고유한 지역 목록을 추출합니다."""
     try:
-        df = None
-        for encoding in ['utf-8-sig', 'cp949', 'euc-kr', 'latin-1', 'utf-8']:
-            try:
-                df = pd.read_csv('file/merged_data.csv', encoding=encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if df is None:
-            return []
+        # 병합 단계가 남긴 메타데이터가 있으면 원본을 읽지 않음
+        metadata = dataset_metadata.load_metadata('file/merged_data.csv')
+        if metadata and metadata.get("region_column") == 'MCT_SIGUNGU_NM':
+            return metadata["regions"]
+
+        # 지역 컬럼만 읽음 (Parquet 변환본에서 컬럼 단위로 로드)
+        df = data_access.read_table('file/merged_data.csv', columns=['MCT_SIGUNGU_NM'])
         
         regions = df['MCT_SIGUNGU_NM'].dropna().unique().tolist()
         regions = sorted([r for r in regions if isinstance(r, str) and r.strip()])
@@ -79,38 +96,50 @@ def load_regions():
         st.error(f"지역 목록 로드 오류: {e}")
         return []
 
-# OpenWeatherMap API로 날씨 조회
-def get_weather(city_name, api_key):
-    """OpenWeatherMap API를 사용하여 날씨 정보를 가져옵니다."""
-    city_mapping = {
-        "서울": "Seoul", "부산": "Busan", "인천": "Incheon", 
-        "대구": "Daegu", "대전": "Daejeon", "광주": "Gwangju",
-        "울산": "Ulsan", "세종": "Sejong", "수원": "Suwon",
-        "성남": "Seongnam", "고양": "Goyang", "용인": "Yongin",
-    }
-    
-    city_key = city_name.split()[0] if ' ' in city_name else city_name
-    english_city = city_mapping.get(city_key, "Seoul")
-    
-    base_url = "http://api.openweathermap.org/data/2.5/weather"
-    params = {
-        "q": f"{english_city},KR",
-        "appid": api_key,
-        "units": "metric",
-        "lang": "kr"
-    }
-    
+# 데이터셋별 샤드 값 (질문 범위 추출용)
+@st.cache_data
+def load_shard_values(file_path):
+    """데이터셋의 지역/업종 고유 값 목록을 읽습니다 (샤드 컬럼만 로드)."""
     try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        # 업로드 단계가 남긴 메타데이터가 있으면 원본을 읽지 않음
+        metadata = dataset_metadata.load_metadata(file_path)
+        if metadata:
+            values = {
+                metadata.get("region_column"): metadata["regions"],
+                metadata.get("business_column"): metadata["business_types"],
+            }
+            if all(column in values for column in shard_filter.SHARD_COLUMNS):
+                return {column: values[column] for column in shard_filter.SHARD_COLUMNS}
+
+        df = data_access.read_table(file_path, columns=list(shard_filter.SHARD_COLUMNS))
+        return {
+            column: sorted(v for v in df[column].dropna().unique().tolist() if isinstance(v, str) and v.strip())
+            for column in shard_filter.SHARD_COLUMNS if column in df.columns
+        }
     except Exception as e:
-        st.error(f"날씨 API 호출 오류: {e}")
-        return None
+        st.error(f"{file_path} 지역/업종 목록 로드 오류: {e}")
+        return {}
+
+def scope_extractor_for(file_path):
+    """load_regions 지역 목록 + 데이터셋의 지역/업종 값으로 질문 범위 추출기를 만듭니다."""
+    values = load_shard_values(file_path)
+    return shard_filter.QueryScopeExtractor(
+        regions=sorted(set(load_regions()) | set(values.get(shard_filter.REGION_COLUMN, []))),
+        business_types=values.get(shard_filter.BUSINESS_COLUMN, []),
+    )
+
+# 날씨 조회 (도시별 공용 캐시, 외부 API를 기다리지 않음)
+def get_weather(city_name, api_key):
+    """지역의 날씨 정보와 상태를 (날씨 dict 또는 None, 상태)로 가져옵니다.
+
+    캐시의 최신 값(fresh) 또는 조금 오래된 값(stale, 백그라운드 갱신)을 쓰고, 값이 없으면
+    로컬 대체 데이터(standin)를 반환합니다. 둘 다 없으면 (None, "missing")입니다.
+    """
+    return weather_cache.get_weather_cache(api_key).get(city_name)
 
 # 날씨 정보 포맷팅
-def format_weather_info(weather_data):
-    """날씨 데이터를 읽기 쉽게 포맷팅합니다."""
+def format_weather_info(weather_data, status="fresh"):
+    """날씨 데이터를 읽기 쉽게 포맷팅합니다. status는 get_weather가 돌려준 캐시 상태입니다."""
     if not weather_data:
         return None
     
@@ -119,292 +148,136 @@ def format_weather_info(weather_data):
         weather = weather_data['weather'][0]
         wind = weather_data['wind']
         
+        observed = weather_data.get('dt')
         info = {
             "도시": weather_data['name'],
+            "관측시각": datetime.fromtimestamp(observed).strftime("%Y-%m-%d %H:%M") if observed else None,
             "날씨": weather['description'],
             "온도": f"{main['temp']:.1f}°C",
             "체감온도": f"{main['feels_like']:.1f}°C",
             "습도": f"{main['humidity']}%",
             "풍속": f"{wind['speed']} m/s",
+            "상태": status,
         }
         return info
     except Exception as e:
         return None
 
+# 캐시 상태별 날씨 출처 설명 (오래된 값 · 대체 데이터를 실시간 데이터라고 하지 않도록)
+WEATHER_SOURCE_NOTES = {
+    "fresh": ("실시간 날씨 정보", "OpenWeatherMap API에서 최근 조회한 실제 관측 데이터입니다."),
+    "stale": ("최근 날씨 정보", "OpenWeatherMap API의 이전 관측 데이터입니다. 갱신 중이므로 현재 날씨와 다를 수 있습니다."),
+    "standin": ("참고용 날씨 정보", "실시간 조회 결과가 없어 마지막으로 저장된 관측 데이터를 사용합니다. 현재 날씨와 다를 수 있습니다."),
+}
+
 def format_weather_context(weather_info):
-    """날씨 정보를 프롬프트용 텍스트로 변환"""
-    from datetime import datetime
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+    """날씨 정보를 프롬프트용 텍스트로 변환 (캐시 상태에 맞춰 출처를 설명)"""
+    # 캐시 · 대체 데이터일 수 있으므로 조회 시각이 아니라 실제 관측 시각을 표시
+    current_time = weather_info.get('관측시각') or "알 수 없음"
+    title, note = WEATHER_SOURCE_NOTES.get(weather_info.get('상태'), WEATHER_SOURCE_NOTES["standin"])
+    
+    if weather_info.get('상태') == "fresh":
+        guidance = """- 이 날씨를 "가상" 또는 "시뮬레이션" 데이터라고 언급하지 마세요
+- 이 날씨 정보를 바탕으로 현실적이고 실행 가능한 마케팅 전략을 제시하세요"""
+    else:
+        guidance = """- 이 날씨가 실시간 값이 아닐 수 있음을 답변에 짧게 밝히세요
+- 특정 날씨에 의존하기보다 비슷한 날씨 조건에서 쓸 수 있는 마케팅 전략을 제시하세요"""
     
     return f"""
-🌤️ **실시간 날씨 정보** (OpenWeatherMap API 실제 데이터)
+🌤️ **{title}** (관측 시각: {current_time})
 
-📍 **중요**: 아래는 OpenWeatherMap API에서 {current_time}에 조회한 **실제 실시간 날씨 데이터**입니다.
-이것은 가상이나 시뮬레이션이 아닌, 현재 시점의 **실제 기상 정보**입니다.
+📍 **출처**: {note}
 
-📊 **실시간 기상 데이터**:
+📊 **기상 데이터**:
 - 관측 지역: {weather_info['도시']}
-- 현재 날씨: {weather_info['날씨']}
-- 실제 온도: {weather_info['온도']} (체감온도: {weather_info['체감온도']})
-- 현재 습도: {weather_info['습도']}
-- 현재 풍속: {weather_info['풍속']}
+- 날씨: {weather_info['날씨']}
+- 온도: {weather_info['온도']} (체감온도: {weather_info['체감온도']})
+- 습도: {weather_info['습도']}
+- 풍속: {weather_info['풍속']}
 
 ⚠️ **답변 시 필수 사항**: 
-- 이 실시간 날씨를 "가상" 또는 "시뮬레이션" 데이터라고 절대 언급하지 마세요
-- OpenWeatherMap에서 방금 조회한 **실제 현재 날씨**임을 인지하고 답변하세요
-- 이 실시간 날씨 정보를 바탕으로 현실적이고 실행 가능한 마케팅 전략을 제시하세요
+{guidance}
 """
 
-# CSV 데이터 로드 및 인덱싱 함수 (개별 파일용)
-@st.cache_resource
-def load_and_index_csv_individual(file_path, file_name, use_sample=False, sample_ratio=0.1):
-    """개별 CSV 파일을 로드하고 벡터 스토어를 생성합니다."""
-    csv_file_path = file_path
-    
-    try:
-        documents = None
-        used_encoding = None
-        
-        for encoding in ['utf-8-sig', 'cp949', 'euc-kr', 'latin-1', 'utf-8']:
-            try:
-                loader = CSVLoader(
-                    file_path=csv_file_path,
-                    encoding=encoding,
-                    csv_args={'delimiter': ',',}
-                )
-                documents = loader.load()
-                used_encoding = encoding
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if documents is None:
-            raise Exception(f"{file_name}: 지원되는 인코딩으로 CSV 파일을 읽을 수 없습니다.")
-        
-        st.info(f"✅ {file_name} 인코딩: {used_encoding}")
-        total_docs = len(documents)
-        
-        if use_sample:
-            sample_size = int(total_docs * sample_ratio)
-            documents = documents[::int(1/sample_ratio)][:sample_size]
-            st.info(f"📊 {file_name} 샘플링: {len(documents):,}개 / {total_docs:,}개 레코드 사용")
-        
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ",", " ", ""]
-        )
-        splits = text_splitter.split_documents(documents)
-        
-        vectorstore = Chroma.from_documents(
-            splits,
-            HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        )
-        
-        return vectorstore, len(documents)
-    
-    except Exception as e:
-        st.error(f"{file_name} 파일 로드 중 오류 발생: {e}")
-        return None, 0
+# 임베딩 모델 (인덱싱과 질의, 답변 캐시가 같은 모델을 사용)
+EMBEDDING_MODEL_NAME = dataset_indexer.EMBEDDING_MODEL_NAME
 
-# 질문 분류 함수
-def classify_question(question):
-    """질문을 분석하여 어떤 데이터셋을 사용할지 결정합니다."""
-    question_lower = question.lower()
-    
-    # 카페 관련 키워드
-    cafe_keywords = ['카페', '커피', '음료', '디저트', '원두', '라떼', '아메리카노']
-    
-    # 재방문율 관련 키워드
-    revisit_keywords = ['재방문', '재방문율', '충성도', '단골', '리텐션', '이탈', '재구매']
-    
-    # 요식업 관련 키워드
-    restaurant_keywords = ['요식업', '식당', '음식점', '한식', '중식', '일식', '양식', '배달', '매출']
-    
-    # 키워드 매칭
-    if any(keyword in question_lower for keyword in cafe_keywords):
-        return "Q1", "카페업종"
-    elif any(keyword in question_lower for keyword in revisit_keywords):
-        return "Q2", "재방문율"
-    elif any(keyword in question_lower for keyword in restaurant_keywords):
-        return "Q3", "요식업"
-    else:
-        return "통합", "통합분석"
-
-# 전문화된 RAG 체인 생성 함수
-def create_specialized_rag_chain(vectorstore, analysis_type):
-    """특화된 RAG 체인을 생성합니다."""
-    retriever = vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": 5}
+def register_dataset_version(dataset, file_path, use_sample):
+    """로드한 데이터셋의 버전을 기록하고, 버전이 바뀌었으면 공용 답변 캐시의 이전 답변을 무효화합니다."""
+    version = answer_cache.dataset_version(
+        dataset, data_access.source_info(file_path)["sha256"], "sample" if use_sample else "full"
     )
-    
-    api_key = os.getenv("GOOGLE_API_KEY")
-    chat = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0.7,
-        max_output_tokens=8192,  # 완전한 응답을 위해 최대로 증가
-        api_key=api_key
+    st.session_state.dataset_versions[dataset] = version
+    answer_cache.get_answer_cache().sync_version(version)
+
+# 데이터셋: (이름, 파일 경로, 표시 이름, 분석 유형)
+DATASET_SPECS = [
+    ("Q1", "file/Q1_data.csv", "Q1_data(카페)", "카페업종"),
+    ("Q2", "file/Q2_data.csv", "Q2_data(재방문율)", "재방문율"),
+    ("Q3", "file/Q3_data.csv", "Q3_data(요식업)", "요식업"),
+]
+
+def sync_ready_chains():
+    """인덱싱이 끝난 데이터셋의 RAG 체인을 만듭니다. 새로 준비된 데이터셋이 있으면 True."""
+    changed = False
+    for dataset, file_path, _, analysis_type in DATASET_SPECS:
+        job = st.session_state.index_jobs.get(dataset)
+        key = dataset.lower()
+        if job is None or job.state != "ready" or st.session_state[f"vectorstore_{key}"] is job.vectorstore:
+            continue
+        st.session_state[f"vectorstore_{key}"] = job.vectorstore
+        st.session_state[f"rag_chain_{key}"] = create_specialized_rag_chain(
+            job.vectorstore, analysis_type, scope_extractor_for(file_path)
+        )
+        register_dataset_version(dataset, file_path, st.session_state.index_options["use_sample"])
+        changed = True
+    if changed:
+        sync_integrated_chain()
+    return changed
+
+def sync_integrated_chain():
+    """준비된 데이터셋을 모두 동시에 검색하는 통합분석 체인을 만듭니다."""
+    retrievers = {
+        dataset: shard_filter.ShardedRetriever(
+            vectorstore=st.session_state[f"vectorstore_{dataset.lower()}"],
+            extractor=scope_extractor_for(file_path),
+            k=5,
+        )
+        for dataset, file_path, _, _ in DATASET_SPECS
+        if st.session_state[f"vectorstore_{dataset.lower()}"] is not None
+    }
+    st.session_state.rag_chain_all = create_specialized_rag_chain(
+        None, "통합분석", retriever=fanout_retrieval.FanOutRetriever(retrievers=retrievers)
     )
+    # 통합 답변은 포함된 데이터셋 버전이 모두 같을 때만 캐시 재사용
+    versions = "|".join(st.session_state.dataset_versions[dataset] for dataset in sorted(retrievers))
+    version = answer_cache.dataset_version("통합", hashlib.sha1(versions.encode("utf-8")).hexdigest())
+    st.session_state.dataset_versions["통합"] = version
+    answer_cache.get_answer_cache().sync_version(version)
+
+def indexing_progress_panel(polling):
+    """데이터셋별 인덱싱 진행 상황 (진행 중에는 fragment로 주기적으로 갱신)"""
+    st.markdown("### ⏳ 인덱싱 진행 상황")
+    jobs = [job.snapshot() for job in st.session_state.index_jobs.values()]
+    for job in jobs:
+        if job["state"] == "ready":
+            st.success(f"✅ {job['file_name']}: {job['doc_count']:,}개 문서 ({job['elapsed']:.0f}초)")
+        elif job["state"] == "failed":
+            st.error(f"{job['file_name']} 파일 로드 중 오류 발생: {job['error']}")
+        else:
+            st.progress(job["progress"], text=f"{job['file_name']} · {job['elapsed']:.0f}초")
+            st.caption(job["status_text"])
+        for message in job["messages"]:
+            st.caption(message)
     
-    # 분석 유형별 시스템 프롬프트
-    if analysis_type == "카페업종":
-        system_prompt = """당신은 카페업종 전문 마케팅 컨설턴트입니다.
-
-Q1_data.csv 데이터를 기반으로 카페 관련 질문에 답변하세요.
-
-**데이터 컬럼 설명**:
-- 가맹점명: 카페 이름
-- 업종: 카페
-- 가맹점지역: 위치 정보
-- 상권: 상권 유형
-- 남성비중/여성비중: 고객 성별 분포
-- 연령집중도: 특정 연령대 집중 정도
-- 주요고객층: 주력 고객 연령대
-- 충성도지수: 고객 충성도 수치
-- 상권유형: 거주상권/직장상권/유동인구상권
-- 고객유형: 충성형/신규형
-
-**답변 형식**:
-## 1. 📊 카페 데이터 분석
-구체적인 수치와 데이터를 제시하세요.
-
-## 2. 🎯 타겟 고객 특성
-주요 고객층과 특성을 분석하세요.
-
-## 3. 💡 마케팅 전략 제안
-### 전략 1: [전략명]
-- 실행 방법:
-- 예상 효과:
-- 데이터 근거:
-
-### 전략 2: [전략명]
-- 실행 방법:
-- 예상 효과:
-- 데이터 근거:
-
-## 4. 📈 성과 예측
-예상되는 개선 효과를 제시하세요.
-
-{context}"""
-
-    elif analysis_type == "재방문율":
-        system_prompt = """당신은 고객 재방문율 개선 전문 컨설턴트입니다.
-
-Q2_data.csv 데이터를 기반으로 재방문율 관련 질문에 답변하세요.
-
-**데이터 컬럼 설명**:
-- 재방문고객비율: 재방문 고객 비율
-- 신규고객비율: 신규 고객 비율
-- 월간매출액: 월 매출 수준
-- 월간이용건수/고객수: 이용 빈도
-- 업종평균재방문률: 업종 평균 대비 비교
-- 재방문률등급: 재방문율 등급 (High/Mid/Low)
-- 충성도 관련 지표들
-
-**답변 형식**:
-## 1. 🔍 재방문율 현황 분석
-현재 재방문율과 문제점을 진단하세요.
-
-## 2. 📊 업종 평균 대비 분석
-업종 평균과 비교한 상대적 위치를 분석하세요.
-
-## 3. 💡 재방문율 개선 전략
-### 전략 1: [전략명]
-- 실행 방법:
-- 예상 효과:
-- 데이터 근거:
-
-### 전략 2: [전략명]
-- 실행 방법:
-- 예상 효과:
-- 데이터 근거:
-
-## 4. 🎯 단계별 실행 계획
-구체적인 실행 로드맵을 제시하세요.
-
-{context}"""
-
-    elif analysis_type == "요식업":
-        system_prompt = """당신은 요식업 전문 마케팅 컨설턴트입니다.
-
-Q3_data.csv 데이터를 기반으로 요식업 관련 질문에 답변하세요.
-
-**데이터 컬럼 설명**:
-- 업종: 한식, 중식, 일식, 양식 등
-- 월간매출액: 매출 수준
-- 배달매출비율: 배달 의존도
-- 월평균객단가: 평균 객단가
-- 연령대별 고객 비율
-- 거주/직장/유동인구 이용 비율
-- 동종업종 대비 성과 지표
-
-**답변 형식**:
-## 1. 🍽️ 요식업 현황 분석
-매출, 고객층, 운영 현황을 분석하세요.
-
-## 2. 📊 경쟁력 분석
-동종업종 대비 강점과 약점을 분석하세요.
-
-## 3. 💡 매출 증대 전략
-### 전략 1: [전략명]
-- 실행 방법:
-- 예상 효과:
-- 데이터 근거:
-
-### 전략 2: [전략명]
-- 실행 방법:
-- 예상 효과:
-- 데이터 근거:
-
-## 4. 🚀 성장 방안
-장기적인 성장 전략을 제시하세요.
-
-{context}"""
-
-    else:  # 통합분석
-        system_prompt = """당신은 종합 마케팅 전략 컨설턴트입니다.
-
-세 개의 데이터셋(Q1: 카페, Q2: 재방문율, Q3: 요식업)을 종합적으로 분석하여 답변하세요.
-
-**답변 형식**:
-## 1. 📊 종합 데이터 분석
-관련 데이터를 종합적으로 분석하세요.
-
-## 2. 💡 통합 마케팅 전략
-여러 관점에서의 종합적인 전략을 제시하세요.
-
-## 3. 🎯 실행 우선순위
-중요도에 따른 실행 순서를 제안하세요.
-
-{context}"""
-
-    contextualize_q_system_prompt = """이전 대화 내용과 최신 사용자 질문이 있을 때, 이 질문이 이전 대화 내용과 관련이 있을 수 있습니다. 
-이런 경우, 대화 내용을 알 필요 없이 독립적으로 이해할 수 있는 질문으로 바꾸세요."""
-
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system", contextualize_q_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-    
-    history_aware_retriever = create_history_aware_retriever(
-        chat, retriever, contextualize_q_prompt
+    # 새로 준비된 데이터셋이 있거나 모든 작업이 끝났으면 전체 화면을 다시 실행 (체인 연결, 갱신 중지)
+    ready_unsynced = any(
+        job.state == "ready" and st.session_state[f"vectorstore_{job.dataset.lower()}"] is not job.vectorstore
+        for job in st.session_state.index_jobs.values()
     )
-    
-    # 전문화된 시스템 프롬프트 사용 (이미 위에서 정의됨)
-    qa_system_prompt = system_prompt
-    
-    qa_prompt = ChatPromptTemplate.from_messages([
-        ("system", qa_system_prompt),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}"),
-    ])
-    
-    question_answer_chain = create_stuff_documents_chain(chat, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-    
-    return rag_chain
+    all_done = all(job["state"] in ("ready", "failed") for job in jobs)
+    if ready_unsynced or (polling and all_done):
+        st.rerun()
 
 # 사이드바 (간소화)
 with st.sidebar:
@@ -417,41 +290,82 @@ with st.sidebar:
         help="첫 실행 시 권장 (4-6분)"
     )
     
+    use_persist = st.checkbox(
+        "💾 저장된 인덱스 재사용",
+        value=True,
+        help="원본 CSV와 설정이 바뀌지 않았으면 디스크(index/)의 인덱스를 바로 엽니다"
+    )
+    
+    with st.expander("🧠 임베딩 설정"):
+        embed_batch_size = st.number_input(
+            "배치 크기", min_value=16, max_value=4096,
+            value=embedding_pipeline.DEFAULT_BATCH_SIZE, step=16,
+            help="길이순으로 정렬한 청크를 이 크기로 묶어 임베딩합니다"
+        )
+        embed_workers = st.number_input(
+            "워커 프로세스 수", min_value=1, max_value=os.cpu_count() or 1,
+            value=min(embedding_pipeline.DEFAULT_WORKERS, os.cpu_count() or 1),
+            help="워커마다 임베딩 모델을 1개씩 로드합니다 (워커 수만큼 메모리 사용량 증가)"
+        )
+        store_backend = st.selectbox(
+            "벡터 저장 방식",
+            list(dataset_indexer.VECTOR_STORE_BACKENDS),
+            format_func=dataset_indexer.VECTOR_STORE_BACKENDS.get,
+            help="양자화 스토어는 벡터를 float16/int8 메모리 매핑 파일로 저장해 파드 메모리를 줄이고 워커 간 페이지 캐시를 공유합니다"
+        )
+        ann_backend = st.selectbox(
+            "검색 인덱스 (양자화 스토어)",
+            list(ann_index.ANN_BACKENDS),
+            help="flat: 정확한 전수 검색 · hnsw: 그래프 근사 검색 · ivfpq: 역색인+곱 양자화 (hnsw/ivfpq는 faiss 필요)",
+            disabled=store_backend == "chroma"
+        )
+        ann_params = st.text_input(
+            "인덱스 파라미터 (JSON)",
+            value="",
+            placeholder=json.dumps(ann_index.DEFAULT_PARAMS[ann_backend]),
+            help="비워 두면 기본값을 사용합니다. 검색 파라미터(ef_search, nprobe)는 재빌드 없이 바뀝니다",
+            disabled=store_backend == "chroma"
+        )
+        try:
+            ann_index.create_index(ann_backend, **json.loads(ann_params or "{}"))
+        except (ValueError, TypeError) as e:
+            st.error(f"인덱스 파라미터 오류: {e}")
+            ann_params = ""
+        cache_stats = embedding_service.get_embedding_service(EMBEDDING_MODEL_NAME).cache.stats()
+        st.caption(
+            f"💾 벡터 캐시: {cache_stats['entries']:,}개 "
+            f"(적중 {cache_stats['hits']:,} / 미스 {cache_stats['misses']:,})"
+        )
+    
     if use_sample:
         st.info("⚡ 빠른 모드: 4-6분 소요")
     else:
-        st.warning("⏳ 전체 모드: 55-80분 소요")
+        st.warning("⏳ 전체 모드: 55-80분 소요 (저장된 인덱스가 있으면 수 초)")
     
     if st.button("🔄 전체 데이터 로드", type="primary", use_container_width=True):
-        with st.spinner("데이터 인덱싱 중... ☕"):
-            # Q1 데이터 로드 (카페)
-            vectorstore_q1, doc_count_q1 = load_and_index_csv_individual(
-                "file/Q1_data.csv", "Q1_data(카페)", use_sample, 0.1
-            )
-            if vectorstore_q1:
-                st.session_state.vectorstore_q1 = vectorstore_q1
-                st.session_state.rag_chain_q1 = create_specialized_rag_chain(vectorstore_q1, "카페업종")
-            
-            # Q2 데이터 로드 (재방문율)
-            vectorstore_q2, doc_count_q2 = load_and_index_csv_individual(
-                "file/Q2_data.csv", "Q2_data(재방문율)", use_sample, 0.1
-            )
-            if vectorstore_q2:
-                st.session_state.vectorstore_q2 = vectorstore_q2
-                st.session_state.rag_chain_q2 = create_specialized_rag_chain(vectorstore_q2, "재방문율")
-            
-            # Q3 데이터 로드 (요식업)
-            vectorstore_q3, doc_count_q3 = load_and_index_csv_individual(
-                "file/Q3_data.csv", "Q3_data(요식업)", use_sample, 0.1
-            )
-            if vectorstore_q3:
-                st.session_state.vectorstore_q3 = vectorstore_q3
-                st.session_state.rag_chain_q3 = create_specialized_rag_chain(vectorstore_q3, "요식업")
-            
-            if all([vectorstore_q1, vectorstore_q2, vectorstore_q3]):
-                st.success(f"✅ 전체 로딩 완료!")
-                st.success(f"Q1: {doc_count_q1:,}개 | Q2: {doc_count_q2:,}개 | Q3: {doc_count_q3:,}개")
-                st.balloons()
+        # 세 데이터셋을 백그라운드에서 동시에 인덱싱 (화면은 막지 않고 준비된 데이터셋부터 사용)
+        st.session_state.index_options = {
+            "use_sample": use_sample,
+            "sample_ratio": 0.1,
+            "persist": use_persist,
+            "embed_batch_size": int(embed_batch_size),
+            "embed_workers": int(embed_workers),
+            "store_backend": store_backend,
+            "ann_backend": ann_backend,
+            "ann_params": ann_params,
+        }
+        st.session_state.index_jobs = background_indexing.get_indexing_manager().start(
+            [(dataset, file_path, file_name) for dataset, file_path, file_name, _ in DATASET_SPECS],
+            st.session_state.index_options,
+        )
+    
+    sync_ready_chains()
+    if st.session_state.index_jobs:
+        running = any(
+            job.state in ("queued", "running") for job in st.session_state.index_jobs.values()
+        )
+        # 진행 중일 때만 2초마다 패널을 다시 그림
+        st.fragment(indexing_progress_panel, run_every=2 if running else None)(running)
     
     st.markdown("---")
     
@@ -463,6 +377,21 @@ with st.sidebar:
         help="질문에 따라 자동으로 감지하거나 수동으로 선택"
     )
     
+    rewrite_stats = query_rewrite.stats.snapshot()
+    st.caption(
+        f"✏️ 질문 재작성: LLM {rewrite_stats['llm']:,} · 캐시 {rewrite_stats['cache_hit']:,} · "
+        f"생략 {rewrite_stats['no_history'] + rewrite_stats['self_contained']:,}"
+    )
+    st.caption(latency_metrics.format_summary("⏱️ 첫 토큰", "ttft"))
+    st.caption(llm_gateway.format_stats())
+    st.caption(llm_resilience.format_stats())
+    answer_stats = answer_cache.get_answer_cache().stats()
+    st.caption(
+        f"⚡ 답변 캐시: {answer_stats['entries']:,}개 "
+        f"(적중 {answer_stats['hits']:,} · 유사 적중 {answer_stats['similar_hits']:,} · 미스 {answer_stats['misses']:,})"
+    )
+    perf_panel.render_perf_panel("gemini_rag")
+    
     st.markdown("""
     ### 💡 질문 예시
     
@@ -486,9 +415,16 @@ with st.sidebar:
 st.title("🏪 마케팅 전략 분석 챗봇")
 st.markdown("### 📊 카페 · 재방문율 · 요식업 전문 분석")
 
-# 데이터 로드 체크
-if not all([st.session_state.rag_chain_q1, st.session_state.rag_chain_q2, st.session_state.rag_chain_q3]):
-    st.warning("⚠️ 먼저 사이드바에서 **'전체 데이터 로드'** 버튼을 클릭해주세요!")
+# 데이터 로드 체크 (준비된 데이터셋이 하나라도 있으면 바로 질문 가능)
+ready_datasets = [
+    dataset for dataset, _, _, _ in DATASET_SPECS
+    if st.session_state[f"rag_chain_{dataset.lower()}"] is not None
+]
+if not ready_datasets:
+    if st.session_state.index_jobs:
+        st.info("⏳ 데이터 인덱싱 중입니다. 먼저 준비된 데이터셋부터 바로 질문할 수 있습니다.")
+    else:
+        st.warning("⚠️ 먼저 사이드바에서 **'전체 데이터 로드'** 버튼을 클릭해주세요!")
     st.stop()
 
 
@@ -522,77 +458,150 @@ if prompt := st.chat_input("마케팅 전략에 대해 질문하세요..."):
     # AI 응답
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
-        full_response = ""
         
         try:
-            # 질문 분류 (자동 감지 모드일 때)
-            if analysis_mode == "자동 감지":
-                dataset_type, analysis_type = classify_question(prompt)
-                st.session_state.current_mode = analysis_type
-            else:
-                analysis_type = analysis_mode
-                if analysis_type == "카페업종":
-                    dataset_type = "Q1"
-                elif analysis_type == "재방문율":
-                    dataset_type = "Q2"
-                elif analysis_type == "요식업":
-                    dataset_type = "Q3"
+            # 턴 추적: 단계별 소요 시간 · 토큰 수 · 캐시 적중을 턴 기록 하나로 남김 (사이드바 성능 패널)
+            with turn_tracing.trace_turn("gemini_rag", st.session_state.id):
+                # 질문 분류 (자동 감지 모드일 때)
+                if analysis_mode == "자동 감지":
+                    with turn_tracing.span("classify"):
+                        dataset_type, analysis_type = classify_question(prompt)
+                    st.session_state.current_mode = analysis_type
                 else:
-                    dataset_type = "통합"
+                    analysis_type = analysis_mode
+                    if analysis_type == "카페업종":
+                        dataset_type = "Q1"
+                    elif analysis_type == "재방문율":
+                        dataset_type = "Q2"
+                    elif analysis_type == "요식업":
+                        dataset_type = "Q3"
+                    else:
+                        dataset_type = "통합"
             
-            # 해당하는 RAG 체인 선택
-            if dataset_type == "Q1":
-                chain = st.session_state.rag_chain_q1
-                st.info(f"🍵 **카페업종 데이터**로 분석 중...")
-            elif dataset_type == "Q2":
-                chain = st.session_state.rag_chain_q2
-                st.info(f"🔄 **재방문율 데이터**로 분석 중...")
-            elif dataset_type == "Q3":
-                chain = st.session_state.rag_chain_q3
-                st.info(f"🍽️ **요식업 데이터**로 분석 중...")
-            else:
-                # 통합 분석 - 가장 관련성 높은 체인 사용
-                chain = st.session_state.rag_chain_q1  # 기본값
-                st.info(f"📊 **통합 분석** 중...")
-            
-            # RAG 실행
-            result = chain.invoke({
-                "input": prompt,
-                "chat_history": st.session_state.messages
-            })
+                # 해당하는 RAG 체인 선택
+                if dataset_type == "Q1":
+                    chain = st.session_state.rag_chain_q1
+                    st.info(f"🍵 **카페업종 데이터**로 분석 중...")
+                elif dataset_type == "Q2":
+                    chain = st.session_state.rag_chain_q2
+                    st.info(f"🔄 **재방문율 데이터**로 분석 중...")
+                elif dataset_type == "Q3":
+                    chain = st.session_state.rag_chain_q3
+                    st.info(f"🍽️ **요식업 데이터**로 분석 중...")
+                else:
+                    # 통합 분석 - 준비된 모든 데이터셋을 동시에 검색해 한 번에 답변
+                    chain = st.session_state.rag_chain_all
+                    st.info(f"📊 **통합 분석** 중... ({', '.join(ready_datasets)} 동시 검색)")
+                chain_dataset = dataset_type
             
-            # 응답 텍스트 추출
-            answer_text = result.get("answer", "")
+                if chain is None:
+                    # 아직 인덱싱 중인 데이터셋이면 준비된 데이터셋으로 대신 답변
+                    chain_dataset = ready_datasets[0]
+                    chain = st.session_state[f"rag_chain_{chain_dataset.lower()}"]
+                    st.warning(f"⏳ {dataset_type} 데이터는 아직 인덱싱 중입니다. 준비된 {chain_dataset} 데이터로 답변합니다.")
+                turn_tracing.annotate(dataset=chain_dataset, analysis_type=analysis_type)
             
-            # 응답 완전성 검증
-            is_complete = (
-                len(answer_text) > 100 and  # 최소 길이 체크
-                (answer_text.endswith(('.', '!', '?', '다', '요', '니다', '습니다', '세요')) or
-                 "마무리" in answer_text or
-                 "요약" in answer_text)
-            )
+                # 공용 답변 캐시 조회 (이전 대화에 기대는 질문은 답변이 달라질 수 있어 제외)
+                answers = answer_cache.get_answer_cache()
+                embed_query = embedding_service.get_embedding_service(EMBEDDING_MODEL_NAME).embed_query
+                version = st.session_state.dataset_versions.get(chain_dataset)
+                cacheable = version is not None and not (
+                    query_rewrite.prior_history(prompt, st.session_state.messages)
+                    and query_rewrite.needs_rewrite(prompt)
+                )
+                with turn_tracing.span("cache_lookup"):
+                    cached = answers.get(analysis_type, version, prompt, embed_query) if cacheable else None
+                turn_tracing.annotate(cache_hit=bool(cached))
             
-            if not is_complete and len(answer_text) > 50:
-                st.warning("⚠️ 응답이 불완전할 수 있습니다. 더 구체적으로 질문하거나 다시 시도해주세요.")
+                def show_context(docs):
+                    # 참고 데이터 표시
+                    with st.expander("📚 참고 데이터"):
+                        for i, doc in enumerate(docs, 1):
+                            st.markdown(f"**데이터 {i}:**")
+                            st.text(doc.page_content[:400])
+                            st.markdown("---")
             
-            # 참고 데이터 표시
-            with st.expander("📚 참고 데이터"):
-                for i, doc in enumerate(result["context"], 1):
-                    st.markdown(f"**데이터 {i}:**")
-                    st.text(doc.page_content[:400])
-                    st.markdown("---")
+                truncated = False
+                if cached:
+                    st.caption(f"⚡ 저장된 답변 사용 (유사도 {cached['similarity']:.2f})")
+                    answer_text = cached["answer"]
+                    context_docs = cached["context"]
+                    show_context(context_docs)
+                    message_placeholder.markdown(answer_text)
+                else:
+                    # RAG 실행: 검색이 끝나면 참고 데이터를 먼저 보여 주고, 답변은 토큰이 오는 대로 표시
+                    answer_text = ""
+                    context_docs = []
+                    prompt_tokens = None
+                    started = time.perf_counter()
+                    first_token_at = None
+                    context_at = None
+                    # 턴 마감: 질문 재작성 · 검색 · 답변 생성 단계에 시간 예산을 나눠 적용
+                    with llm_gateway.session_scope(st.session_state.id), llm_resilience.turn_scope():
+                        try:
+                            for chunk in chain.stream({
+                                "input": prompt,
+                                "chat_history": st.session_state.memory.prompt_history()
+                            }):
+                                if "context" in chunk:
+                                    context_docs = chunk["context"]
+                                    context_at = time.perf_counter()
+                                    latency_metrics.record("retrieval", context_at - started)
+                                    show_context(context_docs)
+                                if "prompt_tokens" in chunk:
+                                    prompt_tokens = chunk["prompt_tokens"]
+                                if chunk.get("answer"):
+                                    if first_token_at is None:
+                                        first_token_at = time.perf_counter()
+                                        latency_metrics.record("ttft", first_token_at - started)
+                                        turn_tracing.record_span("ttft", first_token_at - started)
+                                    answer_text += chunk["answer"]
+                                    message_placeholder.markdown(answer_text + "▌")
+                        except llm_resilience.DeadlineExceeded:
+                            if not answer_text:
+                                raise
+                            # 이미 받은 부분 답변은 보여 주고 끝냄 (불완전 답변이라 캐시에 저장하지 않음)
+                            truncated = True
+                            answer_text += "\n\n⏳ *응답 시간 제한으로 답변이 중간에 끊겼습니다.*"
+                    message_placeholder.markdown(answer_text)
+                    total_seconds = time.perf_counter() - started
+                    latency_metrics.record("answer_total", total_seconds)
+                    if context_at is not None:
+                        turn_tracing.record_span("generation", time.perf_counter() - context_at)
+                    turn_tracing.annotate(response_tokens=context_budget.count_tokens(answer_text))
+                    if first_token_at is not None:
+                        st.caption(f"⏱️ 첫 토큰 {first_token_at - started:.2f}초 · 전체 {total_seconds:.2f}초")
+                    if prompt_tokens:
+                        st.caption(
+                            f"🧮 프롬프트 약 {prompt_tokens['total']:,} 토큰 / 예산 {context_budget.PROMPT_TOKEN_BUDGET:,} "
+                            f"(참고 데이터 {prompt_tokens['context']:,} · 대화 {prompt_tokens['history']:,} · "
+                            f"문서 {prompt_tokens['documents']}/{prompt_tokens['retrieved']}개)"
+                        )
             
-            # 타이핑 효과로 응답 표시
-            for chunk in answer_text.split(" "):
-                full_response += chunk + " "
-                time.sleep(0.05)
-                message_placeholder.markdown(full_response + "▌")
+                # 응답 완전성 검증 (마감으로 끊긴 답변은 끝맺음과 관계없이 불완전)
+                is_complete = not truncated and (
+                    len(answer_text) > 100 and  # 최소 길이 체크
+                    (answer_text.endswith(('.', '!', '?', '다', '요', '니다', '습니다', '세요')) or
+                     "마무리" in answer_text or
+                     "요약" in answer_text)
+                )
             
-            message_placeholder.markdown(full_response)
+                if not is_complete and len(answer_text) > 50:
+                    st.warning("⚠️ 응답이 불완전할 수 있습니다. 더 구체적으로 질문하거나 다시 시도해주세요.")
+                elif is_complete and cacheable and not cached:
+                    answers.put(analysis_type, version, prompt, answer_text, context_docs, embed_query)
             
-            # 메시지 저장
+                # 메시지 저장 (대화 요약은 답변 뒤 백그라운드에서 갱신)
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": answer_text}
+                )
+                st.session_state.memory.add_exchange(prompt, answer_text)
+        
+        except (llm_resilience.CircuitOpenError, llm_resilience.DeadlineExceeded) as e:
+            error_message = f"⏳ {e} 잠시 후 다시 시도해주세요." if isinstance(e, llm_resilience.DeadlineExceeded) else f"⚠️ {e}"
+            st.warning(error_message)
             st.session_state.messages.append(
-                {"role": "assistant", "content": full_response}
+                {"role": "assistant", "content": error_message}
             )
         
         except Exception as e:
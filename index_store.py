@@ -0,0 +1,173 @@
+"""벡터 인덱스를 디스크에 저장하고, 원본이 바뀌지 않았으면 재사용하기 위한 유틸리티"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+# 인덱스 저장 위치 (데이터셋/모드별 하위 폴더)
+INDEX_ROOT = "index"
+MANIFEST_FILE = "manifest.json"
+ROW_INDEX_FILE = "rows.tsv"
+MANIFEST_VERSION = 1
+
+# 매니페스트 비교 시 제외할 항목 (빌드 결과 정보)
+_RESULT_KEYS = ("created_at", "doc_count", "chunk_count", "source_size", "source_mtime")
+# 증분 갱신 가능 여부 비교 시 추가로 제외할 항목 (원본 내용은 바뀌어도 됨)
+_SOURCE_KEYS = ("source_hash",)
+
+
+def index_dir_for(file_path, use_sample=False, sample_ratio=0.1, backend="chroma", root=INDEX_ROOT):
+    """CSV 파일, 샘플링 설정, 벡터 스토어 종류에 대응하는 인덱스 폴더 경로를 반환합니다."""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    suffix = f"sample{int(round(sample_ratio * 100))}" if use_sample else "full"
+    if backend != "chroma":
+        suffix += f"_{backend}"
+    return os.path.join(root, f"{name}_{suffix}")
+
+
+def load_manifest(index_dir):
+    """인덱스 폴더의 매니페스트를 읽습니다. 없거나 손상되었으면 None."""
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(index_dir, manifest):
+    """매니페스트를 원자적으로 저장합니다 (저장 도중 중단되어도 깨진 파일이 남지 않음)."""
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_manifest(file_path, source_digest, embedding_model, document_settings,
+                   use_sample=False, sample_ratio=0.1, store_settings=None):
+    """인덱스 재사용 여부 판단에 필요한 설정을 매니페스트로 구성합니다."""
+    stat = os.stat(file_path)
+    return {
+        "version": MANIFEST_VERSION,
+        "source_file": os.path.basename(file_path),
+        "source_hash": source_digest,
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "embedding_model": embedding_model,
+        "documents": document_settings,
+        "use_sample": bool(use_sample),
+        "sample_ratio": sample_ratio if use_sample else None,
+        "vector_store": store_settings or {"backend": "chroma"},
+    }
+
+
+def _comparable(manifest):
+    return {k: v for k, v in manifest.items() if k not in _RESULT_KEYS}
+
+
+def is_index_reusable(index_dir, expected_manifest):
+    """저장된 인덱스가 현재 원본/설정과 일치하는지 확인합니다."""
+    stored = load_manifest(index_dir)
+    if not stored:
+        return False
+    # JSON 왕복 시 튜플이 리스트로 바뀌므로 동일하게 직렬화해 비교
+    expected = json.loads(json.dumps(_comparable(expected_manifest), ensure_ascii=False))
+    return _comparable(stored) == expected
+
+
+def is_index_updatable(index_dir, expected_manifest):
+    """원본 내용만 바뀌고 임베딩/분할/샘플링 설정이 같아 증분 갱신이 가능한지 확인합니다."""
+    stored = load_manifest(index_dir)
+    if not stored or not os.path.exists(os.path.join(index_dir, ROW_INDEX_FILE)):
+        return False
+    expected = json.loads(json.dumps(_comparable(expected_manifest), ensure_ascii=False))
+    stored = _comparable(stored)
+    for key in _SOURCE_KEYS:
+        expected.pop(key, None)
+        stored.pop(key, None)
+    return stored == expected
+
+
+class RowFingerprinter:
+    """행 내용의 지문(해시)으로 행 ID를 만듭니다. 내용이 같은 행은 등장 순서로 구분합니다.
+
+    스트리밍으로 여러 구간에 걸쳐 호출해도 중복 행 번호가 이어지도록 상태를 유지합니다.
+    """
+
+    def __init__(self):
+        self._seen = {}
+
+    def __call__(self, text):
+        fingerprint = hashlib.sha1(text.encode("utf-8")).hexdigest()[:24]
+        occurrence = self._seen.get(fingerprint, 0)
+        self._seen[fingerprint] = occurrence + 1
+        return f"{fingerprint}-{occurrence}"
+
+
+def row_ids_for(texts):
+    """텍스트 목록 전체의 행 ID 목록"""
+    fingerprinter = RowFingerprinter()
+    return [fingerprinter(text) for text in texts]
+
+
+def chunk_ids_for(row_id, chunk_count):
+    """행 하나에서 나온 청크들의 벡터 ID 목록"""
+    return [f"{row_id}:{i}" for i in range(chunk_count)]
+
+
+def load_row_index(index_dir):
+    """저장된 행 ID → 청크 수 매핑을 읽습니다."""
+    path = os.path.join(index_dir, ROW_INDEX_FILE)
+    row_index = {}
+    if not os.path.exists(path):
+        return row_index
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            row_id, _, count = line.rstrip("\n").partition("\t")
+            if row_id:
+                row_index[row_id] = int(count or 1)
+    return row_index
+
+
+def save_row_index(index_dir, row_index):
+    """행 ID → 청크 수 매핑을 원자적으로 저장합니다."""
+    path = os.path.join(index_dir, ROW_INDEX_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row_id, count in row_index.items():
+            f.write(f"{row_id}\t{count}\n")
+    os.replace(tmp_path, path)
+
+
+def removed_rows(stored_row_index, current_row_ids):
+    """저장되어 있지만 현재 원본에는 없는 행 ID 목록
+
+    내용이 바뀐 행은 지문이 달라지므로 '이전 행 삭제 + 새 행 추가'로 처리됩니다.
+    """
+    return [row_id for row_id in stored_row_index if row_id not in current_row_ids]
+
+
+def batched(items, batch_size):
+    """리스트를 batch_size 단위로 잘라 순회합니다."""
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def reset_index_dir(index_dir):
+    """재빌드 전에 기존 인덱스 폴더를 비웁니다."""
+    if os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    os.makedirs(index_dir, exist_ok=True)
+
+
+def finalize_manifest(index_dir, manifest, doc_count, chunk_count):
+    """빌드가 끝난 뒤 결과 정보를 더해 매니페스트를 기록합니다. 매니페스트가 있어야만 재사용됩니다."""
+    manifest = dict(manifest)
+    manifest["doc_count"] = doc_count
+    manifest["chunk_count"] = chunk_count
+    manifest["created_at"] = datetime.now().isoformat(timespec="seconds")
+    save_manifest(index_dir, manifest)
+    return manifest
@@ -0,0 +1,61 @@
+"""응답 지연 지표 (첫 토큰까지 시간 등)
+
+프로세스 공용 기록기에 지표 이름별로 최근 측정값을 보관하고 p50/p95/p99를 계산합니다.
+두 챗봇 앱이 같은 방식으로 기록하고 사이드바에 표시합니다.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+
+# 지표별로 보관하는 최근 측정값 수
+WINDOW_SIZE = 500
+
+
+class LatencyRecorder:
+    """지표 이름 → 최근 측정값(초) 목록"""
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.window_size = window_size
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._values.setdefault(name, deque(maxlen=self.window_size)).append(seconds)
+
+    def names(self):
+        with self._lock:
+            return list(self._values)
+
+    def summary(self, name):
+        """{count, p50, p95, p99} (측정값이 없으면 None)"""
+        with self._lock:
+            values = list(self._values.get(name, ()))
+        if not values:
+            return None
+        return {
+            "count": len(values),
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)),
+        }
+
+
+recorder = LatencyRecorder()
+
+
+def record(name, seconds):
+    recorder.record(name, seconds)
+
+
+def summary(name):
+    return recorder.summary(name)
+
+
+def format_summary(label, name):
+    """사이드바 표시용 한 줄 요약"""
+    stats = summary(name)
+    if stats is None:
+        return f"{label}: 측정값 없음"
+    return f"{label}: p50 {stats['p50']:.2f}s · p95 {stats['p95']:.2f}s ({stats['count']:,}회)"
@@ -0,0 +1,309 @@
+"""프로세스 공용 LLM 게이트웨이 (공유 클라이언트 + 동시 실행 제한 + 공정 대기열 + 속도 제한)
+
+세션마다, 메시지마다 ChatGoogleGenerativeAI를 새로 만들지 않고 설정별로 클라이언트 하나를
+공유합니다(HTTP 연결 재사용). 모든 호출은 게이트웨이에서 실행 슬롯을 받아야 시작되며,
+- 동시에 실행되는 호출은 LLM_MAX_CONCURRENCY개 이하로 제한하고
+- 대기 중인 호출은 세션별 대기열을 돌아가며(라운드 로빈) 꺼내 한 세션이 몰아서 보내도
+  다른 세션이 밀리지 않게 하며
+- 토큰 버킷으로 분당 요청 수를 할당량(LLM_REQUESTS_PER_MINUTE) 이하로 맞춥니다.
+대기열 길이와 대기 시간은 stats()와 latency_metrics("llm_wait")로 확인할 수 있습니다.
+
+세션은 session_scope(세션 ID) 블록 안에서 호출한 LLM 요청에 붙습니다 (contextvars이므로
+LangChain이 병렬 실행에 쓰는 스레드에도 전달됩니다).
+"""
+import contextlib
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import ConfigDict
+
+import latency_metrics
+import llm_resilience
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Gemini 프로젝트 할당량에 맞춤 (분당 요청 수, 순간 허용량)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+# 이 시간 안에 슬롯을 받지 못하면 포기 (0 이하이면 무제한 대기)
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "120"))
+# 취소 표시를 확인하는 간격 (대기 중인 시도가 포기되면 이 안에 대기열에서 빠짐)
+CANCEL_POLL_SECONDS = 0.05
+# 제공자 호출에 넘기는 최소 시간 제한 (마감 직전 시도도 즉시 실패하지 않게)
+MIN_CALL_TIMEOUT_SECONDS = 1.0
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+# 세션을 지정하지 않은 호출이 쓰는 대기열
+ANONYMOUS_SESSION = "anonymous"
+
+_session = contextvars.ContextVar("llm_gateway_session", default=ANONYMOUS_SESSION)
+
+
+class LLMQueueTimeout(llm_resilience.QueueRejected):
+    """대기열에서 제한 시간 안에 실행 슬롯을 받지 못함"""
+
+
+class LLMQueueCancelled(llm_resilience.AttemptCancelled):
+    """슬롯을 기다리던 시도가 취소됨 (마감 초과 · 헤지 패배)"""
+
+
+@contextlib.contextmanager
+def session_scope(session_id):
+    """블록 안에서 호출하는 LLM 요청을 session_id 대기열에 넣습니다."""
+    token = _session.set(str(session_id))
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+class TokenBucket:
+    """초당 rate개씩 채워지고 최대 capacity개까지 쌓이는 토큰 버킷 (잠금은 호출자가 관리)"""
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now):
+        """토큰이 있으면 하나 쓰고 0을, 없으면 다음 토큰까지 남은 초를 반환합니다."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class LLMGateway:
+    """동시 실행 수, 세션별 공정 대기열, 요청 속도를 함께 관리하는 스케줄러"""
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 burst=LLM_BURST, queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout = queue_timeout if queue_timeout > 0 else None
+        self._bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self._cond = threading.Condition()
+        # 세션 → 대기 중인 티켓, 순서는 다음에 꺼낼 세션 순 (라운드 로빈)
+        self._queues = OrderedDict()
+        self._granted = set()
+        self._in_flight = 0
+        self._tickets = itertools.count()
+        self.completed = 0
+        self.timeouts = 0
+
+    def _dispatch(self):
+        """빈 슬롯과 토큰이 있는 만큼 세션을 돌아가며 티켓을 허가합니다. 다음 토큰까지의 초를 반환."""
+        while self._queues and self._in_flight < self.max_concurrency:
+            wait = self._bucket.try_take(time.monotonic())
+            if wait > 0:
+                return wait
+            session, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            del self._queues[session]
+            if queue:
+                # 남은 요청이 있으면 맨 뒤로 보내 다른 세션 차례를 먼저 줌
+                self._queues[session] = queue
+            self._granted.add(ticket)
+            self._in_flight += 1
+            self._cond.notify_all()
+        return None
+
+    def acquire(self, session_id=None, timeout=None, cancelled=None):
+        """실행 슬롯을 받을 때까지 기다립니다. 대기 시간(초)을 반환합니다.
+
+        cancelled(threading.Event)가 설정되면 대기를 멈추고 LLMQueueCancelled를 냅니다.
+        """
+        session = session_id or _session.get()
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._cond:
+            ticket = next(self._tickets)
+            self._queues.setdefault(session, deque()).append(ticket)
+            while ticket not in self._granted:
+                refill_wait = self._dispatch()
+                if ticket in self._granted:
+                    break
+                if cancelled is not None and cancelled.is_set():
+                    self._cancel(session, ticket)
+                    raise LLMQueueCancelled("LLM 대기열에서 기다리던 호출이 취소되었습니다.")
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    self._cancel(session, ticket)
+                    self.timeouts += 1
+                    raise LLMQueueTimeout(f"LLM 대기열에서 {timeout:.0f}초 안에 차례를 받지 못했습니다.")
+                poll = CANCEL_POLL_SECONDS if cancelled is not None else None
+                waits = [w for w in (refill_wait, remaining, poll) if w is not None]
+                self._cond.wait(min(waits) if waits else None)
+            self._granted.discard(ticket)
+        if cancelled is not None and cancelled.is_set():
+            # 허가와 취소가 겹친 경우 슬롯을 바로 돌려줌
+            self.release()
+            raise LLMQueueCancelled("LLM 대기열에서 기다리던 호출이 취소되었습니다.")
+        waited = time.monotonic() - started
+        latency_metrics.record("llm_wait", waited)
+        return waited
+
+    def _cancel(self, session, ticket):
+        queue = self._queues.get(session)
+        if queue is not None:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[session]
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self.completed += 1
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, session_id=None, timeout=None, cancelled=None):
+        """with 블록 동안 실행 슬롯 하나를 점유합니다."""
+        self.acquire(session_id, timeout, cancelled)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """실행 중/대기 중 호출 수, 대기 세션 수, 완료·시간 초과 횟수"""
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "waiting_sessions": len(self._queues),
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "max_concurrency": self.max_concurrency,
+            }
+
+
+class GatedChatModel(BaseChatModel):
+    """호출마다 게이트웨이 슬롯을 받아 내부 채팅 모델을 실행하는 래퍼 (스트리밍 동안 슬롯 유지)
+
+    호출은 llm_resilience를 거쳐 단계 예산 · 재시도 · 헤징 · 서킷 브레이커가 적용됩니다.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    gateway: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gated-{self.inner._llm_type}"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        def attempt(hedge, deadline_at):
+            with self._slot(hedge, deadline_at):
+                return self.inner._generate(messages, stop=stop, **self._call_kwargs(kwargs, deadline_at))
+
+        return llm_resilience.call(attempt)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        def open_stream(hedge, deadline_at):
+            with self._slot(hedge, deadline_at):
+                yield from self.inner._stream(messages, stop=stop, **self._call_kwargs(kwargs, deadline_at))
+
+        # 토큰 콜백은 바깥 BaseChatModel.stream이 호출
+        yield from llm_resilience.stream(open_stream)
+
+    def _slot(self, hedge, deadline_at):
+        # 시도가 포기되면(llm_resilience 취소 표시) 슬롯 대기를 멈춤
+        return self.gateway.slot(
+            timeout=self._slot_timeout(hedge, deadline_at), cancelled=llm_resilience.attempt_cancelled()
+        )
+
+    @staticmethod
+    def _call_kwargs(kwargs, deadline_at):
+        """제공자 호출 시간 제한을 단계 마감에 맞춤 (포기한 요청이 슬롯을 오래 쥐지 않게)"""
+        if "timeout" in kwargs:
+            return kwargs
+        timeout = max(deadline_at - time.monotonic(), MIN_CALL_TIMEOUT_SECONDS)
+        return {**kwargs, "timeout": timeout}
+
+    def _slot_timeout(self, hedge, deadline_at):
+        """헤지 요청은 빈 슬롯이 있을 때만, 원 요청은 단계 마감까지 대기"""
+        if hedge:
+            return 0
+        remaining = max(deadline_at - time.monotonic(), 0.001)
+        queue_timeout = self.gateway.queue_timeout
+        return remaining if queue_timeout is None else min(remaining, queue_timeout)
+
+
+_gateway = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_gateway():
+    """프로세스 공용 게이트웨이를 반환합니다."""
+    global _gateway
+    with _lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+def get_chat_model(model=DEFAULT_MODEL, temperature=0.7, max_output_tokens=8192,
+                   timeout=llm_resilience.LLM_CALL_TIMEOUT_SECONDS, api_key=None):
+    """설정별로 하나씩 만든 공유 Gemini 클라이언트를 게이트웨이 래퍼로 감싸 반환합니다."""
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    key = (model, temperature, max_output_tokens, timeout, api_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ChatGoogleGenerativeAI(
+                model=model,
+                temperature=temperature,
+                max_output_tokens=max_output_tokens,
+                timeout=timeout,
+                # 재시도는 llm_resilience만 담당 (클라이언트 내부 재시도는 슬롯을 쥔 채 예산 밖에서 돎)
+                max_retries=0,
+                api_key=api_key,
+            )
+            _clients[key] = client
+    return GatedChatModel(inner=client, gateway=get_gateway())
+
+
+def format_stats():
+    """사이드바 표시용 한 줄 요약"""
+    stats = get_gateway().stats()
+    wait = latency_metrics.summary("llm_wait")
+    wait_text = f" · 대기 p95 {wait['p95']:.2f}s" if wait else ""
+    return (
+        f"🚦 LLM: 실행 {stats['in_flight']}/{stats['max_concurrency']} · "
+        f"대기 {stats['queued']}건 ({stats['waiting_sessions']}세션){wait_text}"
+    )
@@ -0,0 +1,469 @@
+"""LLM 호출 시간 예산, 재시도, 헤징, 서킷 브레이커
+
+- 턴 마감(TurnDeadline): 질문 한 번에 쓸 전체 시간을 정하고 질문 재작성 → 검색 → 답변 생성
+  단계에 나눠 줍니다. 앞 단계가 건너뛰어지거나 일찍 끝나면 남은 시간은 뒤 단계로 넘어갑니다.
+  turn_scope / stage_scope로 지정하며 contextvars라 LangChain 실행 스레드에도 전달됩니다.
+- 재시도: 일시적인 오류(시간 초과, 429, 5xx, 연결 오류)만 지터를 준 지수 백오프로 다시 시도하고,
+  남은 예산 안에서만 시도합니다. 스트리밍은 첫 조각이 나오기 전까지만 재시도합니다.
+- 헤징(LLM_HEDGING=1): 첫 요청이 최근 p95보다 오래 걸리면 두 번째 요청을 보내 먼저 끝난 쪽을
+  씁니다. 헤지 요청은 게이트웨이에 빈 슬롯이 있을 때만 보냅니다.
+- 포기한 시도: 마감이 지나거나 헤지에 져서 더 기다리지 않는 시도는 취소 표시를 합니다. 아직
+  슬롯을 기다리는 중이면 대기를 멈추고, 스트림은 다음 조각에서 닫혀 슬롯을 반환합니다. 이미
+  실행 중인 요청은 단계 마감에 맞춘 클라이언트 시간 제한으로 끝납니다. 포기한 시도가 아직
+  슬롯을 쥐고 있으면 그 위에 재시도 · 헤지 요청을 더 보내지 않습니다.
+- 서킷 브레이커: 제공자 오류가 연속으로 쌓이면 일정 시간 호출을 바로 실패시키고, 이후 한 번의
+  시험 호출이 성공하면 다시 엽니다.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import latency_metrics
+
+logger = logging.getLogger(__name__)
+
+# 질문 한 번(턴)의 전체 시간 예산과 단계별 몫
+LLM_TURN_DEADLINE_SECONDS = float(os.getenv("LLM_TURN_DEADLINE_SECONDS", "90"))
+STAGE_SHARES = {"rewrite": 0.15, "retrieval": 0.15, "generation": 0.7}
+STAGES = tuple(STAGE_SHARES)
+# 턴 마감 없이 호출할 때의 호출당 예산
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "60"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 8.0
+
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+# p95를 믿을 만큼 측정값이 쌓이기 전에는 헤징하지 않음
+HEDGE_MIN_SAMPLES = 20
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# 재시도할 제공자 오류 (google.api_core / httpx 예외는 이름으로 판별해 선택 의존성으로 둠)
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "ConnectError", "ReadTimeout",
+    "RemoteProtocolError", "ChatGoogleGenerativeAIError",
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """단계 예산 안에 LLM 응답을 받지 못함"""
+
+
+class CircuitOpenError(RuntimeError):
+    """제공자 장애로 서킷이 열려 호출을 바로 실패시킴"""
+
+
+class QueueRejected(TimeoutError):
+    """로컬 대기열에서 거절됨 (제공자 오류가 아니므로 재시도 · 브레이커 집계에서 제외)"""
+
+
+class AttemptCancelled(QueueRejected):
+    """더 기다리지 않기로 한 시도가 제공자에 요청을 보내기 전에 멈춤"""
+
+
+def is_retryable(exc):
+    if isinstance(exc, (QueueRejected, CircuitOpenError)):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def backoff_delay(attempt):
+    """전체 지터 지수 백오프 (0 ~ base × 2^attempt 사이 임의 값)"""
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+class TurnDeadline:
+    """턴 전체 마감 시각과 단계별 마감 시각"""
+
+    def __init__(self, total_seconds=LLM_TURN_DEADLINE_SECONDS, shares=None):
+        self.shares = shares or STAGE_SHARES
+        self.started = time.monotonic()
+        self.ends_at = self.started + total_seconds
+        self._stage_ends = {}
+        self._lock = threading.Lock()
+
+    def stage_end(self, stage):
+        """단계의 마감 시각 (처음 물을 때 남은 시간을 이 단계와 이후 단계 몫의 비율로 나눠 정함)"""
+        with self._lock:
+            if stage not in self._stage_ends:
+                later = STAGES[STAGES.index(stage):] if stage in STAGES else (stage,)
+                total_share = sum(self.shares.get(s, 0) for s in later) or 1.0
+                remaining = max(self.ends_at - time.monotonic(), 0.0)
+                share = self.shares.get(stage, total_share)
+                self._stage_ends[stage] = time.monotonic() + remaining * share / total_share
+            return self._stage_ends[stage]
+
+
+_deadline = contextvars.ContextVar("llm_turn_deadline", default=None)
+_stage = contextvars.ContextVar("llm_stage", default="generation")
+_attempt_cancel = contextvars.ContextVar("llm_attempt_cancel", default=None)
+
+
+@contextlib.contextmanager
+def turn_scope(deadline=None):
+    """블록 안의 LLM 호출 · 검색에 턴 마감을 적용합니다."""
+    token = _deadline.set(deadline or TurnDeadline())
+    try:
+        yield _deadline.get()
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def stage_scope(stage):
+    """블록 안의 호출을 stage 단계 예산으로 제한합니다 (기본 단계는 "generation")."""
+    token = _stage.set(stage)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def current_stage():
+    return _stage.get()
+
+
+def stage_deadline(stage=None):
+    """현재(또는 지정한) 단계의 마감 시각 (time.monotonic 기준)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return time.monotonic() + LLM_CALL_TIMEOUT_SECONDS
+    return deadline.stage_end(stage or _stage.get())
+
+
+def remaining_budget(stage=None):
+    """현재 단계에 남은 초 (0 이상)"""
+    return max(stage_deadline(stage) - time.monotonic(), 0.0)
+
+
+def attempt_cancelled():
+    """실행 중인 시도의 취소 이벤트 (시도 밖이면 None). 게이트웨이가 슬롯 대기를 멈추는 데 씁니다."""
+    return _attempt_cancel.get()
+
+
+class CircuitBreaker:
+    """연속 실패 횟수 기반 서킷 브레이커 (closed → open → half_open → closed)"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, open_seconds=BREAKER_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    raise CircuitOpenError("AI 서비스 장애로 잠시 호출을 중단했습니다. 잠시 후 다시 시도해주세요.")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_running:
+                    raise CircuitOpenError("AI 서비스 복구 여부를 확인하는 중입니다. 잠시 후 다시 시도해주세요.")
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def cancel_trial(self):
+        """시험 호출이 제공자에 닿기 전에 끝난 경우 (다음 호출이 다시 시험)"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("LLM circuit opened after %d failures", self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class ResilienceStats:
+    """재시도 · 헤징 · 마감 초과 횟수"""
+
+    def __init__(self):
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "deadline_exceeded": self.deadline_exceeded,
+            }
+
+
+breaker = CircuitBreaker()
+stats = ResilienceStats()
+# 호출을 마감 시각까지만 기다리기 위한 실행 스레드 (제한 시간이 지난 호출은 버려짐)
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+
+
+def _submit(fn, *args):
+    # 세션 · 마감 contextvar를 실행 스레드로 전달
+    return _executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _busy(abandoned):
+    """포기한 시도 중 아직 끝나지 않은(슬롯을 쥐고 있을 수 있는) 것이 있는지"""
+    return any(attempt.running() for attempt in abandoned)
+
+
+class _Attempt:
+    """실행 스레드에서 도는 fn 호출 하나와 취소 이벤트"""
+
+    def __init__(self, fn, *args):
+        self.cancelled = threading.Event()
+        self.future = _submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        _attempt_cancel.set(self.cancelled)
+        if self.cancelled.is_set():
+            raise AttemptCancelled("취소된 LLM 호출입니다.")
+        return fn(*args)
+
+    def running(self):
+        return not self.future.done()
+
+    def cancel(self):
+        """시작 전이면 실행하지 않고, 슬롯 대기 중이면 대기를 멈추게 합니다."""
+        self.cancelled.set()
+        self.future.cancel()
+
+
+def _hedge_delay(metric):
+    if not LLM_HEDGING:
+        return None
+    summary = latency_metrics.summary(metric)
+    if summary is None or summary["count"] < HEDGE_MIN_SAMPLES:
+        return None
+    return summary["p95"]
+
+
+def _with_retries(attempt_fn, abandoned=()):
+    """attempt_fn(deadline_at)를 재시도 · 서킷 브레이커 규칙에 따라 실행합니다.
+
+    abandoned는 attempt_fn이 포기한 시도 목록이며, 그중 아직 실행 중인 것이 있으면 재시도하지 않습니다.
+    """
+    deadline_at = stage_deadline()
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = attempt_fn(deadline_at)
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded):
+                # 턴 예산이 끝난 것이지 제공자 장애가 아니므로 성공 · 실패 어느 쪽으로도 세지 않음
+                breaker.cancel_trial()
+                stats.add("deadline_exceeded")
+            elif isinstance(e, QueueRejected) or not is_retryable(e):
+                # 대기열 거절 · 잘못된 요청 등은 시험 호출만 풀어 주고 브레이커 상태는 그대로 둠
+                breaker.cancel_trial()
+                raise
+            else:
+                breaker.record_failure()
+            delay = backoff_delay(attempt)
+            if attempt >= LLM_MAX_RETRIES or time.monotonic() + delay >= deadline_at or _busy(abandoned):
+                raise
+            logger.info("LLM call failed (%s), retrying in %.2fs", type(e).__name__, delay)
+            stats.add("retries")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+def call(fn):
+    """fn(hedge, deadline_at)로 LLM을 호출해 결과를 반환합니다 (예산 · 재시도 · 헤징 적용).
+
+    hedge=True는 헤지 요청임을 뜻하며, fn은 이때 빈 슬롯이 없으면 QueueRejected를 내야 합니다.
+    fn은 실행 스레드에서 돌며 attempt_cancelled()로 취소 여부를 확인할 수 있습니다.
+    """
+    abandoned = []
+
+    def attempt(deadline_at):
+        started = time.monotonic()
+        attempts = [_Attempt(fn, False, deadline_at)]
+        hedge_after = _hedge_delay("llm_call")
+        if hedge_after is not None and started + hedge_after < deadline_at and not _busy(abandoned):
+            done, _ = wait([attempts[0].future], timeout=hedge_after)
+            if not done:
+                stats.add("hedges")
+                attempts.append(_Attempt(fn, True, deadline_at))
+        error = None
+        pending = {a.future: a for a in attempts}
+        try:
+            while pending:
+                done, _ = wait(list(pending), timeout=max(deadline_at - time.monotonic(), 0),
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded("LLM 응답 시간 예산을 초과했습니다.")
+                for future in done:
+                    pending.pop(future)
+                    if future.exception() is None:
+                        if future is not attempts[0].future:
+                            stats.add("hedge_wins")
+                        latency_metrics.record("llm_call", time.monotonic() - started)
+                        return future.result()
+                    # 헤지 요청이 슬롯을 못 받은 경우는 원 요청 결과를 기다림
+                    if error is None or not isinstance(future.exception(), QueueRejected):
+                        error = future.exception()
+            raise error
+        finally:
+            # 마감 초과 · 헤지 승리로 더 기다리지 않는 시도는 취소
+            for pending_attempt in pending.values():
+                pending_attempt.cancel()
+                abandoned.append(pending_attempt)
+
+    return _with_retries(attempt, abandoned)
+
+
+class _StreamWorker:
+    """스트림 하나를 별도 스레드에서 읽어 공용 이벤트 큐에 넣는 작업자"""
+
+    def __init__(self, worker_id, open_stream, hedge, deadline_at, events):
+        self.worker_id = worker_id
+        self.cancelled = threading.Event()
+        self._events = events
+        self.future = _submit(self._run, open_stream, hedge, deadline_at)
+
+    def _run(self, open_stream, hedge, deadline_at):
+        _attempt_cancel.set(self.cancelled)
+        stream = None
+        try:
+            if self.cancelled.is_set():
+                raise AttemptCancelled("취소된 LLM 스트림입니다.")
+            stream = open_stream(hedge, deadline_at)
+            for chunk in stream:
+                if self.cancelled.is_set():
+                    break
+                self._events.put((self.worker_id, "chunk", chunk))
+            if not self.cancelled.is_set():
+                self._events.put((self.worker_id, "done", None))
+        except Exception as e:
+            self._events.put((self.worker_id, "error", e))
+        finally:
+            # 내부 제너레이터는 이 스레드에서 닫아 게이트웨이 슬롯을 반환
+            if stream is not None:
+                stream.close()
+
+    def running(self):
+        return not self.future.done()
+
+    def cancel(self):
+        """시작 전이면 실행하지 않고, 실행 중이면 다음 조각에서 스트림을 닫습니다."""
+        self.cancelled.set()
+        self.future.cancel()
+
+
+def stream(open_stream):
+    """open_stream(hedge, deadline_at)이 만드는 스트림의 조각을 내보냅니다.
+
+    첫 조각이 나오기 전까지는 예산 · 재시도 · 헤징을 적용하고(먼저 첫 조각을 낸 스트림을 사용),
+    이후에는 조각 사이 대기도 단계 마감까지만 기다립니다. 마감을 넘기거나 소비자가 중간에
+    그만 읽으면 스트림을 취소합니다.
+    """
+    state = {}
+    abandoned = []
+
+    def first_chunk(deadline_at):
+        started = time.monotonic()
+        events = queue.Queue()
+        workers = [_StreamWorker(0, open_stream, False, deadline_at, events)]
+        hedge_after = _hedge_delay("llm_first_chunk")
+        hedge_at = started + hedge_after if hedge_after is not None and not _busy(abandoned) else None
+        failed = {}
+        winner = None
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    raise DeadlineExceeded("LLM 첫 응답 시간 예산을 초과했습니다.")
+                wake_at = deadline_at if hedge_at is None or len(workers) > 1 else min(deadline_at, hedge_at)
+                try:
+                    worker_id, kind, payload = events.get(timeout=max(wake_at - now, 0.001))
+                except queue.Empty:
+                    if hedge_at is not None and len(workers) == 1 and time.monotonic() >= hedge_at:
+                        stats.add("hedges")
+                        workers.append(_StreamWorker(1, open_stream, True, deadline_at, events))
+                    continue
+                if kind == "error":
+                    failed[worker_id] = payload
+                    if len(failed) == len(workers):
+                        # 헤지가 슬롯을 못 받아 실패했다면 원 요청 오류를 우선 보고
+                        raise failed.get(0, payload)
+                    continue
+                winner = workers[worker_id]
+                if worker_id != 0:
+                    stats.add("hedge_wins")
+                latency_metrics.record("llm_first_chunk", time.monotonic() - started)
+                state.update(events=events, winner=winner, deadline_at=deadline_at)
+                return kind, payload
+        finally:
+            # 마감 초과 · 헤지 패배로 더 읽지 않는 스트림은 취소
+            for worker in workers:
+                if worker is not winner and worker.worker_id not in failed:
+                    worker.cancel()
+                    abandoned.append(worker)
+
+    kind, payload = _with_retries(first_chunk, abandoned)
+    if kind == "done":
+        return
+    events, winner, deadline_at = state["events"], state["winner"], state["deadline_at"]
+    try:
+        yield payload
+        while True:
+            try:
+                worker_id, kind, payload = events.get(timeout=max(deadline_at - time.monotonic(), 0.001))
+            except queue.Empty:
+                stats.add("deadline_exceeded")
+                raise DeadlineExceeded("LLM 응답 시간 예산을 초과했습니다.")
+            if worker_id != winner.worker_id:
+                continue
+            if kind == "chunk":
+                yield payload
+            elif kind == "done":
+                return
+            else:
+                raise payload
+    finally:
+        # 마감 초과 · 소비자 중단(GeneratorExit) 시 작업자가 내부 스트림을 닫게 함
+        winner.cancel()
+
+
+def format_stats():
+    """사이드바 표시용 한 줄 요약"""
+    snapshot = stats.snapshot()
+    return (
+        f"🛡️ 서킷 {breaker.state} · 재시도 {snapshot['retries']:,} · "
+        f"헤징 {snapshot['hedges']:,}(승 {snapshot['hedge_wins']:,}) · 시간 초과 {snapshot['deadline_exceeded']:,}"
+    )
@@ -1,32 +1,23 @@
 import pandas as pd
 import os
 
+import data_access
+import dataset_metadata
+
 print("=" * 80)
 print("CSV 파일 분석 및 병합 시작")
 print("=" * 80)
 
 # 1. 각 CSV 파일 읽기
 print("\n[1단계] CSV 파일 읽기 중...")
-try:
-    df1 = pd.read_csv('file/big_data_set1_f.csv', encoding='utf-8')
-    print(f"✓ big_data_set1_f.csv 읽기 완료: {len(df1)}행")
-except:
-    df1 = pd.read_csv('file/big_data_set1_f.csv', encoding='cp949')
-    print(f"✓ big_data_set1_f.csv 읽기 완료 (cp949 인코딩): {len(df1)}행")
-
-try:
-    df2 = pd.read_csv('file/big_data_set2_f.csv', encoding='utf-8')
-    print(f"✓ big_data_set2_f.csv 읽기 완료: {len(df2)}행")
-except:
-    df2 = pd.read_csv('file/big_data_set2_f.csv', encoding='cp949')
-    print(f"✓ big_data_set2_f.csv 읽기 완료 (cp949 인코딩): {len(df2)}행")
-
-try:
-    df3 = pd.read_csv('file/big_data_set3_f.csv', encoding='utf-8')
-    print(f"✓ big_data_set3_f.csv 읽기 완료: {len(df3)}행")
-except:
-    df3 = pd.read_csv('file/big_data_set3_f.csv', encoding='cp949')
-    print(f"✓ big_data_set3_f.csv 읽기 완료 (cp949 인코딩): {len(df3)}행")
+df1 = data_access.read_table('file/big_data_set1_f.csv')
+print(f"✓ big_data_set1_f.csv 읽기 완료 ({data_access.source_info('file/big_data_set1_f.csv')['encoding']} 인코딩): {len(df1)}행")
+
+df2 = data_access.read_table('file/big_data_set2_f.csv')
+print(f"✓ big_data_set2_f.csv 읽기 완료 ({data_access.source_info('file/big_data_set2_f.csv')['encoding']} 인코딩): {len(df2)}행")
+
+df3 = data_access.read_table('file/big_data_set3_f.csv')
+print(f"✓ big_data_set3_f.csv 읽기 완료 ({data_access.source_info('file/big_data_set3_f.csv')['encoding']} 인코딩): {len(df3)}행")
 
 # 2. 데이터 분석
 print("\n" + "=" * 80)
@@ -83,6 +74,11 @@ print(f"   총 행 개수: {len(df_final):,}")
 print(f"   총 열 개수: {len(df_final.columns)}")
 print(f"   파일 크기: {os.path.getsize(output_file) / (1024*1024):.2f} MB")
 
+# 앱 시작 시 원본 대신 읽는 메타데이터 (지역/업종 목록, 행 수, 결측률 등)
+metadata = dataset_metadata.build_metadata(df_final, output_file)
+metadata_file = dataset_metadata.write_metadata(output_file, metadata)
+print(f"   메타데이터: {metadata_file} (지역 {len(metadata['regions'])}개, 업종 {len(metadata['business_types'])}개)")
+
 # 5. 최종 데이터 미리보기
 print("\n" + "=" * 80)
 print("[5단계] 병합된 데이터 미리보기")
@@ -0,0 +1,64 @@
+"""사이드바 성능 패널 (turn_tracing 기록 표시 + JSONL / Prometheus 내려받기)"""
+import pandas as pd
+import streamlit as st
+
+import turn_tracing
+
+# 턴 속성 → 패널 표시 이름
+ATTRIBUTE_LABELS = {
+    "dataset": "데이터셋",
+    "cache_hit": "캐시 적중",
+    "prompt_tokens": "프롬프트 토큰",
+    "response_tokens": "응답 토큰",
+    "rows_fetched": "조회 행 수",
+    "filters": "조회 조건",
+    "documents": "참고 문서 수",
+}
+
+
+def render_perf_panel(app):
+    """'성능 패널 보기'를 켰을 때만 마지막 턴의 단계별 시간과 단계별 분위수를 보여 줍니다."""
+    if not st.toggle("⏱️ 성능 패널 보기", key=f"perf_panel_{app}"):
+        return
+
+    recent = turn_tracing.store.recent(app)
+    if recent:
+        last = recent[0]
+        st.markdown(f"**마지막 턴** · {last['duration']:.2f}초 · {last['status']}")
+        st.dataframe(
+            pd.DataFrame(
+                [{"단계": span["name"], "시작(초)": span["start"], "소요(초)": span["duration"]}
+                 for span in last["spans"]]
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+        attributes = [
+            f"{label} {last['attributes'][key]}"
+            for key, label in ATTRIBUTE_LABELS.items() if key in last["attributes"]
+        ]
+        if attributes:
+            st.caption(" · ".join(attributes))
+    else:
+        st.caption("아직 기록된 턴이 없습니다.")
+
+    summaries = turn_tracing.stage_summaries()
+    if summaries:
+        st.markdown("**단계별 지연 (최근 구간)**")
+        st.dataframe(
+            pd.DataFrame(
+                [{"단계": name, "p50": round(s["p50"], 3), "p95": round(s["p95"], 3),
+                  "p99": round(s["p99"], 3), "횟수": s["count"]}
+                 for name, s in summaries.items()]
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("JSONL", turn_tracing.export_jsonl(app), file_name=f"{app}_traces.jsonl",
+                           mime="application/x-ndjson", use_container_width=True)
+    with col2:
+        st.download_button("Prometheus", turn_tracing.export_prometheus(), file_name=f"{app}_metrics.prom",
+                           mime="text/plain", use_container_width=True)
@@ -0,0 +1,185 @@
+"""Supabase 조회 계획 (질문 조건 → PostgREST 필터 + 필요한 컬럼만 선택)
+
+질문에서 지역 · 업종 · 기준년월 · 재방문률 등급 조건을 찾아 PostgREST 필터
+(eq / in / gte · lte / ilike)로 내려보내고, 분석 유형별 프롬프트가 실제로 쓰는
+컬럼만 select 합니다. 지역/업종 값 목록은 업로드 단계가 남긴 메타데이터
+(dataset_metadata)에서 읽고, 메타데이터가 없으면 "OO구" 같은 지역 표현을 ilike로 찾습니다.
+같은 조건을 analysis_summary RPC의 p_filters 형식으로도 만들 수 있습니다.
+"""
+import re
+
+import dataset_metadata
+from shard_filter import QueryScopeExtractor, REGION_COLUMN, BUSINESS_COLUMN
+
+# 질문 범위 컬럼(메타데이터 · 원본 CSV 이름) → Supabase 컬럼
+SCOPE_COLUMNS = {REGION_COLUMN: "franchise_region", BUSINESS_COLUMN: "business_type"}
+
+# 분석 유형별 프롬프트 예시 행 컬럼 (supabase_chatbot 시스템 프롬프트의 데이터 설명 순서)
+PROMPT_COLUMNS = {
+    "카페업종": [
+        "franchise_name", "business_type", "franchise_region", "commercial_area", "male_ratio", "female_ratio",
+        "age_concentration", "main_customer_group", "loyalty_index", "commercial_area_type", "customer_type",
+    ],
+    "재방문율": [
+        "franchise_name", "franchise_region", "business_type", "base_year_month", "revisit_customer_ratio",
+        "new_customer_ratio", "monthly_sales", "monthly_usage_count", "monthly_customer_count",
+        "industry_avg_revisit_rate", "revisit_rate_grade",
+    ],
+    "요식업": [
+        "franchise_name", "franchise_region", "business_type", "base_year_month", "monthly_sales",
+        "delivery_sales_ratio", "monthly_avg_price", "residential_customer_ratio", "workplace_customer_ratio",
+        "floating_population_customer_ratio", "sales_industry_diff",
+    ],
+}
+PROMPT_COLUMNS["통합분석"] = PROMPT_COLUMNS["카페업종"]
+
+# 기준년월 · 재방문률 등급 컬럼이 있는 테이블
+MONTH_TABLES = {"revisit_data", "restaurant_data"}
+GRADE_TABLES = {"revisit_data", "restaurant_data"}
+
+OPERATORS = ("eq", "in", "gte", "lte", "ilike")
+
+_YEAR_MONTH = re.compile(r"(20\d{2})\s*년\s*(1[0-2]|0?[1-9])\s*월(?:\s*(?:~|-|부터)\s*(1[0-2]|0?[1-9])\s*월)?")
+_DOTTED_MONTH = re.compile(r"(?<!\d)(20\d{2})[./-](1[0-2]|0?[1-9])(?!\d)")
+_COMPACT_MONTH = re.compile(r"(?<!\d)(20\d{2})(0[1-9]|1[0-2])(?!\d)")
+_YEAR_HALF = re.compile(r"(20\d{2})\s*년\s*(상반기|하반기|[1-4]\s*분기)")
+_YEAR = re.compile(r"(20\d{2})\s*년")
+_GRADE_WORD = re.compile(r"(?<![A-Za-z])(high|mid|low)(?![A-Za-z])", re.IGNORECASE)
+_GRADE_PHRASE = re.compile(r"재방문\s*[율률]?\s*(?:등급)?\s*[이가은는]?\s*(높은|우수한|중간|보통인|낮은|저조한)")
+_GRADE_VALUES = {"높은": "High", "우수한": "High", "중간": "Mid", "보통인": "Mid", "낮은": "Low", "저조한": "Low"}
+# 메타데이터가 없을 때 쓰는 지역 표현 ("성동구", "해운대구의", "분당구에서" …)
+_REGION_WORD = re.compile(r"(?<![가-힣])([가-힣]{1,4}(?:구|군))(?=$|[^가-힣]|[의에은는이가을를와과도])")
+_NOT_REGIONS = {"연구", "요구", "가구", "입구", "출구", "도구", "친구", "추구", "부구"}
+
+
+class QueryPlan:
+    """테이블 하나에 대한 조회 계획: 선택 컬럼과 (컬럼, 연산자, 값) 조건 목록"""
+
+    def __init__(self, table_name, columns=None, filters=()):
+        self.table_name = table_name
+        self.columns = tuple(columns) if columns else None
+        self.filters = tuple(filters)
+
+    def select_clause(self):
+        return ",".join(self.columns) if self.columns else "*"
+
+    def relaxed(self):
+        """조건을 모두 뺀 계획 (조건에 맞는 행이 없을 때 사용)"""
+        return QueryPlan(self.table_name, self.columns)
+
+    def rpc_filters(self):
+        """analysis_summary의 p_filters 형식: {"컬럼": {"연산자": 값, ...}}"""
+        filters = {}
+        for column, op, value in self.filters:
+            filters.setdefault(column, {})[op] = list(value) if op == "in" else value
+        return filters
+
+    def describe(self):
+        """화면 표시용 조건 요약 (조건이 없으면 빈 문자열)"""
+        return ", ".join(
+            f"{column} {op} {', '.join(map(str, value)) if op == 'in' else value}" for column, op, value in self.filters
+        )
+
+
+def apply_filters(query, filters):
+    """PostgREST 쿼리 빌더에 조건을 적용합니다. dict는 같음 조건({컬럼: 값})으로 처리합니다."""
+    if isinstance(filters, dict):
+        filters = [(column, "eq", value) for column, value in filters.items()]
+    for column, op, value in filters or ():
+        if op not in OPERATORS:
+            raise ValueError(f"unsupported filter operator: {op}")
+        if op == "in":
+            query = query.in_(column, list(value))
+        else:
+            query = getattr(query, op)(column, value)
+    return query
+
+
+def _value_filter(column, values):
+    values = sorted(values)
+    return (column, "eq", values[0]) if len(values) == 1 else (column, "in", tuple(values))
+
+
+def _extractor(table_name):
+    """업로드 메타데이터의 지역/업종 목록으로 만든 추출기 (메타데이터가 없으면 None)"""
+    source = dataset_metadata.TABLE_SOURCES.get(table_name)
+    metadata = dataset_metadata.load_metadata(source) if source else None
+    if not metadata or not (metadata.get("regions") or metadata.get("business_types")):
+        return None
+    return QueryScopeExtractor(regions=metadata.get("regions", ()), business_types=metadata.get("business_types", ()))
+
+
+def _scope_filters(question, table_name, extractor):
+    if extractor is None:
+        extractor = _extractor(table_name)
+    if extractor is not None:
+        scope = extractor.extract(question)
+        return [_value_filter(SCOPE_COLUMNS[column], values) for column, values in scope.items() if values]
+    # 값 목록이 없으면 지역 표현만 부분 일치로 찾음
+    regions = [word for word in _REGION_WORD.findall(question) if word not in _NOT_REGIONS]
+    return [("franchise_region", "ilike", f"%{regions[0]}%")] if regions else []
+
+
+def _month_range(question):
+    """질문의 기준년월 범위 (시작, 끝) YYYYMM. 연도가 없는 월은 모호하므로 무시합니다."""
+    match = _YEAR_MONTH.search(question)
+    if match:
+        year, start, end = int(match.group(1)), int(match.group(2)), match.group(3)
+        end = int(end) if end else start
+        return year * 100 + min(start, end), year * 100 + max(start, end)
+    match = _DOTTED_MONTH.search(question) or _COMPACT_MONTH.search(question)
+    if match:
+        value = int(match.group(1)) * 100 + int(match.group(2))
+        return value, value
+    match = _YEAR_HALF.search(question)
+    if match:
+        year, part = int(match.group(1)), match.group(2).replace(" ", "")
+        if part == "상반기":
+            return year * 100 + 1, year * 100 + 6
+        if part == "하반기":
+            return year * 100 + 7, year * 100 + 12
+        quarter = int(part[0])
+        return year * 100 + quarter * 3 - 2, year * 100 + quarter * 3
+    match = _YEAR.search(question)
+    if match:
+        year = int(match.group(1))
+        return year * 100 + 1, year * 100 + 12
+    return None
+
+
+def _grade(question):
+    match = _GRADE_WORD.search(question)
+    if match:
+        return match.group(1).capitalize()
+    match = _GRADE_PHRASE.search(question)
+    return _GRADE_VALUES[match.group(1)] if match else None
+
+
+def plan_columns(data_type, extra=()):
+    """프롬프트 예시 행 컬럼 + 요약 계산에 필요한 컬럼 (순서 유지, 중복 제거)"""
+    columns = list(PROMPT_COLUMNS.get(data_type, ()))
+    for column in extra:
+        if column not in columns:
+            columns.append(column)
+    return columns or None
+
+
+def plan_query(question, table_name, data_type, extra_columns=(), extractor=None):
+    """질문에서 조건을 찾아 테이블 조회 계획을 만듭니다."""
+    filters = _scope_filters(question, table_name, extractor)
+
+    if table_name in MONTH_TABLES:
+        month_range = _month_range(question)
+        if month_range:
+            start, end = month_range
+            if start == end:
+                filters.append(("base_year_month", "eq", start))
+            else:
+                filters.extend([("base_year_month", "gte", start), ("base_year_month", "lte", end)])
+
+    if table_name in GRADE_TABLES:
+        grade = _grade(question)
+        if grade:
+            filters.append(("revisit_rate_grade", "eq", grade))
+
+    return QueryPlan(table_name, plan_columns(data_type, extra_columns), filters)
@@ -0,0 +1,143 @@
+"""대화 맥락 질문 재작성 단계 (필요할 때만 LLM 호출)
+
+create_history_aware_retriever는 매 질문마다 LLM으로 질문을 다시 씁니다. 여기서는
+- 이전 대화가 없거나
+- 질문에 지시어/생략 단서(그거, 거기, 그럼, 아까 …)가 없으면
+LLM을 거치지 않고 질문을 그대로 검색에 사용합니다. LLM 재작성 결과는
+(이전 대화 요약 해시, 질문) 키로 프로세스 공용 LRU 캐시에 저장하고,
+경로별 호출 횟수를 로그와 stats()로 남깁니다.
+"""
+import hashlib
+import logging
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+
+import llm_resilience
+import turn_tracing
+
+logger = logging.getLogger(__name__)
+
+REWRITE_CACHE_SIZE = 2048
+# 이전 대화를 가리키는 지시어
+PRONOUN_CUES = (
+    '그것', '그거', '그게', '그걸', '이것', '이거', '이게', '저것', '저거', '거기', '그곳', '여기',
+    '그런', '이런', '저런', '그중', '그 중', '해당', '위의', '앞의', '앞에서', '아까', '방금', '그때',
+    '같은', '비슷한', '나머지', '반대로',
+)
+# 앞 질문에 이어지는 생략형 시작 표현
+ELLIPSIS_PREFIXES = ('그럼', '그러면', '그렇다면', '그리고', '그런데', '근데', '또', '그래서', '그 외', '그외', '더')
+ENGLISH_CUES = re.compile(r"\b(it|its|this|that|these|those|they|them|there|same)\b", re.IGNORECASE)
+# 이보다 짧은 질문은 앞 대화에 기대는 생략형으로 봄 (예: "매출은?", "이유는?")
+SHORT_QUESTION_CHARS = 8
+
+# 경로: 이전 대화 없음 / 독립 질문 / 캐시 적중 / LLM 재작성
+PATHS = ("no_history", "self_contained", "cache_hit", "llm")
+
+
+def _message_parts(message):
+    """dict({"role", "content"}) 또는 LangChain 메시지에서 (역할, 내용)을 꺼냅니다."""
+    if isinstance(message, dict):
+        return message.get("role", ""), message.get("content", "")
+    return getattr(message, "type", ""), getattr(message, "content", "")
+
+
+def prior_history(question, chat_history):
+    """현재 질문이 기록 끝에 이미 들어 있으면 제외한 이전 대화만 반환합니다."""
+    history = list(chat_history or [])
+    if history:
+        role, content = _message_parts(history[-1])
+        if role in ("user", "human") and content.strip() == question.strip():
+            history = history[:-1]
+    return history
+
+
+def history_digest(history):
+    """이전 대화의 해시 (재작성 캐시 키)"""
+    digest = hashlib.sha1()
+    for message in history:
+        role, content = _message_parts(message)
+        digest.update(f"{role}\x00{content}\x01".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def needs_rewrite(question):
+    """질문에 지시어/생략 단서가 있어 대화 맥락 없이는 이해하기 어려운지 판단합니다."""
+    text = question.strip()
+    if len(text.replace(" ", "")) < SHORT_QUESTION_CHARS:
+        return True
+    if text.startswith(ELLIPSIS_PREFIXES):
+        return True
+    if any(cue in text for cue in PRONOUN_CUES):
+        return True
+    return bool(ENGLISH_CUES.search(text))
+
+
+class RewriteStats:
+    """경로별 호출 횟수 (스레드 안전)"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, path):
+        with self._lock:
+            self._counts[path] += 1
+            counts = dict(self._counts)
+        logger.info("query rewrite path=%s counts=%s", path, counts)
+
+    def snapshot(self):
+        with self._lock:
+            return {path: self._counts.get(path, 0) for path in PATHS}
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+stats = RewriteStats()
+
+
+class QueryRewriter:
+    """필요할 때만 LLM으로 질문을 독립 질문으로 바꾸는 재작성기"""
+
+    def __init__(self, llm, prompt, cache_size=REWRITE_CACHE_SIZE):
+        self.chain = prompt | llm | StrOutputParser()
+        self.cache_size = cache_size
+
+    def rewrite(self, question, chat_history=None):
+        """검색에 쓸 질문을 반환합니다."""
+        history = prior_history(question, chat_history)
+        if not history:
+            stats.record("no_history")
+            return question
+        if not needs_rewrite(question):
+            stats.record("self_contained")
+            return question
+
+        key = (history_digest(history), " ".join(question.split()))
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                stats.record("cache_hit")
+                return _cache[key]
+
+        rewritten = self.chain.invoke({"input": question, "chat_history": history}).strip() or question
+        stats.record("llm")
+        with _cache_lock:
+            _cache[key] = rewritten
+            while len(_cache) > self.cache_size:
+                _cache.popitem(last=False)
+        return rewritten
+
+    def as_retriever_step(self, retriever):
+        """{"input", "chat_history"} 입력을 받아 (재작성한) 질문으로 검색하는 함수"""
+        def retrieve(inputs):
+            # 턴 마감(llm_resilience.turn_scope)이 있으면 재작성 · 검색 단계 예산을 따로 적용
+            with llm_resilience.stage_scope("rewrite"), turn_tracing.span("rewrite"):
+                query = self.rewrite(inputs["input"], inputs.get("chat_history"))
+            with llm_resilience.stage_scope("retrieval"), turn_tracing.span("retrieval"):
+                docs = retriever.invoke(query)
+            turn_tracing.annotate(rows_fetched=len(docs))
+            return docs
+        return retrieve
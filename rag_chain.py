@@ -0,0 +1,225 @@
+"""질문 분류와 분석 유형별 RAG 체인 구성 (Streamlit 비의존)
+
+gemini_rag.py의 체인 구성 로직을 화면 코드와 분리한 모듈입니다. 오프라인 벤치마크
+(benchmark_e2e.py)도 앱과 같은 체인을 그대로 사용합니다.
+"""
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain.chains.combine_documents import create_stuff_documents_chain
+
+import context_budget
+import llm_gateway
+import query_rewrite
+import shard_filter
+
+
+# 질문 분류 함수
+def classify_question(question):
+    """질문을 분석하여 어떤 데이터셋을 사용할지 결정합니다."""
+    question_lower = question.lower()
+    
+    # 카페 관련 키워드
+    cafe_keywords = ['카페', '커피', '음료', '디저트', '원두', '라떼', '아메리카노']
+    
+    # 재방문율 관련 키워드
+    revisit_keywords = ['재방문', '재방문율', '충성도', '단골', '리텐션', '이탈', '재구매']
+    
+    # 요식업 관련 키워드
+    restaurant_keywords = ['요식업', '식당', '음식점', '한식', '중식', '일식', '양식', '배달', '매출']
+    
+    # 키워드 매칭
+    if any(keyword in question_lower for keyword in cafe_keywords):
+        return "Q1", "카페업종"
+    elif any(keyword in question_lower for keyword in revisit_keywords):
+        return "Q2", "재방문율"
+    elif any(keyword in question_lower for keyword in restaurant_keywords):
+        return "Q3", "요식업"
+    else:
+        return "통합", "통합분석"
+
+# 전문화된 RAG 체인 생성 함수
+def create_specialized_rag_chain(vectorstore, analysis_type, scope_extractor=None, retriever=None):
+    """특화된 RAG 체인을 생성합니다.
+
+    scope_extractor가 있으면 질문에 나온 지역/업종 샤드만 검색하는 리트리버를 사용합니다.
+    retriever를 넘기면 그대로 사용합니다 (통합분석의 다중 데이터셋 동시 검색).
+    """
+    if retriever is None:
+        if scope_extractor is not None:
+            retriever = shard_filter.ShardedRetriever(vectorstore=vectorstore, extractor=scope_extractor, k=5)
+        else:
+            retriever = vectorstore.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": 5}
+            )
+    
+    # 프로세스 공용 클라이언트 (모든 세션 · 체인이 게이트웨이의 동시 실행 제한을 공유)
+    chat = llm_gateway.get_chat_model(
+        temperature=0.7,
+        max_output_tokens=8192,  # 완전한 응답을 위해 최대로 증가
+    )
+    
+    # 분석 유형별 시스템 프롬프트
+    if analysis_type == "카페업종":
+        system_prompt = """당신은 카페업종 전문 마케팅 컨설턴트입니다.
+
+Q1_data.csv 데이터를 기반으로 카페 관련 질문에 답변하세요.
+
+**데이터 컬럼 설명**:
+- 가맹점명: 카페 이름
+- 업종: 카페
+- 가맹점지역: 위치 정보
+- 상권: 상권 유형
+- 남성비중/여성비중: 고객 성별 분포
+- 연령집중도: 특정 연령대 집중 정도
+- 주요고객층: 주력 고객 연령대
+- 충성도지수: 고객 충성도 수치
+- 상권유형: 거주상권/직장상권/유동인구상권
+- 고객유형: 충성형/신규형
+
+**답변 형식**:
+## 1. 📊 카페 데이터 분석
+구체적인 수치와 데이터를 제시하세요.
+
+## 2. 🎯 타겟 고객 특성
+주요 고객층과 특성을 분석하세요.
+
+## 3. 💡 마케팅 전략 제안
+### 전략 1: [전략명]
+- 실행 방법:
+- 예상 효과:
+- 데이터 근거:
+
+### 전략 2: [전략명]
+- 실행 방법:
+- 예상 효과:
+- 데이터 근거:
+
+## 4. 📈 성과 예측
+예상되는 개선 효과를 제시하세요.
+
+{context}"""
+
+    elif analysis_type == "재방문율":
+        system_prompt = """당신은 고객 재방문율 개선 전문 컨설턴트입니다.
+
+Q2_data.csv 데이터를 기반으로 재방문율 관련 질문에 답변하세요.
+
+**데이터 컬럼 설명**:
+- 재방문고객비율: 재방문 고객 비율
+- 신규고객비율: 신규 고객 비율
+- 월간매출액: 월 매출 수준
+- 월간이용건수/고객수: 이용 빈도
+- 업종평균재방문률: 업종 평균 대비 비교
+- 재방문률등급: 재방문율 등급 (High/Mid/Low)
+- 충성도 관련 지표들
+
+**답변 형식**:
+## 1. 🔍 재방문율 현황 분석
+현재 재방문율과 문제점을 진단하세요.
+
+## 2. 📊 업종 평균 대비 분석
+업종 평균과 비교한 상대적 위치를 분석하세요.
+
+## 3. 💡 재방문율 개선 전략
+### 전략 1: [전략명]
+- 실행 방법:
+- 예상 효과:
+- 데이터 근거:
+
+### 전략 2: [전략명]
+- 실행 방법:
+- 예상 효과:
+- 데이터 근거:
+
+## 4. 🎯 단계별 실행 계획
+구체적인 실행 로드맵을 제시하세요.
+
+{context}"""
+
+    elif analysis_type == "요식업":
+        system_prompt = """당신은 요식업 전문 마케팅 컨설턴트입니다.
+
+Q3_data.csv 데이터를 기반으로 요식업 관련 질문에 답변하세요.
+
+**데이터 컬럼 설명**:
+- 업종: 한식, 중식, 일식, 양식 등
+- 월간매출액: 매출 수준
+- 배달매출비율: 배달 의존도
+- 월평균객단가: 평균 객단가
+- 연령대별 고객 비율
+- 거주/직장/유동인구 이용 비율
+- 동종업종 대비 성과 지표
+
+**답변 형식**:
+## 1. 🍽️ 요식업 현황 분석
+매출, 고객층, 운영 현황을 분석하세요.
+
+## 2. 📊 경쟁력 분석
+동종업종 대비 강점과 약점을 분석하세요.
+
+## 3. 💡 매출 증대 전략
+### 전략 1: [전략명]
+- 실행 방법:
+- 예상 효과:
+- 데이터 근거:
+
+### 전략 2: [전략명]
+- 실행 방법:
+- 예상 효과:
+- 데이터 근거:
+
+## 4. 🚀 성장 방안
+장기적인 성장 전략을 제시하세요.
+
+{context}"""
+
+    else:  # 통합분석
+        system_prompt = """당신은 종합 마케팅 전략 컨설턴트입니다.
+
+세 개의 데이터셋(Q1: 카페, Q2: 재방문율, Q3: 요식업)을 종합적으로 분석하여 답변하세요.
+
+**답변 형식**:
+## 1. 📊 종합 데이터 분석
+관련 데이터를 종합적으로 분석하세요.
+
+## 2. 💡 통합 마케팅 전략
+여러 관점에서의 종합적인 전략을 제시하세요.
+
+## 3. 🎯 실행 우선순위
+중요도에 따른 실행 순서를 제안하세요.
+
+{context}"""
+
+    contextualize_q_system_prompt = """이전 대화 내용과 최신 사용자 질문이 있을 때, 이 질문이 이전 대화 내용과 관련이 있을 수 있습니다. 
+이런 경우, 대화 내용을 알 필요 없이 독립적으로 이해할 수 있는 질문으로 바꾸세요."""
+
+    contextualize_q_prompt = ChatPromptTemplate.from_messages([
+        ("system", contextualize_q_system_prompt),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ])
+    
+    # 이전 대화가 없거나 독립적인 질문이면 LLM 재작성 없이 바로 검색
+    rewriter = query_rewrite.QueryRewriter(chat, contextualize_q_prompt)
+    history_aware_retriever = RunnableLambda(rewriter.as_retriever_step(retriever))
+    
+    # 전문화된 시스템 프롬프트 사용 (이미 위에서 정의됨)
+    qa_system_prompt = system_prompt
+    
+    qa_prompt = ChatPromptTemplate.from_messages([
+        ("system", qa_system_prompt),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ])
+    
+    question_answer_chain = create_stuff_documents_chain(chat, qa_prompt)
+    # 검색 문서와 대화 기록을 토큰 예산에 맞춘 뒤 답변 생성
+    # (create_retrieval_chain과 같은 input/chat_history/context/answer 출력 + prompt_tokens)
+    assembler = context_budget.ContextAssembler(qa_system_prompt, analysis_type)
+    rag_chain = (
+        RunnablePassthrough.assign(context=history_aware_retriever)
+        | RunnableLambda(assembler.assemble)
+    ).assign(answer=question_answer_chain)
+    
+    return rag_chain
@@ -0,0 +1,83 @@
+"""읽기 단계 층화 샘플링
+
+빠른 테스트 모드에서 전체 문서를 만든 뒤 잘라내는 대신, 데이터를 읽는 도중에
+행 단위로 포함 여부를 결정합니다. 지역 × 업종 구간(stratum)별로 비율만큼
+균등 무작위 추출하므로 파일 순서에 따른 편향이 없고 모든 구간이 최소 1행씩 포함됩니다.
+
+구간별 행 수는 키 컬럼만 읽는 가벼운 스트리밍 패스로 먼저 세고, 본 패스에서는
+선택 샘플링(Knuth Algorithm S)으로 결정합니다. 메모리는 구간 수에만 비례합니다.
+"""
+import random
+from collections import Counter
+
+import data_access
+
+# 구간 키 컬럼 후보 (먼저 있는 컬럼을 사용)
+REGION_COLUMNS = ('가맹점지역', 'MCT_SIGUNGU_NM')
+BUSINESS_COLUMNS = ('업종', 'HPSN_MCT_ZCD_NM')
+DEFAULT_SEED = 42
+SAMPLER_VERSION = "stratified-v1"
+
+
+def stratum_columns(columns):
+    """사용 가능한 컬럼 중 구간 키로 쓸 (지역, 업종) 컬럼 목록을 고릅니다."""
+    keys = []
+    for candidates in (REGION_COLUMNS, BUSINESS_COLUMNS):
+        for column in candidates:
+            if column in columns:
+                keys.append(column)
+                break
+    return keys
+
+
+def _stratum_keys(frame, key_columns):
+    if not key_columns:
+        return [()] * len(frame)
+    parts = [frame[column].astype("string").fillna("").tolist() for column in key_columns]
+    return list(zip(*parts))
+
+
+class StratifiedSampler:
+    """구간별 행 수를 알고 있을 때 읽는 순서대로 포함 여부를 정하는 층화 샘플러"""
+
+    def __init__(self, stratum_counts, key_columns, ratio, seed=DEFAULT_SEED):
+        self.key_columns = key_columns
+        self.total = sum(stratum_counts.values())
+        self._remaining = dict(stratum_counts)
+        # 구간마다 최소 1행은 포함
+        self._quota = {key: max(1, round(count * ratio)) for key, count in stratum_counts.items()}
+        self.sample_size = sum(self._quota.values())
+        self.strata = len(stratum_counts)
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def for_file(cls, file_path, ratio, seed=DEFAULT_SEED):
+        """키 컬럼만 스트리밍으로 읽어 구간별 행 수를 센 뒤 샘플러를 만듭니다."""
+        key_columns = stratum_columns(data_access.column_names(file_path))
+        if not key_columns:
+            # 키 컬럼이 없으면 전체를 하나의 구간으로 취급
+            return cls({(): data_access.num_rows(file_path)}, key_columns, ratio, seed)
+        counts = Counter()
+        for frame in data_access.iter_frames(file_path, columns=key_columns):
+            counts.update(_stratum_keys(frame, key_columns))
+        return cls(counts, key_columns, ratio, seed)
+
+    def keep(self, key):
+        """해당 구간의 다음 행을 포함할지 결정합니다 (남은 할당량 / 남은 행 수 확률)."""
+        remaining = self._remaining.get(key, 0)
+        quota = self._quota.get(key, 0)
+        if remaining <= 0 or quota <= 0:
+            return False
+        self._remaining[key] = remaining - 1
+        if self._rng.random() * remaining < quota:
+            self._quota[key] = quota - 1
+            return True
+        return False
+
+    def filter_frames(self, frames):
+        """DataFrame 청크에서 선택된 행만 남겨 순회합니다 (원래 행 번호 인덱스는 유지)."""
+        for frame in frames:
+            mask = [self.keep(key) for key in _stratum_keys(frame, self.key_columns)]
+            selected = frame[mask]
+            if len(selected):
+                yield selected
@@ -0,0 +1,114 @@
+"""질문 범위(지역 · 업종) 추출과 샤드 단위 검색
+
+질문에 나온 지역/업종 이름을 알려진 값 목록과 맞춰 보고, 벡터 스토어 검색을 해당
+메타데이터 샤드로 제한합니다. 필터는 Chroma where 형식으로 만들어 Chroma와 양자화
+스토어가 같은 방식으로 받습니다. 범위 안의 문서가 k개보다 적으면 전체 검색으로 채웁니다.
+"""
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+# 샤드 키 컬럼 (행 문서 메타데이터에 항상 포함)
+REGION_COLUMN = '가맹점지역'
+BUSINESS_COLUMN = '업종'
+SHARD_COLUMNS = (REGION_COLUMN, BUSINESS_COLUMN)
+# 별칭으로 쓰기에 너무 일반적인 업종 표현
+GENERIC_BUSINESS_TERMS = {'기타'}
+
+
+def region_aliases(region):
+    """지역명 별칭: 전체 이름, 마지막 단어("서울 성동구" → "성동구"), 접미사 제거("성동")"""
+    aliases = {region}
+    last = region.split()[-1]
+    aliases.add(last)
+    for suffix in ('구', '군', '시'):
+        # "중구"처럼 한 글자만 남는 경우는 오탐이 많아 제외
+        if last.endswith(suffix) and len(last) - len(suffix) >= 2:
+            aliases.add(last[:-len(suffix)])
+    return aliases
+
+
+def business_aliases(business_type):
+    """업종명 별칭: 전체 이름과 대분류("한식-육류/고기" → "한식")"""
+    aliases = {business_type}
+    head = business_type.split('-')[0].strip()
+    if len(head) >= 2:
+        aliases.add(head)
+    return aliases - GENERIC_BUSINESS_TERMS
+
+
+class QueryScopeExtractor:
+    """질문에서 지역/업종 값을 찾는 문자열 매칭 추출기"""
+
+    def __init__(self, regions=(), business_types=()):
+        self._aliases = []
+        for column, values, make_aliases in (
+            (REGION_COLUMN, regions, region_aliases),
+            (BUSINESS_COLUMN, business_types, business_aliases),
+        ):
+            alias_values = {}
+            for value in values:
+                if isinstance(value, str) and value.strip():
+                    for alias in make_aliases(value.strip()):
+                        alias_values.setdefault(alias, set()).add(value)
+            self._aliases.extend((alias, column, found) for alias, found in alias_values.items())
+        # 긴 별칭부터 맞춰 "성동구"가 "성동"보다 먼저 잡히도록 함
+        self._aliases.sort(key=lambda item: -len(item[0]))
+
+    def extract(self, question):
+        """{컬럼: [값, ...]} 형태로 질문 범위를 반환합니다 (찾지 못한 컬럼은 생략)."""
+        scope = {}
+        taken = []
+        for alias, column, values in self._aliases:
+            start = question.find(alias)
+            while start != -1:
+                end = start + len(alias)
+                if not any(start < t_end and t_start < end for t_start, t_end in taken):
+                    taken.append((start, end))
+                    scope.setdefault(column, set()).update(values)
+                    break
+                start = question.find(alias, start + 1)
+        return {column: sorted(values) for column, values in scope.items()}
+
+
+def to_filter(scope):
+    """질문 범위를 Chroma where 형식 필터로 바꿉니다. 범위가 없으면 None."""
+    conditions = [{column: {"$in": values}} for column, values in scope.items() if values]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class ShardedRetriever(BaseRetriever):
+    """질문 범위에 해당하는 샤드만 검색하고, 부족하면 전체 검색 결과로 채우는 리트리버"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    extractor: QueryScopeExtractor
+    k: int = 5
+
+    def search_with_scores(self, query):
+        """(문서, 관련도 0~1) 목록. 범위 검색 결과를 먼저 두고 전체 검색 결과로 k개까지 채웁니다."""
+        where = to_filter(self.extractor.extract(query))
+        hits = []
+        if where:
+            hits = self.vectorstore.similarity_search_with_relevance_scores(query, k=self.k, filter=where)
+        if len(hits) < self.k:
+            # 범위를 찾지 못했거나 해당 샤드 문서가 부족하면 전체 검색으로 보충
+            seen = {doc.page_content for doc, _ in hits}
+            for doc, score in self.vectorstore.similarity_search_with_relevance_scores(query, k=self.k):
+                if len(hits) >= self.k:
+                    break
+                if doc.page_content not in seen:
+                    hits.append((doc, score))
+                    seen.add(doc.page_content)
+        return hits
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return [doc for doc, _ in self.search_with_scores(query)]
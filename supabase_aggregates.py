@@ -0,0 +1,208 @@
+"""분석 유형별 집계 요약 (Supabase RPC + 내려받은 행으로 계산하는 대체 경로)
+
+질문 답변에 필요한 것은 표본 몇 행이 아니라 지표 분포, 지역/업종별 평균, 상위/하위
+가맹점 같은 요약입니다. create_tables.sql의 analysis_summary 함수를 RPC로 호출하면
+서버에서 이 요약을 계산해 작은 JSON 하나만 받습니다. 함수가 아직 설치되지 않았으면
+summarize_frame이 내려받은 행으로 같은 구조의 요약을 만듭니다.
+"""
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FUNCTION = "analysis_summary"
+TOP_N = 5
+GROUP_LIMIT = 10
+GROUP_COLUMNS = ("franchise_region", "business_type")
+
+# 분석 유형 → 집계 대상 테이블, 수치 지표, 범주형 컬럼, 상위/하위 기준 지표
+SUMMARY_SPECS = {
+    "카페업종": {
+        "table": "cafe_data",
+        "metrics": ["male_ratio", "female_ratio", "gender_difference", "age_concentration", "loyalty_index"],
+        "categories": ["main_customer_group", "commercial_area_type", "customer_type"],
+        "rank_metric": "loyalty_index",
+    },
+    "재방문율": {
+        "table": "revisit_data",
+        "metrics": [
+            "revisit_customer_ratio", "new_customer_ratio", "industry_avg_revisit_rate",
+            "revisit_rate_3m_avg", "industry_comparison_diff", "delivery_sales_ratio",
+            "residential_customer_ratio", "workplace_customer_ratio", "floating_population_customer_ratio",
+        ],
+        "categories": ["revisit_rate_grade", "monthly_sales"],
+        "rank_metric": "revisit_customer_ratio",
+    },
+    "요식업": {
+        "table": "restaurant_data",
+        "metrics": [
+            "delivery_sales_ratio", "revisit_customer_ratio", "new_customer_ratio", "sales_efficiency",
+            "sales_industry_diff", "residential_customer_ratio", "workplace_customer_ratio",
+            "floating_population_customer_ratio",
+        ],
+        "categories": ["monthly_sales", "monthly_avg_price", "revisit_rate_grade"],
+        "rank_metric": "delivery_sales_ratio",
+    },
+}
+# 통합분석은 get_relevant_data와 같이 카페 데이터를 기준으로 요약
+SUMMARY_SPECS["통합분석"] = SUMMARY_SPECS["카페업종"]
+
+# 프롬프트 표시용 컬럼 이름
+COLUMN_LABELS = {
+    "franchise_region": "가맹점지역", "business_type": "업종", "franchise_name": "가맹점명",
+    "male_ratio": "남성비중", "female_ratio": "여성비중", "gender_difference": "성비차이",
+    "age_concentration": "연령집중도", "loyalty_index": "충성도지수",
+    "main_customer_group": "주요고객층", "commercial_area_type": "상권유형", "customer_type": "고객유형",
+    "revisit_customer_ratio": "재방문고객비율", "new_customer_ratio": "신규고객비율",
+    "industry_avg_revisit_rate": "업종평균재방문률", "revisit_rate_3m_avg": "재방문률_3개월평균",
+    "industry_comparison_diff": "업종대비차이", "delivery_sales_ratio": "배달매출비율",
+    "residential_customer_ratio": "거주이용고객비율", "workplace_customer_ratio": "직장이용고객비율",
+    "floating_population_customer_ratio": "유동인구이용고객비율",
+    "revisit_rate_grade": "재방문률등급", "monthly_sales": "월간매출액", "monthly_avg_price": "월평균객단가",
+    "sales_efficiency": "매출효율", "sales_industry_diff": "매출_업종차이",
+}
+
+
+def summary_spec(data_type):
+    return SUMMARY_SPECS.get(data_type)
+
+
+def summary_columns(data_type):
+    """summarize_frame이 쓰는 컬럼 (행을 내려받을 때 select 할 컬럼)"""
+    spec = summary_spec(data_type)
+    if spec is None:
+        return []
+    return ["franchise_name", *GROUP_COLUMNS, *spec["metrics"], *spec["categories"]]
+
+
+def fetch_summary(client, data_type, filters=None):
+    """analysis_summary RPC로 서버에서 요약을 계산합니다. 함수가 없거나 실패하면 None."""
+    spec = summary_spec(data_type)
+    if client is None or spec is None:
+        return None
+    try:
+        result = client.rpc(SUMMARY_FUNCTION, {
+            "p_table": spec["table"],
+            "p_metrics": spec["metrics"],
+            "p_categories": spec["categories"],
+            "p_rank_metric": spec["rank_metric"],
+            "p_filters": filters or {},
+            "p_top_n": TOP_N,
+            "p_group_limit": GROUP_LIMIT,
+        }).execute()
+    except Exception as e:
+        # create_tables.sql의 집계 함수를 아직 설치하지 않은 프로젝트 등
+        logger.warning("analysis_summary RPC unavailable for %s: %s", spec["table"], e)
+        return None
+    return result.data or None
+
+
+def _round(value):
+    return None if value is None or pd.isna(value) else round(float(value), 2)
+
+
+def summarize_frame(df, data_type, top_n=TOP_N, group_limit=GROUP_LIMIT):
+    """내려받은 행으로 analysis_summary와 같은 구조의 요약을 계산합니다 (RPC 대체 경로)."""
+    spec = summary_spec(data_type)
+    if spec is None or df.empty:
+        return None
+    metrics = [m for m in spec["metrics"] if m in df.columns]
+    numeric = pd.DataFrame({m: pd.to_numeric(df[m], errors="coerce") for m in metrics}, index=df.index)
+
+    summary = {"row_count": len(df), "metrics": {}}
+    for metric in metrics:
+        values = numeric[metric].dropna()
+        if values.empty:
+            continue
+        summary["metrics"][metric] = {
+            "avg": _round(values.mean()), "min": _round(values.min()), "max": _round(values.max()),
+            "p25": _round(values.quantile(0.25)), "p50": _round(values.quantile(0.5)),
+            "p75": _round(values.quantile(0.75)),
+        }
+
+    for column in GROUP_COLUMNS:
+        groups = []
+        if column in df.columns:
+            grouped = numeric.groupby(df[column])
+            counts = df[column].value_counts().head(group_limit)
+            means = grouped.mean()
+            for value, count in counts.items():
+                group = {"group": value, "count": int(count)}
+                group.update({m: _round(means.at[value, m]) for m in metrics})
+                groups.append(group)
+        summary[f"by_{column}"] = groups
+
+    summary["distributions"] = {
+        column: [{"value": value, "count": int(count)}
+                 for value, count in df[column].value_counts().head(group_limit).items()]
+        for column in spec["categories"] if column in df.columns
+    }
+
+    rank_metric = spec["rank_metric"]
+    if rank_metric in numeric.columns:
+        ranked = df.assign(**{rank_metric: numeric[rank_metric]}).dropna(subset=[rank_metric])
+        fields = [c for c in ("franchise_name", "franchise_region", "business_type", rank_metric) if c in ranked.columns]
+        summary["top"] = ranked.nlargest(top_n, rank_metric)[fields].to_dict("records")
+        summary["bottom"] = ranked.nsmallest(top_n, rank_metric)[fields].to_dict("records")
+        summary["rank_metric"] = rank_metric
+    return summary
+
+
+def _label(column):
+    return COLUMN_LABELS.get(column, column)
+
+
+def _number(value):
+    if value is None:
+        return "-"
+    value = float(value)
+    return f"{value:,.0f}" if value.is_integer() else f"{value:,.2f}"
+
+
+def format_summary(summary):
+    """요약 dict를 프롬프트에 넣을 짧은 텍스트로 바꿉니다."""
+    lines = [f"[집계 요약] 전체 {summary.get('row_count', 0):,}개 레코드 기준"]
+
+    metrics = summary.get("metrics") or {}
+    if metrics:
+        lines.append("\n[지표 분포] 평균 (최소 / 25% / 중앙값 / 75% / 최대)")
+        for metric, stats in metrics.items():
+            lines.append(
+                f"- {_label(metric)}: {_number(stats.get('avg'))} ({_number(stats.get('min'))} / "
+                f"{_number(stats.get('p25'))} / {_number(stats.get('p50'))} / {_number(stats.get('p75'))} / "
+                f"{_number(stats.get('max'))})"
+            )
+
+    for column in GROUP_COLUMNS:
+        groups = summary.get(f"by_{column}") or []
+        if not groups:
+            continue
+        lines.append(f"\n[{_label(column)}별 평균] (레코드 수 상위 {len(groups)}개)")
+        for group in groups:
+            values = " · ".join(
+                f"{_label(metric)} {_number(group.get(metric))}" for metric in metrics if metric in group
+            )
+            lines.append(f"- {group['group']} ({group['count']:,}개): {values}")
+
+    for column, counts in (summary.get("distributions") or {}).items():
+        if counts:
+            # 분포는 상위 GROUP_LIMIT개 값만 오므로 전체 레코드 수 기준으로 나누고 나머지는 기타로 표시
+            listed = sum(item["count"] for item in counts)
+            total = max(summary.get("row_count") or 0, listed) or 1
+            shares = [f"{item['value']} {item['count'] / total:.0%}" for item in counts]
+            if total > listed:
+                shares.append(f"기타 {(total - listed) / total:.0%}")
+            lines.append(f"\n[{_label(column)} 분포] {', '.join(shares)}")
+
+    rank_metric = summary.get("rank_metric")
+    for key, title in (("top", "상위"), ("bottom", "하위")):
+        rows = summary.get(key) or []
+        if rank_metric and rows:
+            lines.append(f"\n[{_label(rank_metric)} {title} {len(rows)}개 가맹점]")
+            for row in rows:
+                lines.append(
+                    f"- {row.get('franchise_name')} ({row.get('franchise_region')}, {row.get('business_type')}): "
+                    f"{_number(row.get(rank_metric))}"
+                )
+    return "\n".join(lines)
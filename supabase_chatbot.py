@@ -1,14 +1,31 @@
 import streamlit as st
 import pandas as pd
 import os
+import time
+import hashlib
+import uuid
 from supabase import create_client, Client
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from dotenv import load_dotenv
 
+import answer_cache
+import context_budget
+import dataset_metadata
+import embedding_service
+import latency_metrics
+import llm_gateway
+import llm_resilience
+import perf_panel
+import query_planner
+import supabase_aggregates
+import turn_tracing
+
 # 환경변수 로드
 load_dotenv()
 
+# Prometheus 지표 · 턴 기록 HTTP 내보내기 (TRACE_METRICS_PORT를 지정한 경우)
+turn_tracing.start_metrics_server()
+
 # 페이지 설정
 st.set_page_config(
     page_title="Supabase 기반 마케팅 분석 챗봇",
@@ -17,6 +34,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 프롬프트에 넣는 예시 행 수 (분포 · 평균 등은 집계 요약으로 전달)
+SAMPLE_ROWS = 15
+
 # Supabase 클라이언트 초기화
 @st.cache_resource
 def init_supabase():
@@ -35,20 +55,44 @@ def init_supabase():
         st.error(f"❌ Supabase 연결 실패: {e}")
         return None
 
+# 테이블 행 수 (사이드바 표시용)
+@st.cache_data(ttl=600)
+def get_table_row_count(table_name):
+    """업로드 단계가 남긴 메타데이터의 행 수를 쓰고, 없으면 COUNT 쿼리로 조회합니다."""
+    count = dataset_metadata.table_row_count(table_name)
+    if count is not None:
+        return count
+    supabase = init_supabase()
+    if not supabase:
+        return None
+    # 행은 하나만 받고 개수만 사용
+    result = supabase.table(table_name).select("id", count="exact").limit(1).execute()
+    return result.count
+
+# 답변 캐시용 테이블 버전
+def table_version(table_name):
+    """테이블 내용이 바뀔 때만 바뀌는 답변 캐시 버전 (질문마다 다른 조회 조건과 무관)
+
+    업로드 메타데이터의 원본 해시 · 업로드 행 수를 쓰고, 기록이 없으면 테이블 행 수를 씁니다.
+    """
+    basis = dataset_metadata.table_fingerprint(table_name) or f"rows:{get_table_row_count(table_name)}"
+    return answer_cache.dataset_version(table_name, hashlib.sha1(basis.encode("utf-8")).hexdigest())
+
 # 데이터 조회 함수
 @st.cache_data(ttl=600)  # 10분 캐시로 연장
-def query_supabase_data(table_name, filters=None, limit=None):
-    """Supabase에서 데이터 조회"""
+def query_supabase_data(table_name, filters=None, limit=None, columns=None):
+    """Supabase에서 데이터 조회
+    
+    filters: (컬럼, 연산자, 값) 조건 목록 (eq / in / gte / lte / ilike) 또는 같음 조건 dict
+    columns: 선택할 컬럼 목록 (None이면 전체)
+    """
     supabase = init_supabase()
     if not supabase:
         return pd.DataFrame()
     
     try:
-        query = supabase.table(table_name).select("*")
-        
-        if filters:
-            for column, value in filters.items():
-                query = query.eq(column, value)
+        query = supabase.table(table_name).select(",".join(columns) if columns else "*")
+        query = query_planner.apply_filters(query, filters)
         
         # limit이 None이면 전체 데이터 조회, 있으면 제한
         if limit:
@@ -62,9 +106,39 @@ def query_supabase_data(table_name, filters=None, limit=None):
         st.error(f"❌ 데이터 조회 실패 ({table_name}): {e}")
         return pd.DataFrame()
 
+# 서버 집계 요약 (create_tables.sql의 analysis_summary 함수)
+@st.cache_data(ttl=600)
+def query_analysis_summary(data_type, filters=None):
+    """분석 유형별 집계 요약을 RPC로 조회합니다. 함수가 설치되지 않았으면 None."""
+    return supabase_aggregates.fetch_summary(init_supabase(), data_type, filters)
+
+# 집계 함수가 없을 때 요약 계산용으로 내려받는 최대 행 수 (None이면 전체)
+FALLBACK_LIMITS = {
+    "revisit_data": 10000,  # 재방문율 데이터 - 더 많은 샘플로 정확한 분석
+    "restaurant_data": 8000,  # 요식업 데이터 - 더 많은 샘플로 정확한 분석
+    "cafe_data": None,  # 카페 데이터는 전체 조회
+}
+
+def fetch_planned_data(plan, data_type):
+    """조회 계획대로 (예시 행, 집계 요약)을 가져옵니다."""
+    # 서버에서 요약을 계산했으면 프롬프트 예시용 행만 조회
+    summary = query_analysis_summary(data_type, plan.rpc_filters())
+    if summary:
+        if not summary.get("row_count"):
+            return pd.DataFrame(), summary
+        df = query_supabase_data(plan.table_name, plan.filters, SAMPLE_ROWS, plan.columns)
+        return df, summary
+    
+    # 집계 함수가 없으면 기존처럼 행을 내려받아 요약을 직접 계산
+    df = query_supabase_data(plan.table_name, plan.filters, FALLBACK_LIMITS.get(plan.table_name), plan.columns)
+    return df, supabase_aggregates.summarize_frame(df, data_type)
+
 # 질문 분류 및 데이터 조회
 def get_relevant_data(question):
-    """질문에 따라 관련 데이터 조회"""
+    """질문에 따라 관련 데이터 조회
+
+    (데이터, 분석 유형, 테이블, 집계 요약, 적용한 조회 조건 설명)을 반환합니다.
+    """
     question_lower = question.lower()
     
     # 키워드 기반 테이블 선택
@@ -82,28 +156,55 @@ def get_relevant_data(question):
         table_name = "cafe_data"
         data_type = "통합분석"
     
-    # 데이터 조회 (전체 데이터 활용)
-    if table_name == "revisit_data":
-        # 재방문율 데이터 - 더 많은 샘플로 정확한 분석
-        df = query_supabase_data(table_name, limit=10000)
-    elif table_name == "restaurant_data":
-        # 요식업 데이터 - 더 많은 샘플로 정확한 분석
-        df = query_supabase_data(table_name, limit=8000)
-    else:
-        # 카페 데이터는 전체 조회
-        df = query_supabase_data(table_name)
+    # 질문의 지역 · 업종 · 기준년월 · 등급 조건은 필터로, 컬럼은 프롬프트와 요약에 쓰는 것만 조회
+    plan = query_planner.plan_query(
+        question, table_name, data_type, supabase_aggregates.summary_columns(data_type)
+    )
+    df, summary = fetch_planned_data(plan, data_type)
+    if df.empty and plan.filters:
+        # 조건에 맞는 행이 없으면 조건 없이 다시 조회
+        plan = plan.relaxed()
+        df, summary = fetch_planned_data(plan, data_type)
+    filters = plan.describe()
+    if filters:
+        turn_tracing.annotate(filters=filters)
     
-    return df, data_type, table_name
+    return df, data_type, table_name, summary, filters
+
+# AI 응답 생성 (토큰 스트리밍)
+def stream_ai_response(question, data_df, data_type, table_name=None, summary=None, filters=""):
+    """AI를 사용하여 데이터 기반 응답을 생성하며, 텍스트 조각을 생성되는 대로 내보냅니다.
 
-# AI 응답 생성
-def generate_ai_response(question, data_df, data_type):
-    """AI를 사용하여 데이터 기반 응답 생성"""
+    filters는 get_relevant_data가 적용한 조회 조건 설명으로, 답변 캐시 키에 들어갑니다.
+    """
     
     if data_df.empty:
-        return "❌ 데이터를 조회할 수 없습니다. Supabase 연결과 테이블을 확인하세요."
+        yield "❌ 데이터를 조회할 수 없습니다. Supabase 연결과 테이블을 확인하세요."
+        return
     
-    # 데이터를 텍스트로 변환 (더 많은 데이터로 정확한 분석)
-    data_sample = data_df.head(15).to_string(max_cols=12, max_colwidth=50)
+    # 데이터를 텍스트로 변환 (전체 집계 요약 + 예시 행)
+    with turn_tracing.span("to_text"):
+        sample_columns = [c for c in query_planner.PROMPT_COLUMNS.get(data_type, ()) if c in data_df.columns]
+        sample_df = data_df[sample_columns] if sample_columns else data_df
+        data_sample = sample_df.head(SAMPLE_ROWS).to_string(max_cols=12, max_colwidth=50)
+        if summary:
+            data_sample = f"{supabase_aggregates.format_summary(summary)}\n\n[예시 행]\n{data_sample}"
+    
+    # 공용 답변 캐시: 테이블 내용이 바뀌면 버전이 바뀌어 이전 답변을 무효화하고,
+    # 조회 조건이 다른 답변끼리는 섞이지 않도록 조건을 분석 유형 키에 붙임
+    answers = answer_cache.get_answer_cache()
+    if table_name is None:
+        table_name = supabase_aggregates.summary_spec(data_type)["table"]
+    version = table_version(table_name)
+    answers.sync_version(version)
+    cache_scope = f"{data_type}|{filters}" if filters else data_type
+    embed_query = embedding_service.get_embedding_service(embedding_service.DEFAULT_MODEL_NAME).embed_query
+    with turn_tracing.span("cache_lookup"):
+        cached = answers.get(cache_scope, version, question, embed_query)
+    turn_tracing.annotate(cache_hit=bool(cached))
+    if cached:
+        yield cached["answer"]
+        return
     
     # 분석 유형별 시스템 프롬프트
     if data_type == "카페업종":
@@ -217,15 +318,15 @@ def generate_ai_response(question, data_df, data_type):
     # AI 모델 초기화
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
-        return "❌ GOOGLE_API_KEY 설정을 확인하세요."
+        yield "❌ GOOGLE_API_KEY 설정을 확인하세요."
+        return
     
     try:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
+        # 프로세스 공용 클라이언트 (게이트웨이가 세션 간 동시 호출 수와 요청 속도를 제한)
+        llm = llm_gateway.get_chat_model(
             temperature=0.7,
             api_key=api_key,
-            timeout=60,  # 60초로 타임아웃 연장
-            max_tokens=4000  # 응답 길이 제한 해제로 완전한 답변
+            max_output_tokens=4000  # 응답 길이 제한 해제로 완전한 답변
         )
         
         # 메시지 생성
@@ -234,12 +335,31 @@ def generate_ai_response(question, data_df, data_type):
             HumanMessage(content=question)
         ]
         
-        # AI 응답 생성
-        response = llm.invoke(messages)
-        return response.content
+        turn_tracing.annotate(
+            prompt_tokens=context_budget.count_tokens(system_prompt) + context_budget.count_tokens(question)
+        )
+        
+        # AI 응답 생성 (토큰이 오는 대로 전달)
+        response = ""
+        generation_started = time.perf_counter()
+        for chunk in llm.stream(messages):
+            if chunk.content:
+                response += chunk.content
+                yield chunk.content
+        turn_tracing.record_span("generation", time.perf_counter() - generation_started)
+        answers.put(cache_scope, version, question, response, embed_fn=embed_query)
         
+    except llm_resilience.CircuitOpenError as e:
+        yield f"⚠️ {e}"
+    except llm_resilience.DeadlineExceeded:
+        # 턴 마감(최대 LLM_TURN_DEADLINE_SECONDS) 초과: 받은 부분까지만 보여 줌
+        yield "\n\n⏳ 응답 시간 제한을 넘어 답변을 중단했습니다. 잠시 후 다시 시도해주세요."
     except Exception as e:
-        return f"❌ AI 응답 생성 실패: {str(e)}"
+        yield f"❌ AI 응답 생성 실패: {str(e)}"
+
+def generate_ai_response(question, data_df, data_type, table_name=None, summary=None, filters=""):
+    """AI를 사용하여 데이터 기반 응답 생성 (전체 응답을 한 번에 반환)"""
+    return "".join(stream_ai_response(question, data_df, data_type, table_name, summary, filters))
 
 def main():
     """메인 애플리케이션"""
@@ -265,15 +385,23 @@ def main():
                 
                 for table_name, display_name in tables_info:
                     try:
-                        # COUNT 쿼리로 실제 레코드 수 조회
-                        result = supabase.table(table_name).select("*", count="exact").execute()
-                        count = result.count
+                        count = get_table_row_count(table_name)
                         st.metric(display_name, f"{count:,}개")
                     except Exception as e:
                         st.metric(display_name, "연결 안됨")
             except:
                 st.warning("데이터 통계를 불러올 수 없습니다.")
-        
+
+        st.caption(latency_metrics.format_summary("⏱️ 첫 토큰", "ttft"))
+        st.caption(llm_gateway.format_stats())
+        st.caption(llm_resilience.format_stats())
+        answer_stats = answer_cache.get_answer_cache().stats()
+        st.caption(
+            f"⚡ 답변 캐시: {answer_stats['entries']:,}개 "
+            f"(적중 {answer_stats['hits']:,} · 유사 적중 {answer_stats['similar_hits']:,} · 미스 {answer_stats['misses']:,})"
+        )
+        perf_panel.render_perf_panel("supabase_chatbot")
+
         st.markdown("---")
         
         st.markdown("### 💡 사용 안내")
@@ -286,6 +414,8 @@ def main():
     # 세션 상태 초기화
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
     
     # 기존 메시지 표시
     for message in st.session_state.messages:
@@ -302,34 +432,53 @@ def main():
         # AI 응답
         with st.chat_message("assistant"):
             try:
-                # 1단계: 데이터 조회
-                with st.spinner("🔍 데이터 조회 중..."):
-                    data_df, data_type, table_name = get_relevant_data(prompt)
+                # 턴 추적: 단계별 소요 시간 · 토큰 수 · 조회 행 수를 턴 기록 하나로 남김 (사이드바 성능 패널)
+                with turn_tracing.trace_turn("supabase_chatbot", st.session_state.session_id):
+                    # 1단계: 데이터 조회
+                    with st.spinner("🔍 데이터 조회 중..."), turn_tracing.span("get_relevant_data"):
+                        data_df, data_type, table_name, summary, filters = get_relevant_data(prompt)
+                    turn_tracing.annotate(dataset=table_name, analysis_type=data_type, rows_fetched=len(data_df))
                 
-                if not data_df.empty:
-                    # 데이터 정보 표시
-                    st.success(f"✅ **{data_type} 데이터** 조회 완료 ({len(data_df):,}개 레코드)")
-                    
-                    # 2단계: AI 분석
-                    with st.spinner("🤖 AI 상세 분석 중... (최대 60초)"):
-                        response = generate_ai_response(prompt, data_df, data_type)
+                    if not data_df.empty:
+                        # 데이터 정보 표시 (요약이 있으면 요약 기준 전체 레코드 수)
+                        record_count = summary["row_count"] if summary else len(data_df)
+                        st.success(f"✅ **{data_type} 데이터** 조회 완료 ({record_count:,}개 레코드)")
                     
-                    st.markdown(response)
+                        # 참고 데이터 표시 (조회가 끝나면 바로)
+                        with st.expander("📚 참고 데이터 (상위 10개)"):
+                            st.dataframe(data_df.head(10))
                     
-                    # 참고 데이터 표시
-                    with st.expander("📚 참고 데이터 (상위 10개)"):
-                        st.dataframe(data_df.head(10))
+                        # 2단계: AI 분석 (토큰이 오는 대로 표시)
+                        message_placeholder = st.empty()
+                        message_placeholder.markdown("🤖 AI 상세 분석 중... (최대 60초)")
+                        response = ""
+                        started = time.perf_counter()
+                        first_token_at = None
+                        with llm_gateway.session_scope(st.session_state.session_id), llm_resilience.turn_scope():
+                            for chunk in stream_ai_response(prompt, data_df, data_type, table_name, summary, filters):
+                                if first_token_at is None:
+                                    first_token_at = time.perf_counter()
+                                    latency_metrics.record("ttft", first_token_at - started)
+                                    turn_tracing.record_span("ttft", first_token_at - started)
+                                response += chunk
+                                message_placeholder.markdown(response + "▌")
+                        message_placeholder.markdown(response)
+                        total_seconds = time.perf_counter() - started
+                        latency_metrics.record("answer_total", total_seconds)
+                        turn_tracing.annotate(response_tokens=context_budget.count_tokens(response))
+                        if first_token_at is not None:
+                            st.caption(f"⏱️ 첫 토큰 {first_token_at - started:.2f}초 · 전체 {total_seconds:.2f}초")
                     
-                    # 메시지 저장
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": response}
-                    )
-                else:
-                    error_msg = f"❌ {table_name} 테이블에서 데이터를 조회할 수 없습니다. 업로드를 확인하세요."
-                    st.error(error_msg)
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": error_msg}
-                    )
+                        # 메시지 저장
+                        st.session_state.messages.append(
+                            {"role": "assistant", "content": response}
+                        )
+                    else:
+                        error_msg = f"❌ {table_name} 테이블에서 데이터를 조회할 수 없습니다. 업로드를 확인하세요."
+                        st.error(error_msg)
+                        st.session_state.messages.append(
+                            {"role": "assistant", "content": error_msg}
+                        )
                     
             except Exception as e:
                 error_msg = f"❌ 오류가 발생했습니다: {str(e)}"
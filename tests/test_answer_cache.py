@@ -0,0 +1,34 @@
+import pytest
+
+from answer_cache import AnswerCache, question_guard
+
+
+def same_vector(text):
+    """모든 질문을 같은 벡터로 바꾸는 테스트용 임베딩 (유사도가 항상 1.0)"""
+    return [1.0, 0.0, 0.0]
+
+
+@pytest.fixture
+def cache():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("재방문율", "v1", "성동구 카페 중 재방문율이 높은 매장은?", "높은 매장 답변", embed_fn=same_vector)
+    return cache
+
+
+def test_similar_question_hits(cache):
+    hit = cache.get("재방문율", "v1", "성동구 카페에서 재방문율 높은 매장 알려줘", same_vector)
+    assert hit is not None and hit["answer"] == "높은 매장 답변"
+
+
+@pytest.mark.parametrize("question", [
+    "성동구 카페 중 재방문율이 낮은 매장은?",
+    "마포구 카페 중 재방문율이 높은 매장은?",
+    "성동구 한식 중 재방문율이 높은 매장은?",
+    "성동구 카페 중 재방문율이 높은 매장 5곳은?",
+])
+def test_guard_blocks_different_question(cache, question):
+    assert cache.get("재방문율", "v1", question, same_vector) is None
+
+
+def test_guard_ignores_unrelated_words():
+    assert question_guard("목적을 가진 전략적 마케팅") == question_guard("마케팅 전략")
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from vector_store import QuantizedVectorStore
+
+
+class AxisEmbedding:
+    """텍스트 "t<i>"를 i번째 축 방향 단위 벡터로 바꾸는 테스트용 임베딩"""
+
+    dim = 8
+
+    def _vector(self, text):
+        vector = np.full(self.dim, 0.01, dtype=np.float32)
+        vector[int(text.lstrip("t").split("-")[0]) % self.dim] = 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture(params=["float16", "int8"])
+def store(request, tmp_path):
+    store = QuantizedVectorStore(str(tmp_path / "store"), AxisEmbedding(), dtype=request.param, rescore_factor=4)
+    store.add_texts([f"t{i}" for i in range(4)], ids=[f"t{i}" for i in range(4)])
+    return store
+
+
+def test_deleted_rows_are_not_returned(store):
+    store.delete(["t0", "t1", "t2"])
+
+    # 살아 있는 행(1개)이 k * rescore_factor보다 적어도 삭제 표시 행이 다시 나오지 않아야 함
+    hits = store.similarity_search_with_score("t0", k=4)
+
+    assert [doc.id for doc, _ in hits] == ["t3"]
+
+
+def test_upserted_row_replaces_previous_version(store):
+    store.add_texts(["t5-new"], ids=["t3"])
+
+    hits = store.similarity_search_with_score("t3", k=4)
+    ids = [doc.id for doc, _ in hits]
+    texts = [doc.page_content for doc, _ in hits]
+
+    assert sorted(ids) == ["t0", "t1", "t2", "t3"]
+    assert "t3" not in texts
+    assert "t5-new" in texts
+
+
+def test_search_positions_skips_deleted_rows(store):
+    store.delete(["t1"])
+
+    positions = [pos for pos, _ in store.search_positions(AxisEmbedding().embed_query("t1"), k=4)]
+
+    assert 1 not in positions
+    assert sorted(positions) == [0, 2, 3]
@@ -0,0 +1,282 @@
+"""턴 단위 지연 추적 (단계별 구간 + 토큰 수 · 캐시 적중 · 조회 행 수)
+
+질문 하나를 처리하는 동안 trace_turn() 블록 안에서 span("단계") 블록의 소요 시간과
+annotate()로 붙인 값(프롬프트/응답 토큰 수, 캐시 적중, 조회 행 수 등)을 모아 턴 기록
+하나로 남깁니다. 단계별 소요 시간은 latency_metrics에도 "stage:<단계>"로 기록되어
+p50/p95/p99를 계산할 수 있습니다.
+
+내보내기:
+- TRACE_LOG_PATH를 지정하면 턴 기록을 JSON 한 줄씩 덧붙입니다.
+- TRACE_METRICS_PORT를 지정하면 http://<호스트>:<포트>/metrics 에서 Prometheus 텍스트
+  형식으로 단계별 분위수와 카운터를 제공합니다 (start_metrics_server).
+현재 턴은 contextvars로 전달되므로 LangChain이 병렬 실행에 쓰는 스레드 안의 구간도 같은
+턴에 기록됩니다. 턴 밖에서 연 구간은 latency_metrics에만 기록됩니다.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import latency_metrics
+
+logger = logging.getLogger(__name__)
+
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
+TRACE_METRICS_PORT = int(os.getenv("TRACE_METRICS_PORT", "0"))
+# 사이드바 패널에 보관하는 최근 턴 수
+RECENT_TURNS = 50
+
+_current = contextvars.ContextVar("turn_trace", default=None)
+
+
+class TurnTrace:
+    """턴 하나의 구간 목록과 속성"""
+
+    def __init__(self, app, session_id=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.app = app
+        self.session_id = session_id
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.spans = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, duration, attributes=None):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start": round(start - self._started, 4),
+                "duration": round(duration, 4),
+                **({"attributes": attributes} if attributes else {}),
+            })
+
+    def annotate(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def finish(self, status="ok"):
+        self.duration = time.perf_counter() - self._started
+        self.status = status
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "app": self.app,
+                "session_id": self.session_id,
+                "started_at": self.started_at,
+                "duration": round(self.duration, 4) if self.duration is not None else None,
+                "status": self.status,
+                "spans": sorted(self.spans, key=lambda span: span["start"]),
+                "attributes": dict(self.attributes),
+            }
+
+
+class TraceStore:
+    """최근 턴 기록과 앱별 카운터 (Prometheus 내보내기용)"""
+
+    def __init__(self, recent=RECENT_TURNS, log_path=TRACE_LOG_PATH):
+        self.log_path = log_path
+        self._recent = deque(maxlen=recent)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, trace):
+        record = trace.to_dict()
+        with self._lock:
+            self._recent.append(record)
+            app = record["app"]
+            self._count(app, "turns_total", 1)
+            if record["status"] != "ok":
+                self._count(app, "turn_errors_total", 1)
+            attributes = record["attributes"]
+            if attributes.get("cache_hit"):
+                self._count(app, "cache_hits_total", 1)
+            for key, counter in (("prompt_tokens", "prompt_tokens_total"),
+                                 ("response_tokens", "response_tokens_total"),
+                                 ("rows_fetched", "rows_fetched_total")):
+                if isinstance(attributes.get(key), (int, float)):
+                    self._count(app, counter, attributes[key])
+            if self.log_path:
+                self._append_log(record)
+        return record
+
+    def _count(self, app, name, value):
+        self._counters[(app, name)] = self._counters.get((app, name), 0) + value
+
+    def _append_log(self, record):
+        try:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning("trace log write failed (%s): %s", self.log_path, e)
+
+    def recent(self, app=None):
+        """최근 턴 기록 (최신순)"""
+        with self._lock:
+            records = list(self._recent)
+        return [r for r in reversed(records) if app is None or r["app"] == app]
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+store = TraceStore()
+
+
+@contextlib.contextmanager
+def trace_turn(app, session_id=None):
+    """블록 안에서 연 구간과 속성을 턴 기록 하나로 모읍니다."""
+    trace = TurnTrace(app, session_id)
+    token = _current.set(trace)
+    status = "ok"
+    try:
+        yield trace
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        trace.finish(status)
+        latency_metrics.record("turn", trace.duration)
+        store.add(trace)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """블록의 소요 시간을 현재 턴의 name 구간과 latency_metrics("stage:<name>")에 기록합니다."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        latency_metrics.record(f"stage:{name}", duration)
+        trace = _current.get()
+        if trace is not None:
+            trace.add_span(name, started, duration, attributes)
+
+
+def record_span(name, duration, **attributes):
+    """이미 잰 구간(첫 토큰까지 시간 등)을 현재 턴 끝에 붙여 기록합니다."""
+    latency_metrics.record(f"stage:{name}", duration)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_span(name, time.perf_counter() - duration, duration, attributes)
+
+
+def annotate(**attributes):
+    """현재 턴에 속성(토큰 수, 캐시 적중 등)을 붙입니다. 턴 밖이면 무시합니다."""
+    trace = _current.get()
+    if trace is not None:
+        trace.annotate(**attributes)
+
+
+def increment(name, value=1):
+    trace = _current.get()
+    if trace is not None:
+        trace.increment(name, value)
+
+
+def stage_names():
+    return sorted(name[len("stage:"):] for name in latency_metrics.recorder.names() if name.startswith("stage:"))
+
+
+def stage_summaries():
+    """단계별 {count, p50, p95, p99} (측정값이 있는 단계만)"""
+    summaries = {}
+    for name in stage_names():
+        stats = latency_metrics.summary(f"stage:{name}")
+        if stats:
+            summaries[name] = stats
+    return summaries
+
+
+def export_jsonl(app=None):
+    """최근 턴 기록을 JSON Lines 문자열로 (오래된 것부터)"""
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in reversed(store.recent(app)))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def export_prometheus():
+    """단계별 분위수(summary)와 턴 카운터를 Prometheus 텍스트 형식으로"""
+    lines = [
+        "# HELP chatbot_stage_seconds Stage latency over the recent window.",
+        "# TYPE chatbot_stage_seconds summary",
+    ]
+    for name, stats in stage_summaries().items():
+        for key, quantile in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+            lines.append(
+                f'chatbot_stage_seconds{{stage="{_label(name)}",quantile="{quantile}"}} {stats[key]:.6f}'
+            )
+        lines.append(f'chatbot_stage_seconds_count{{stage="{_label(name)}"}} {stats["count"]}')
+
+    counters = store.counters()
+    for metric in sorted({name for _, name in counters}):
+        lines.append(f"# TYPE chatbot_{metric} counter")
+        for (app, name), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f'chatbot_{metric}{{app="{_label(app)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, content_type = export_prometheus(), "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/traces":
+            body, content_type = export_jsonl(), "application/x-ndjson; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_attempted = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=TRACE_METRICS_PORT):
+    """/metrics · /traces 를 제공하는 HTTP 서버를 프로세스당 한 번만 띄웁니다 (port가 0이면 띄우지 않음)."""
+    global _server, _server_attempted
+    if not port:
+        return None
+    with _server_lock:
+        if not _server_attempted:
+            _server_attempted = True
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                # 다른 앱 프로세스가 이미 포트를 쓰는 경우
+                logger.warning("metrics server not started on port %s: %s", port, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name="trace-metrics", daemon=True).start()
+        return _server
@@ -5,6 +5,9 @@ from dotenv import load_dotenv
 import time
 import math
 
+import data_access
+import dataset_metadata
+
 # 환경변수 로드
 load_dotenv()
 
@@ -152,19 +155,16 @@ def upload_csv_to_supabase(csv_file, table_name, supabase_client):
     print(f"\n🚀 {csv_file} → {table_name} 고속 업로드 시작")
     print(f"📂 파일 읽는 중...")
     
-    df = None
-    for encoding in ['utf-8-sig', 'cp949', 'euc-kr', 'utf-8']:
-        try:
-            df = pd.read_csv(csv_file, encoding=encoding)
-            break
-        except UnicodeDecodeError:
-            continue
-    
-    if df is None:
-        print(f"❌ {csv_file} 파일을 읽을 수 없습니다.")
+    try:
+        # 매핑 대상 컬럼만 읽음 (Parquet 변환본에서 컬럼 단위로 로드)
+        df = data_access.read_table(csv_file, columns=list(get_column_mapping(table_name)))
+    except Exception as e:
+        print(f"❌ {csv_file} 파일을 읽을 수 없습니다: {e}")
         return False
     
     print(f"✅ 원본 데이터: {len(df):,}행 × {len(df.columns)}열")
+    # 앱이 시작할 때 원본을 다시 훑지 않도록 메타데이터 파일을 남김
+    dataset_metadata.write_metadata(csv_file, dataset_metadata.build_metadata(df, csv_file))
     print(f"🔄 데이터 매핑 중...")
     df = clean_and_map_dataframe(df, table_name)
     print(f"✅ 매핑 완료: {len(df):,}행 × {len(df.columns)}열")
@@ -215,6 +215,8 @@ def upload_csv_to_supabase(csv_file, table_name, supabase_client):
     print(f"✅ {table_name} 업로드 완료!")
     print(f"   📊 성공: {successful_uploads:,}/{total_rows:,}개")
     print(f"   ⏱️ 소요시간: {int(total_elapsed_time // 60)}분 {int(total_elapsed_time % 60)}초")
+    # 챗봇 사이드바가 COUNT 쿼리 대신 쓰는 테이블 행 수
+    dataset_metadata.update_metadata(csv_file, table=table_name, uploaded_rows=successful_uploads)
     return successful_uploads == total_rows
 
 def main():
@@ -226,11 +228,7 @@ def main():
     if not supabase:
         return
     
-    files_to_upload = [
-        ("file/Q1_data.csv", "cafe_data"),
-        ("file/Q2_data.csv", "revisit_data"), 
-        ("file/Q3_data.csv", "restaurant_data")
-    ]
+    files_to_upload = [(csv_file, table_name) for table_name, csv_file in dataset_metadata.TABLE_SOURCES.items()]
     
     success_count = 0
     main_start_time = time.time()
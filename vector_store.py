@@ -0,0 +1,501 @@
+"""메모리 매핑 양자화 벡터 스토어
+
+임베딩을 float16 또는 int8(벡터별 스케일) 배열로 디스크에 저장하고 np.memmap으로
+열어 검색합니다. 문서 본문/메타데이터는 별도 JSONL 파일에 두고 바이트 오프셋 배열로
+필요한 행만 읽습니다. 여러 워커 프로세스가 같은 파일을 열면 OS 페이지 캐시를 공유하므로
+파드당 메모리 사용량이 크게 줄어듭니다.
+
+검색은 블록 단위 행렬곱(코사인 유사도) + 부분 정렬로 top-k를 구하며, 선택적으로
+float32 원본 벡터로 후보를 다시 채점(rescoring)합니다. ensure_ann으로 HNSW/IVF-PQ
+인덱스를 붙이면 전수 검색 대신 ANN 후보 + 인덱스 생성 이후 추가된 행만 전수 검색합니다.
+
+shard_columns로 지정한 메타데이터 컬럼(지역, 업종 등)은 행별 정수 코드 배열로 따로 저장해,
+filter가 주어지면 해당 샤드에 속한 행만 검색합니다.
+"""
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+import ann_index
+
+META_FILE = "meta.json"
+SUPPORTED_DTYPES = ("float16", "int8")
+# 검색 시 한 번에 float32로 변환해 곱하는 행 수
+SEARCH_BLOCK_ROWS = 65536
+# ANN 인덱스 생성 이후 추가된 행이 이 비율을 넘으면 ensure_ann에서 다시 빌드
+ANN_REBUILD_TAIL_RATIO = 0.1
+# 인덱스를 다시 빌드하지 않고 바꿀 수 있는 검색 파라미터
+ANN_SEARCH_PARAMS = {"flat": ("block_rows",), "hnsw": ("ef_search",), "ivfpq": ("nprobe",)}
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, k):
+    """점수 배열에서 상위 k개 위치를 점수 내림차순으로 반환합니다."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class QuantizedVectorStore(VectorStore):
+    """float16/int8 메모리 매핑 벡터 + 오프셋 색인 문서 파일 기반 벡터 스토어
+
+    삭제는 삭제 표시(tombstone)로 처리하고, 같은 ID를 다시 넣으면 이전 위치를 삭제 표시한 뒤
+    끝에 추가합니다. 공간 회수는 전체 재빌드로 합니다.
+    """
+
+    def __init__(self, path, embedding, dtype="float16", keep_full_precision=True, rescore_factor=4,
+                 shard_columns=()):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"지원하지 않는 dtype: {dtype} (가능: {', '.join(SUPPORTED_DTYPES)})")
+        self.path = path
+        self._embedding = embedding
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        meta = self._load_meta()
+        if meta:
+            self.dtype = meta["dtype"]
+            self.dim = meta["dim"]
+            self.count = meta["count"]
+            self.keep_full_precision = meta["keep_full_precision"]
+            self.shard_columns = meta.get("shard_columns", [])
+            shard_values = meta.get("shard_values", {})
+        else:
+            self.dtype = dtype
+            self.dim = None
+            self.count = 0
+            self.keep_full_precision = keep_full_precision
+            self.shard_columns = list(shard_columns)
+            shard_values = {}
+        # 샤드 컬럼별 값 목록과 값 → 코드 매핑
+        self._shard_values = {c: list(shard_values.get(c, [])) for c in self.shard_columns}
+        self._shard_codes = {c: {v: i for i, v in enumerate(values)} for c, values in self._shard_values.items()}
+
+        deleted_path = self._file("deleted.npy")
+        self._deleted = set(np.load(deleted_path).tolist()) if os.path.exists(deleted_path) else set()
+        self._deleted_mask = None
+        self._id_to_pos = None
+        self._maps = None
+        self._ann = None
+        if meta:
+            self._truncate_to_count()
+
+    # ------------------------------------------------------------------ 파일
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_meta(self):
+        try:
+            with open(self._file(META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _row_files(self):
+        """(파일 이름, 행당 바이트 수) 목록"""
+        files = [(f"vectors.{self.dtype}.bin", self.dim * np.dtype(self.dtype).itemsize),
+                 ("offsets.bin", 8)]
+        if self.dtype == "int8":
+            files.append(("scales.bin", 4))
+        if self.keep_full_precision:
+            files.append(("vectors.float32.bin", self.dim * 4))
+        files.extend((self._shard_file(i), 4) for i in range(len(self.shard_columns)))
+        return files
+
+    def _shard_file(self, i):
+        return f"shard-{i}.int32.bin"
+
+    def _truncate_to_count(self):
+        """flush 전에 중단된 쓰기로 파일 끝에 남은 행을 잘라 메타데이터와 맞춥니다."""
+        if not self.dim:
+            return
+        for name, row_bytes in self._row_files():
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > self.count * row_bytes:
+                with open(path, "r+b") as f:
+                    f.truncate(self.count * row_bytes)
+        offsets_path = self._file("offsets.bin")
+        docs_path = self._file("docs.jsonl")
+        if self.count and os.path.exists(docs_path):
+            # 마지막 문서 줄 끝까지만 남김
+            last_offset = int(np.fromfile(offsets_path, dtype=np.int64, count=self.count)[-1])
+            with open(docs_path, "r+b") as f:
+                f.seek(last_offset)
+                f.readline()
+                f.truncate(f.tell())
+        elif os.path.exists(docs_path):
+            open(docs_path, "wb").close()
+        ids_path = self._file("ids.txt")
+        if os.path.exists(ids_path):
+            with open(ids_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            if len(lines) > self.count:
+                with open(ids_path, "w", encoding="utf-8") as f:
+                    f.writelines(lines[:self.count])
+
+    def flush(self):
+        """메타데이터와 삭제 표시를 디스크에 기록합니다 (쓰기 후 반드시 호출)."""
+        with self._lock:
+            np.save(self._file("deleted.npy"), np.asarray(sorted(self._deleted), dtype=np.int64))
+            meta = {
+                "dtype": self.dtype,
+                "dim": self.dim,
+                "count": self.count,
+                "keep_full_precision": self.keep_full_precision,
+                "shard_columns": self.shard_columns,
+                "shard_values": self._shard_values,
+            }
+            tmp_path = self._file(META_FILE + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._file(META_FILE))
+            self._maps = None
+
+    def _mapped(self):
+        """검색용 메모리 매핑 배열들 (쓰기가 있으면 다시 매핑)"""
+        if self._maps is None:
+            if self.count == 0:
+                self._maps = {}
+            else:
+                shape = (self.count, self.dim)
+                maps = {
+                    "vectors": np.memmap(self._file(f"vectors.{self.dtype}.bin"), dtype=self.dtype,
+                                         mode="r", shape=shape),
+                    "offsets": np.memmap(self._file("offsets.bin"), dtype=np.int64, mode="r",
+                                         shape=(self.count,)),
+                }
+                if self.dtype == "int8":
+                    maps["scales"] = np.memmap(self._file("scales.bin"), dtype=np.float32, mode="r",
+                                               shape=(self.count,))
+                if self.keep_full_precision:
+                    maps["full"] = np.memmap(self._file("vectors.float32.bin"), dtype=np.float32,
+                                             mode="r", shape=shape)
+                for i, column in enumerate(self.shard_columns):
+                    maps[f"shard:{column}"] = np.memmap(self._file(self._shard_file(i)), dtype=np.int32,
+                                                        mode="r", shape=(self.count,))
+                self._maps = maps
+        return self._maps
+
+    def _ids(self):
+        """ID → 위치 매핑 (삭제/갱신이 필요할 때만 로드)"""
+        if self._id_to_pos is None:
+            self._id_to_pos = {}
+            ids_path = self._file("ids.txt")
+            if os.path.exists(ids_path):
+                with open(ids_path, "r", encoding="utf-8") as f:
+                    for pos, line in enumerate(f):
+                        self._id_to_pos[line.rstrip("\n")] = pos
+        return self._id_to_pos
+
+    # ------------------------------------------------------------------ 쓰기
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def upsert_embeddings(self, ids, vectors, texts, metadatas=None):
+        """미리 계산한 벡터를 문서와 함께 추가합니다. 이미 있는 ID는 이전 위치를 삭제 표시합니다."""
+        if not ids:
+            return []
+        metadatas = metadatas or [{} for _ in ids]
+        vectors = _normalize(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            id_to_pos = self._ids()
+            stale = [id_to_pos[i] for i in ids if i in id_to_pos]
+
+            if self.dtype == "int8":
+                scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+                quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+                with open(self._file("scales.bin"), "ab") as f:
+                    scales.astype(np.float32).tofile(f)
+            else:
+                quantized = vectors.astype(np.float16)
+            with open(self._file(f"vectors.{self.dtype}.bin"), "ab") as f:
+                quantized.tofile(f)
+            if self.keep_full_precision:
+                with open(self._file("vectors.float32.bin"), "ab") as f:
+                    vectors.tofile(f)
+
+            offsets = []
+            with open(self._file("docs.jsonl"), "ab") as f:
+                for doc_id, text, metadata in zip(ids, texts, metadatas):
+                    offsets.append(f.tell())
+                    line = json.dumps({"id": doc_id, "text": text, "metadata": metadata}, ensure_ascii=False)
+                    f.write(line.encode("utf-8") + b"\n")
+            with open(self._file("offsets.bin"), "ab") as f:
+                np.asarray(offsets, dtype=np.int64).tofile(f)
+            with open(self._file("ids.txt"), "a", encoding="utf-8") as f:
+                f.writelines(f"{doc_id}\n" for doc_id in ids)
+            for i, column in enumerate(self.shard_columns):
+                codes = [self._shard_code(column, metadata.get(column)) for metadata in metadatas]
+                with open(self._file(self._shard_file(i)), "ab") as f:
+                    np.asarray(codes, dtype=np.int32).tofile(f)
+
+            start = self.count
+            self.count += len(ids)
+            if stale:
+                self._deleted.update(stale)
+            for offset, doc_id in enumerate(ids):
+                id_to_pos[doc_id] = start + offset
+            self._maps = None
+            self._deleted_mask = None
+        return list(ids)
+
+    def _shard_code(self, column, value):
+        """샤드 값의 정수 코드 (처음 보는 값이면 새 코드, 결측값은 -1)"""
+        if value is None:
+            return -1
+        codes = self._shard_codes[column]
+        if value not in codes:
+            codes[value] = len(self._shard_values[column])
+            self._shard_values[column].append(value)
+        return codes[value]
+
+    def shard_values(self, column):
+        """샤드 컬럼에 저장된 고유 값 목록"""
+        return list(self._shard_values.get(column, []))
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding.embed_documents(texts)
+        added = self.upsert_embeddings(list(ids), vectors, texts, metadatas)
+        self.flush()
+        return added
+
+    def delete(self, ids=None, **kwargs):
+        """ID 목록을 삭제 표시합니다."""
+        if not ids:
+            return False
+        with self._lock:
+            id_to_pos = self._ids()
+            positions = [id_to_pos.pop(i) for i in ids if i in id_to_pos]
+            if positions:
+                self._deleted.update(positions)
+                self._deleted_mask = None
+        self.flush()
+        return True
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, path=None, **kwargs):
+        store = cls(path, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    # ------------------------------------------------------------------ ANN
+    def iter_vectors(self, block_rows=SEARCH_BLOCK_ROWS):
+        """저장된 벡터를 (시작 위치, float32 블록) 단위로 순회합니다 (삭제 표시 행 포함)."""
+        maps = self._mapped()
+        for start in range(0, self.count, block_rows):
+            end = min(start + block_rows, self.count)
+            if self.keep_full_precision:
+                block = np.asarray(maps["full"][start:end], dtype=np.float32)
+            else:
+                block = np.asarray(maps["vectors"][start:end], dtype=np.float32)
+                if self.dtype == "int8":
+                    block *= maps["scales"][start:end, None]
+            yield start, block
+
+    def ensure_ann(self, name="flat", **params):
+        """ANN 인덱스를 붙입니다. 저장된 인덱스가 빌드 파라미터와 맞고 충분히 최신이면 그대로 엽니다.
+
+        name="flat"이면 ANN 없이 메모리 매핑 벡터를 전수 검색합니다. 인덱스 위치는 스토어 위치와
+        같으며, 삭제 표시 행은 검색 시 걸러냅니다.
+        """
+        with self._lock:
+            if name == "flat" or self.count == 0:
+                self._ann = None
+                return None
+            wanted = dict(ann_index.DEFAULT_PARAMS[name], **params)
+            search_keys = ANN_SEARCH_PARAMS[name]
+            index, info = ann_index.load_index(self.path, name)
+            rebuild = (
+                index is None
+                or {k: v for k, v in info["params"].items() if k not in search_keys}
+                != {k: v for k, v in wanted.items() if k not in search_keys}
+                or index.count > self.count
+                or self.count - index.count > self.count * ANN_REBUILD_TAIL_RATIO
+            )
+            if rebuild:
+                vectors = np.concatenate([block for _, block in self.iter_vectors()])
+                index = ann_index.create_index(name, **wanted).build(vectors)
+                ann_index.save_index(index, self.path)
+            index.params.update({k: wanted[k] for k in search_keys})
+            self._ann = index
+            return index
+
+    def _ann_candidates(self, query, count):
+        """ANN 후보 위치 + 인덱스 생성 이후 추가된 행 중 상위 후보 (삭제 표시 제외)"""
+        # 삭제 표시 행이 결과를 차지할 수 있으므로 그만큼 더 가져옴
+        fetch = count * 2 if self._deleted else count
+        _, found = self._ann.search(query[None, :], fetch)
+        found = found[0]
+        candidates = [found[found >= 0]]
+        if self._ann.count < self.count:
+            tail = np.arange(self._ann.count, self.count, dtype=np.int64)
+            candidates.append(tail[_top_k(self._scores(query, tail), count)])
+        candidates = np.unique(np.concatenate(candidates))
+        return candidates[~self._deleted_rows()[candidates]]
+
+    # ------------------------------------------------------------------ 검색
+    def _read_document(self, pos):
+        offset = int(self._mapped()["offsets"][pos])
+        with open(self._file("docs.jsonl"), "rb") as f:
+            f.seek(offset)
+            record = json.loads(f.readline().decode("utf-8"))
+        metadata = dict(record.get("metadata") or {})
+        return Document(page_content=record["text"], metadata=metadata, id=record["id"])
+
+    def _deleted_rows(self):
+        """삭제 표시 불리언 마스크 (삭제/추가가 있을 때만 다시 만듦)"""
+        if self._deleted_mask is None or len(self._deleted_mask) != self.count:
+            mask = np.zeros(self.count, dtype=bool)
+            if self._deleted:
+                mask[np.fromiter(self._deleted, dtype=np.int64)] = True
+            self._deleted_mask = mask
+        return self._deleted_mask
+
+    def filter_positions(self, filter):
+        """Chroma 형식 메타데이터 필터에 맞는 (삭제되지 않은) 위치 배열을 샤드 코드로 계산합니다.
+
+        {"컬럼": 값}, {"컬럼": {"$in": [...]}}, {"$and": [...]} 형식과 샤드 컬럼만 지원합니다.
+        """
+        conditions = filter["$and"] if "$and" in filter else [filter]
+        mask = ~self._deleted_rows()
+        maps = self._mapped()
+        for condition in conditions:
+            for column, expected in condition.items():
+                if column not in self._shard_codes:
+                    raise ValueError(f"샤드 컬럼이 아닌 필터는 지원하지 않습니다: {column}")
+                if isinstance(expected, dict):
+                    values = expected["$in"] if "$in" in expected else [expected.get("$eq")]
+                else:
+                    values = [expected]
+                codes = [self._shard_codes[column][v] for v in values if v in self._shard_codes[column]]
+                mask &= np.isin(maps[f"shard:{column}"], codes)
+        return np.flatnonzero(mask)
+
+    def _scores(self, query, positions=None):
+        """질의 벡터와의 코사인 유사도 (positions가 있으면 해당 위치만)"""
+        maps = self._mapped()
+        vectors = maps["vectors"]
+        if positions is not None:
+            scores = np.empty(len(positions), dtype=np.float32)
+            for start in range(0, len(positions), SEARCH_BLOCK_ROWS):
+                block = positions[start:start + SEARCH_BLOCK_ROWS]
+                scores[start:start + len(block)] = np.asarray(vectors[block], dtype=np.float32) @ query
+            if self.dtype == "int8":
+                scores *= maps["scales"][positions]
+            return scores
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, self.count)
+            scores[start:end] = np.asarray(vectors[start:end], dtype=np.float32) @ query
+        if self.dtype == "int8":
+            scores *= maps["scales"]
+        return scores
+
+    def search_positions(self, query_vector, k=4, positions=None, rescore=True):
+        """질의 벡터로 (위치, 점수) 상위 k개를 반환합니다. positions로 검색 대상을 제한할 수 있습니다."""
+        if self.count == 0:
+            return []
+        query = _normalize(query_vector)
+        if positions is None and self._ann is not None:
+            return self._search_ann(query, k, rescore)
+        if positions is not None:
+            positions = np.asarray(positions, dtype=np.int64)
+            positions = positions[~self._deleted_rows()[positions]]
+            if len(positions) == 0:
+                return []
+        scores = self._scores(query, positions)
+        if positions is None and self._deleted:
+            scores[self._deleted_rows()] = -np.inf
+
+        use_rescore = rescore and self.keep_full_precision
+        candidate_count = k * self.rescore_factor if use_rescore else k
+        top = _top_k(scores, candidate_count)
+        candidates = top if positions is None else positions[top]
+        candidate_scores = scores[top]
+        # 살아 있는 행이 후보 수보다 적으면 삭제 표시 행(-inf)도 top-k에 들어오므로 다시 채점하기 전에 제외
+        live = np.isfinite(candidate_scores) & ~self._deleted_rows()[candidates]
+        candidates = candidates[live]
+        candidate_scores = candidate_scores[live]
+
+        if use_rescore and len(candidates):
+            # 양자화 오차 보정: 후보만 float32 원본으로 다시 채점
+            order = np.argsort(candidates)
+            sorted_candidates = candidates[order]
+            full = np.asarray(self._mapped()["full"][sorted_candidates], dtype=np.float32)
+            rescored = np.empty(len(candidates), dtype=np.float32)
+            rescored[order] = full @ query
+            candidate_scores = rescored
+            best = np.argsort(-candidate_scores)[:k]
+            candidates = candidates[best]
+            candidate_scores = candidate_scores[best]
+        results = [(int(p), float(s)) for p, s in zip(candidates[:k], candidate_scores[:k]) if np.isfinite(s)]
+        return results
+
+    def _search_ann(self, query, k, rescore):
+        use_rescore = rescore and self.keep_full_precision
+        candidates = self._ann_candidates(query, k * self.rescore_factor if use_rescore else k)
+        if len(candidates) == 0:
+            return []
+        # ANN 점수는 근사값(PQ 등)이므로 후보를 스토어 벡터로 다시 채점
+        if use_rescore:
+            scores = np.asarray(self._mapped()["full"][candidates], dtype=np.float32) @ query
+        else:
+            scores = self._scores(query, candidates)
+        best = _top_k(scores, k)
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None, **kwargs):
+        """filter(샤드 컬럼 조건)가 있으면 해당 샤드의 행만 검색합니다."""
+        with self._lock:
+            positions = None
+            if filter and self.count:
+                positions = self.filter_positions(filter)
+                if len(positions) == 0:
+                    return []
+            hits = self.search_positions(embedding, k, positions)
+            return [(self._read_document(pos), score) for pos, score in hits]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # 코사인 유사도 [-1, 1] → 관련도 [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def stats(self):
+        """저장된 벡터 수, 삭제 표시 수, 디스크 사용량(바이트)"""
+        size = sum(
+            os.path.getsize(self._file(name)) for name in os.listdir(self.path)
+            if os.path.isfile(self._file(name))
+        )
+        return {
+            "count": self.count,
+            "deleted": len(self._deleted),
+            "bytes": size,
+            "ann": self._ann.name if self._ann is not None else "flat",
+        }
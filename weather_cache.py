@@ -0,0 +1,211 @@
+"""도시별 날씨 캐시 (TTL + stale-while-revalidate + 요청 합치기) 와 날씨 제공자
+
+지역명은 CITY_MAPPING으로 12개 남짓한 도시로 모이므로 캐시 키는 매핑된 도시입니다.
+- WEATHER_TTL_SECONDS 안의 값은 그대로 쓰고,
+- 그보다 오래됐지만 WEATHER_STALE_SECONDS 안이면 이전 값을 바로 돌려주며 백그라운드에서 갱신하고,
+- 값이 없으면 백그라운드 조회를 시작한 뒤 로컬 대체 데이터(마지막으로 받은 관측값 파일)를 돌려줍니다.
+같은 도시를 여러 세션이 동시에 물어도 외부 API 요청은 하나만 나갑니다.
+외부 API가 느리거나 죽어 있어도 질문 처리가 날씨 조회를 기다리지 않습니다.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+WEATHER_TTL_SECONDS = int(os.getenv("WEATHER_TTL_SECONDS", "600"))
+WEATHER_STALE_SECONDS = int(os.getenv("WEATHER_STALE_SECONDS", str(3 * 3600)))
+# 캐시에 값이 없을 때 백그라운드 조회를 기다리는 최대 시간 (0이면 기다리지 않음)
+WEATHER_WAIT_SECONDS = float(os.getenv("WEATHER_WAIT_SECONDS", "0"))
+# 로컬 대체 데이터 파일 (도시 → OpenWeatherMap 응답 형식)
+WEATHER_STANDIN_PATH = os.getenv("WEATHER_STANDIN_PATH", os.path.join("file", "weather_standin.json"))
+
+# 지역명 첫 단어 → OpenWeatherMap 도시 이름
+CITY_MAPPING = {
+    "서울": "Seoul", "부산": "Busan", "인천": "Incheon",
+    "대구": "Daegu", "대전": "Daejeon", "광주": "Gwangju",
+    "울산": "Ulsan", "세종": "Sejong", "수원": "Suwon",
+    "성남": "Seongnam", "고양": "Goyang", "용인": "Yongin",
+}
+DEFAULT_CITY = "Seoul"
+
+
+def map_city(region):
+    """지역명("서울 성동구" 등)을 캐시 키가 되는 영문 도시 이름으로 바꿉니다."""
+    city_key = region.split()[0] if ' ' in region else region
+    return CITY_MAPPING.get(city_key, DEFAULT_CITY)
+
+
+class WeatherProvider:
+    """날씨 제공자 인터페이스: fetch(도시)는 OpenWeatherMap 응답 형식 dict 또는 None을 반환"""
+
+    name = "base"
+
+    def fetch(self, city):
+        raise NotImplementedError
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    """OpenWeatherMap 현재 날씨 API"""
+
+    name = "openweathermap"
+    base_url = "http://api.openweathermap.org/data/2.5/weather"
+
+    def __init__(self, api_key, timeout=10):
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def fetch(self, city):
+        params = {
+            "q": f"{city},KR",
+            "appid": self.api_key,
+            "units": "metric",
+            "lang": "kr"
+        }
+        response = requests.get(self.base_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class LocalFileWeatherProvider(WeatherProvider):
+    """로컬 JSON 파일의 도시별 관측값 (외부 API 대신 쓰거나, 캐시가 빌 때의 대체 데이터)"""
+
+    name = "local"
+
+    def __init__(self, path=WEATHER_STANDIN_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def fetch(self, city):
+        with self._lock:
+            return self._load().get(city)
+
+    def save(self, city, data):
+        """최근 관측값을 기록해 다음 시작 때도 대체 데이터로 쓰게 합니다."""
+        with self._lock:
+            records = self._load()
+            records[city] = data
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+class WeatherCache:
+    """도시별 날씨 캐시. get()은 외부 API를 기다리지 않습니다(WEATHER_WAIT_SECONDS 제외)."""
+
+    def __init__(self, provider, standin=None, ttl_seconds=WEATHER_TTL_SECONDS,
+                 stale_seconds=WEATHER_STALE_SECONDS):
+        self.provider = provider
+        self.standin = standin
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="weather")
+        self.fetches = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.standin_hits = 0
+
+    def _refresh(self, city):
+        """조회를 시작하거나 이미 진행 중인 조회를 반환합니다 (도시당 요청 하나)."""
+        with self._lock:
+            future = self._inflight.get(city)
+            if future is None:
+                future = self._executor.submit(self._fetch, city)
+                self._inflight[city] = future
+            return future
+
+    def _fetch(self, city):
+        try:
+            data = self.provider.fetch(city)
+            if data:
+                with self._lock:
+                    self._entries[city] = {"data": data, "fetched_at": time.time()}
+                    self.fetches += 1
+                if self.standin is not None and self.standin is not self.provider:
+                    self.standin.save(city, data)
+            return data
+        except Exception as e:
+            logger.warning("weather fetch failed for %s (%s): %s", city, self.provider.name, e)
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(city, None)
+
+    def get(self, region, wait_seconds=WEATHER_WAIT_SECONDS):
+        """(날씨 dict 또는 None, 상태)를 반환합니다. 상태: fresh / stale / standin / missing"""
+        city = map_city(region)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(city)
+        if entry is not None:
+            age = now - entry["fetched_at"]
+            if age <= self.ttl_seconds:
+                with self._lock:
+                    self.hits += 1
+                return entry["data"], "fresh"
+            if age <= self.stale_seconds:
+                # 오래된 값을 바로 쓰고 갱신은 백그라운드에서
+                self._refresh(city)
+                with self._lock:
+                    self.stale_hits += 1
+                return entry["data"], "stale"
+
+        future = self._refresh(city)
+        if wait_seconds > 0:
+            done, _ = wait([future], timeout=wait_seconds)
+            if done and future.result():
+                return future.result(), "fresh"
+        data = self.standin.fetch(city) if self.standin is not None else None
+        if data:
+            with self._lock:
+                self.standin_hits += 1
+            return data, "standin"
+        return None, "missing"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cities": len(self._entries),
+                "fetches": self.fetches,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "standin_hits": self.standin_hits,
+                "inflight": len(self._inflight),
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_weather_cache(api_key=None):
+    """프로세스 공용 날씨 캐시 (API 키가 없거나 WEATHER_PROVIDER=local이면 로컬 파일만 사용)"""
+    use_local = os.getenv("WEATHER_PROVIDER", "").lower() == "local" or not api_key
+    key = None if use_local else api_key
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            standin = LocalFileWeatherProvider()
+            provider = standin if use_local else OpenWeatherMapProvider(api_key)
+            cache = WeatherCache(provider, standin)
+            _caches[key] = cache
+        return cache